@@ -1,5 +1,6 @@
 import argparse
 import logging
+import os
 import pathlib
 import sys
 
@@ -12,6 +13,7 @@ from .features.activity_photos.cli import (
 from .features.explorer_video.cli import (
     register_main_explorer_video,
 )
+from .features.heatmap.cli import register_main_heatmap_prewarm
 from .features.heatmap_video.cli import register_main_heatmap_video
 from .features.strava.checkout_importer import convert_strava_checkout
 from .webui.app import create_app, web_ui_main
@@ -122,6 +124,7 @@ def main() -> None:
     register_main_inspect_photo(subparsers)
     register_main_annotate_photos(subparsers)
     register_main_heatmap_video(subparsers)
+    register_main_heatmap_prewarm(subparsers)
     register_main_explorer_video(subparsers)
 
     subparser = subparsers.add_parser(
@@ -150,6 +153,8 @@ def main() -> None:
             http_server=options.http_server,
             threads=options.threads,
             workers=options.workers,
+            prewarm_heatmap=options.prewarm_heatmap,
+            jobs=options.jobs,
         )
     )
     subparser.add_argument(
@@ -186,6 +191,18 @@ def main() -> None:
         help="Number of worker processes (Gunicorn only, default: %(default)s)",
     )
     subparser.add_argument("--skip-reload", action=argparse.BooleanOptionalAction)
+    subparser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel processes for importing activity files (default: %(default)s)",
+    )
+    subparser.add_argument(
+        "--prewarm-heatmap",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Render the heatmap tiles of new activities in the background after the import",
+    )
     subparser.add_argument(
         "--strava-begin", help="Start date to limit Strava sync, format YYYY-MM-DD"
     )
@@ -4,6 +4,7 @@ from alembic import context
 from sqlalchemy import engine_from_config, pool
 
 # Import feature models such that Alembic has seen all the table definitions.
+import geo_activity_playground.core.file_fingerprints  # noqa: F401
 import geo_activity_playground.core.import_exclusion  # noqa: F401
 import geo_activity_playground.features.activity_photos.model  # noqa: F401
 import geo_activity_playground.features.explorer.model  # noqa: F401
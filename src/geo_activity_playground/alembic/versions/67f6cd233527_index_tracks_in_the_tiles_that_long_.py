@@ -0,0 +1,21 @@
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "67f6cd233527"
+down_revision: str | None = "288b236af10f"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Lines between points more than one tile apart were missing in the tiles
+    # that they cross. The next scan indexes all tracks again, and the heatmap
+    # tiles that were painted from the old index are painted again.
+    op.execute("DELETE FROM activity_track_chunks")
+    op.execute("UPDATE heatmap_tile_cache SET is_dirty = 1")
+
+
+def downgrade() -> None:
+    pass
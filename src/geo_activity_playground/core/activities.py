@@ -1,8 +1,10 @@
 import datetime
 import logging
+import threading
 from collections.abc import Callable, Sequence
 from typing import Any
 
+import flask
 import geojson
 import matplotlib
 import numpy as np
@@ -12,6 +14,7 @@ import sqlalchemy
 from geo_activity_playground.core.datamodel import (
     DB,
     Activity,
+    ActivityChange,
     Kind,
     query_activity_meta,
 )
@@ -22,8 +25,126 @@ logger = logging.getLogger(__name__)
 MARKER_PROGRESS_STOPS: tuple[float, ...] = (0.0, 0.25, 0.5, 0.75, 1.0)
 EIGHTH_MARKER_PROGRESS_STOPS: tuple[float, ...] = (0.125, 0.375, 0.625, 0.875)
 
+# With more changed activities, the whole metadata is loaded again.
+_MAX_INCREMENTAL_CHANGES = 500
+
+
+class ActivityMetaCache:
+    """The result of `query_activity_meta`, kept up to date with the database.
+
+    The frame is tagged with the largest id in `ActivityChange`. When the
+    activities have changed since, only the changed rows are queried again,
+    unless there are too many or some change can affect all activities. Request
+    threads share the cache. Every caller gets a shallow copy of the frame, with
+    copy-on-write pandas only copies the columns that a caller changes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._engine: sqlalchemy.Engine | None = None
+        self._version: int | None = None
+        self._frame = pd.DataFrame()
+
+    def get(self) -> pd.DataFrame:
+        with self._lock:
+            first, last = _activity_change_range()
+            version = last or 0
+            if (
+                self._engine is not DB.engine
+                or self._version is None
+                or version < self._version
+                or (first is not None and first > self._version + 1)
+            ):
+                self._reload(version)
+            elif version > self._version:
+                self._update(version)
+            return self._frame.copy(deep=False)
+
+    def _reload(self, version: int) -> None:
+        self._frame = query_activity_meta()
+        self._engine = DB.engine
+        self._version = version
+
+    def _update(self, version: int) -> None:
+        changed = set(
+            DB.session.scalars(
+                sqlalchemy.select(ActivityChange.activity_id)
+                .where(
+                    ActivityChange.id > self._version,
+                    ActivityChange.id <= version,
+                )
+                .distinct()
+            ).all()
+        )
+        if (
+            None in changed
+            or len(changed) > _MAX_INCREMENTAL_CHANGES
+            or len(self._frame) == 0
+        ):
+            self._reload(version)
+            return
+
+        updated = query_activity_meta([Activity.id.in_(changed)])
+        frame = self._frame.drop(index=list(changed), errors="ignore")
+        if len(updated):
+            mismatched = [
+                column
+                for column in updated.columns
+                if updated[column].dtype != frame[column].dtype
+            ]
+            frame = pd.concat([frame, updated]).sort_values(
+                "start", kind="stable", na_position="first"
+            )
+            # Columns without any value in one part end up as objects.
+            for column in mismatched:
+                frame[column] = frame[column].infer_objects()
+        if len(frame) == 0:
+            frame = pd.DataFrame()
+        logger.debug(f"Updated metadata of {len(changed)} activities.")
+        self._frame = frame
+        self._version = version
+
+
+def _activity_change_range() -> tuple[int | None, int | None]:
+    """Smallest and largest id in `ActivityChange`, queried once per request."""
+    if flask.has_request_context() and "activity_change_range" in flask.g:
+        return flask.g.activity_change_range
+    first, last = DB.session.execute(
+        sqlalchemy.select(
+            sqlalchemy.func.min(ActivityChange.id),
+            sqlalchemy.func.max(ActivityChange.id),
+        )
+    ).one()
+    if flask.has_request_context():
+        flask.g.activity_change_range = (first, last)
+    return first, last
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, "after_commit")
+def _forget_activity_change_range(session: sqlalchemy.orm.Session) -> None:
+    # A request sees the changes that it has committed itself.
+    if flask.has_request_context():
+        flask.g.pop("activity_change_range", None)
+
+
+def prune_activity_changes(keep: int = 1000) -> int:
+    """Delete all but the latest changes, caches further behind load everything."""
+    latest = DB.session.scalar(
+        sqlalchemy.select(sqlalchemy.func.max(ActivityChange.id))
+    )
+    if latest is None:
+        return 0
+    result = DB.session.execute(
+        sqlalchemy.delete(ActivityChange).where(ActivityChange.id <= latest - keep)
+    )
+    DB.session.commit()
+    return int(getattr(result, "rowcount", 0) or 0)
+
 
 class ActivityRepository:
+    def __init__(self) -> None:
+        self._meta_cache = ActivityMetaCache()
+
     def __len__(self) -> int:
         return DB.session.scalars(
             sqlalchemy.select(sqlalchemy.func.count()).select_from(Activity)
@@ -73,9 +194,7 @@ class ActivityRepository:
 
     @property
     def meta(self) -> pd.DataFrame:
-        df = query_activity_meta()
-
-        return df
+        return self._meta_cache.get()
 
 
 def make_geojson_progress_markers_from_time_series(
@@ -312,24 +312,14 @@ def query_activity_meta(clauses: list | None = None) -> pd.DataFrame:
         # df["start"] = pd.Series(start)
         df["elapsed_time"] = pd.to_timedelta(df["elapsed_time"])
 
-        start_local = []
-        for start, iana_timezone in zip(df["start"], df["iana_timezone"]):
-            tz = "UTC" if pd.isna(iana_timezone) else iana_timezone
-            if pd.isna(start):
-                start_local.append(start)
-            else:
-                start_local.append(
-                    start.tz_localize(zoneinfo.ZoneInfo("UTC"))
-                    .tz_convert(zoneinfo.ZoneInfo(tz))
-                    .tz_localize(None)
-                )
-        df["start_local"] = start_local
+        df["start_local"] = _utc_to_local(df["start"], df["iana_timezone"])
 
         # Work around bytes stored in DB.
-        df["calories"] = [
-            sum(a * 256**b for b, a in enumerate(c)) if isinstance(c, bytes) else c
-            for c in df["calories"]
-        ]
+        if df["calories"].dtype == object:
+            df["calories"] = [
+                int.from_bytes(c, "little") if isinstance(c, bytes) else c
+                for c in df["calories"]
+            ]
 
         for old, new in [
             ("elapsed_time", "average_speed_elapsed_kmh"),
@@ -341,25 +331,46 @@ def query_activity_meta(clauses: list | None = None) -> pd.DataFrame:
                 df.loc[mask, old].dt.total_seconds() / 3_600
             )
 
+        iso_calendar = df["start_local"].dt.isocalendar()
         df["date"] = df["start_local"].dt.date
         df["year"] = df["start_local"].dt.year
         df["month"] = df["start_local"].dt.month
         df["day"] = df["start_local"].dt.day
-        df["week"] = df["start_local"].dt.isocalendar().week
+        df["week"] = iso_calendar.week
         df["day_of_week"] = df["start_local"].dt.day_of_week
-        df["iso_year"] = df["start_local"].dt.isocalendar().year
-        df["iso_day"] = df["start_local"].dt.isocalendar().day
+        df["iso_year"] = iso_calendar.year
+        df["iso_day"] = iso_calendar.day
         df["hours"] = df["elapsed_time"].dt.total_seconds() / 3_600
         df["hours_moving"] = df["moving_time"].dt.total_seconds() / 3_600
-        df["iso_year_week"] = [
-            f"{year:04d}-{week:02d}" for year, week in zip(df["iso_year"], df["week"])
-        ]
+        # There are far fewer weeks than activities, so each is formatted once.
+        year_week = iso_calendar.year.astype("Int64") * 100 + iso_calendar.week
+        df["iso_year_week"] = year_week.map(
+            {
+                key: f"{key // 100:04d}-{key % 100:02d}"
+                for key in year_week.dropna().unique()
+            }
+        ).fillna("<NA>-<NA>")
 
         df.index = df["id"]
 
     return df
 
 
+def _utc_to_local(start: pd.Series, iana_timezone: pd.Series) -> pd.Series:
+    """Convert naive UTC times into naive local times, one time zone at a time."""
+    start_local = start.copy()
+    utc = start.dt.tz_localize(zoneinfo.ZoneInfo("UTC"))
+    timezones = iana_timezone.fillna("UTC")
+    for tz, positions in timezones.groupby(timezones).indices.items():
+        start_local.iloc[positions] = (
+            utc.iloc[positions]
+            .dt.tz_convert(zoneinfo.ZoneInfo(str(tz)))
+            .dt.tz_localize(None)
+            .to_numpy()
+        )
+    return start_local
+
+
 class Equipment(DB.Model):
     __tablename__ = "equipments"
 
@@ -532,6 +543,50 @@ class ActivityTile(DB.Model):
     )
 
 
+class ActivityChange(DB.Model):
+    """Log of changes to the activities, used as change counter by caches.
+
+    Every insert, update or delete of an activity adds a row with its id. A row
+    without an activity stands for changes that can affect any activity, like a
+    renamed kind or a bulk delete. The ids are never reused, so the largest one
+    is the version of the activities.
+    """
+
+    __tablename__ = "activity_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    activity_id: Mapped[int | None] = mapped_column(sa.Integer, nullable=True)
+
+
+@sa.event.listens_for(sa.orm.Session, "after_flush")
+def _log_activity_changes(session: sa.orm.Session, flush_context) -> None:
+    rows = []
+    for obj in [*session.new, *session.dirty, *session.deleted]:
+        is_modified = obj in session.new or obj in session.deleted
+        if not is_modified:
+            is_modified = session.is_modified(obj, include_collections=False)
+        if not is_modified:
+            continue
+        if isinstance(obj, Activity):
+            rows.append({"activity_id": obj.id})
+        elif isinstance(obj, (Equipment, Kind)) and obj not in session.new:
+            rows.append({"activity_id": None})
+    if rows:
+        session.connection().execute(sa.insert(ActivityChange.__table__), rows)
+
+
+@sa.event.listens_for(sa.orm.Session, "do_orm_execute")
+def _log_bulk_activity_changes(orm_execute_state: sa.orm.ORMExecuteState) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Activity, Equipment, Kind):
+        orm_execute_state.session.connection().execute(
+            sa.insert(ActivityChange.__table__), [{"activity_id": None}]
+        )
+
+
 class StoredSearchQuery(DB.Model):
     __tablename__ = "stored_search_queries"
 
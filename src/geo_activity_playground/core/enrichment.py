@@ -392,3 +392,21 @@ def update_and_commit(
         activity.replace_time_series(time_series)
     DB.session.add(activity)
     DB.session.commit()
+
+    if changed:
+        update_heatmap_for_time_series(activity)
+
+
+def update_heatmap_for_time_series(activity: Activity) -> None:
+    """Bring the track index and the heatmap cache up to date with the track."""
+    from ..features.heatmap.invalidation import (
+        add_activity_to_heatmap_cache,
+        remove_activity_from_heatmap_cache,
+    )
+    from ..features.heatmap.track_index import index_activity_track
+
+    # The old track has to be taken out of the cached heatmap tiles while it is
+    # still in the index.
+    remove_activity_from_heatmap_cache(activity.id)
+    index_activity_track(activity)
+    add_activity_to_heatmap_cache(activity.id)
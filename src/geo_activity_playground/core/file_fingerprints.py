@@ -0,0 +1,113 @@
+import concurrent.futures
+import hashlib
+import itertools
+import os
+import pathlib
+from collections.abc import Iterable
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .datamodel import DB
+
+
+class FileFingerprint(DB.Model):
+    """The content hash of a file as of its last seen size, mtime and inode.
+
+    As long as these stay the same, the file is assumed to be unchanged and is
+    not read again to compute the hash.
+    """
+
+    __tablename__ = "file_fingerprints"
+
+    path: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    size: Mapped[int] = mapped_column(sa.BigInteger, nullable=False)
+    mtime_ns: Mapped[int] = mapped_column(sa.BigInteger, nullable=False)
+    inode: Mapped[int] = mapped_column(sa.BigInteger, nullable=False)
+    sha256: Mapped[str] = mapped_column(sa.String, nullable=False)
+
+
+def file_hashes(
+    paths: Iterable[pathlib.Path], workers: int = 4
+) -> dict[pathlib.Path, str]:
+    """SHA-256 of the existing files, only reading the ones that have changed.
+
+    The hashes are computed in threads, hashing and reading don't hold the GIL.
+    """
+    stats = {}
+    for path in paths:
+        try:
+            stats[path] = _stat_key(path.stat())
+        except FileNotFoundError:
+            pass
+
+    fingerprints = {
+        fingerprint.path: fingerprint
+        for fingerprint in DB.session.scalars(sa.select(FileFingerprint))
+    }
+    hashes = {}
+    changed = []
+    for path, stat in stats.items():
+        fingerprint = fingerprints.get(str(path))
+        if fingerprint is not None and stat == (
+            fingerprint.size,
+            fingerprint.mtime_ns,
+            fingerprint.inode,
+        ):
+            hashes[path] = fingerprint.sha256
+        else:
+            changed.append(path)
+
+    if not changed:
+        return hashes
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, sha256 in zip(
+            changed, executor.map(file_sha256, changed), strict=True
+        ):
+            hashes[path] = sha256
+            size, mtime_ns, inode = stats[path]
+            fingerprint = fingerprints.get(str(path))
+            if fingerprint is None:
+                fingerprint = FileFingerprint(path=str(path))
+                DB.session.add(fingerprint)
+            fingerprint.size = size
+            fingerprint.mtime_ns = mtime_ns
+            fingerprint.inode = inode
+            fingerprint.sha256 = sha256
+    DB.session.commit()
+    return hashes
+
+
+def forget_other_files(paths: Iterable[pathlib.Path]) -> None:
+    """Drop the fingerprints of all files except the given ones."""
+    keep = {str(path) for path in paths}
+    stale = [
+        path
+        for path in DB.session.scalars(sa.select(FileFingerprint.path))
+        if path not in keep
+    ]
+    # SQLite limits the number of parameters of a statement.
+    for chunk in itertools.batched(stale, 500):
+        DB.session.execute(
+            sa.delete(FileFingerprint).where(FileFingerprint.path.in_(chunk))
+        )
+    DB.session.commit()
+
+
+def _stat_key(stat: os.stat_result) -> tuple[int, int, int]:
+    # Some file systems have inode numbers that don't fit into a signed 64-bit
+    # column, only equality matters.
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino & (2**63 - 1)
+
+
+def file_sha256(filename: pathlib.Path) -> str:
+    """
+    Based on https://stackoverflow.com/a/44873382/653152.
+    """
+    h = hashlib.sha256(usedforsecurity=False)
+    b = bytearray(1024 * 1024)
+    mv = memoryview(b)
+    with open(filename, "rb", buffering=0) as f:
+        while n := f.readinto(mv):
+            h.update(mv[:n])
+    return h.hexdigest()
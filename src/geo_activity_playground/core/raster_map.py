@@ -1,16 +1,13 @@
 import abc
 import dataclasses
-import functools
 import logging
 import pathlib
-import time
-import urllib.parse
 
 import numpy as np
-import requests
 from PIL import Image
 
 from .datamodel import MapConfig
+from .tile_fetcher import tile_fetcher
 from .tiles import compute_tile_float
 
 logger = logging.getLogger(__name__)
@@ -129,17 +126,8 @@ def get_sensible_zoom_level(
     return TileBounds(zoom, x_tile_min, y_tile_min, x_tile_max, y_tile_max)
 
 
-@functools.lru_cache
 def get_tile(zoom: int, x: int, y: int, url_template: str) -> Image.Image:
-    destination = osm_tile_path(x, y, zoom, url_template)
-    if not destination.exists():
-        logger.debug(f"Downloading OSM tile {x=}, {y=}, {zoom=} …")
-        url = url_template.format(x=x, y=y, zoom=zoom)
-        download_file(url, destination)
-    with Image.open(destination) as image:
-        image.load()
-        image = image.convert("RGB")
-    return image
+    return tile_fetcher.get_tile(zoom, x, y, url_template)
 
 
 def tile_bounds_around_center(
@@ -205,15 +193,22 @@ def map_image_from_tile_bounds(
     num_tile_x = int(np.ceil(tile_bounds.width)) + 1
     num_tile_y = int(np.ceil(tile_bounds.height)) + 1
 
-    for x in range(int(tile_anchor[0]), int(tile_anchor[0] + num_tile_x)):
-        for y in range(int(tile_anchor[1]), int(tile_anchor[1]) + num_tile_y):
-            tile = np.array(get_tile(tile_bounds.zoom, x, y, config.map_tile_url)) / 255
-            _paste_array(
-                background,
-                tile,
-                (y - int(tile_anchor[1])) * OSM_TILE_SIZE + int(pixel_anchor[1]),
-                (x - int(tile_anchor[0])) * OSM_TILE_SIZE + int(pixel_anchor[0]),
-            )
+    tiles = tile_fetcher.get_tiles(
+        tile_bounds.zoom,
+        (
+            (x, y)
+            for x in range(int(tile_anchor[0]), int(tile_anchor[0] + num_tile_x))
+            for y in range(int(tile_anchor[1]), int(tile_anchor[1]) + num_tile_y)
+        ),
+        config.map_tile_url,
+    )
+    for (x, y), image in tiles.items():
+        _paste_array(
+            background,
+            np.array(image) / 255,
+            (y - int(tile_anchor[1])) * OSM_TILE_SIZE + int(pixel_anchor[1]),
+            (x - int(tile_anchor[0])) * OSM_TILE_SIZE + int(pixel_anchor[0]),
+        )
 
     return background
 
@@ -225,25 +220,7 @@ def convert_to_grayscale(image: np.ndarray) -> np.ndarray:
 
 
 def osm_tile_path(x: int, y: int, zoom: int, url_template: str) -> pathlib.Path:
-    base_dir = pathlib.Path("Open Street Map Tiles")
-    dir_for_source = base_dir / urllib.parse.quote_plus(url_template)
-    path = dir_for_source / f"{zoom}/{x}/{y}.png"
-    path.parent.mkdir(parents=True, exist_ok=True)
-    return path
-
-
-def download_file(url: str, destination: pathlib.Path):
-    if not destination.parent.exists():
-        destination.parent.mkdir(exist_ok=True, parents=True)
-    r = requests.get(
-        url,
-        allow_redirects=True,
-        headers={"User-Agent": "Martin's Geo Activity Playground"},
-    )
-    assert r.ok
-    with open(destination, "wb") as f:
-        f.write(r.content)
-    time.sleep(0.1)
+    return tile_fetcher.tile_path(zoom, x, y, url_template)
 
 
 class TileGetter:
@@ -258,23 +235,56 @@ class TileGetter:
     ):
         return get_tile(z, x, y, self._map_tile_url)
 
+    def transformed_tile_path(
+        self, scheme: str, z: int, x: int, y: int
+    ) -> pathlib.Path:
+        """Where the tile is kept after the transform of the scheme was applied."""
+        return tile_fetcher.tile_path(z, x, y, self._map_tile_url, scheme)
+
+
+# Luminance weights of the color channels, in units of 1/10000.
+_LUMINANCE_WEIGHTS = np.array([2126, 7152, 722], dtype=np.int64)
+_LUMINANCE_SCALE = 10_000
+
+
+def _scaled_luminance(tile: np.ndarray) -> np.ndarray:
+    """Luminance of an RGB byte tile, times `_LUMINANCE_SCALE`."""
+    return tile[:, :, :3] @ _LUMINANCE_WEIGHTS
+
+
+def _gray_tile(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint8)
+    return np.dstack((values, values, values))
+
 
 class ImageTransform:
     @abc.abstractmethod
     def transform_image(self, image: np.ndarray) -> np.ndarray:
         pass
 
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        """Like `transform_image`, but on an RGB byte tile."""
+        from .tile_encoding import quantize_image
+
+        return quantize_image(self.transform_image(tile / 255))
+
 
 class IdentityImageTransform(ImageTransform):
     def transform_image(self, image: np.ndarray) -> np.ndarray:
         return image
 
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        return tile
+
 
 class GrayscaleImageTransform(ImageTransform):
     def transform_image(self, image: np.ndarray) -> np.ndarray:
         image = np.sum(image * [0.2126, 0.7152, 0.0722], axis=2)  # to grayscale
         return np.dstack((image, image, image))  # to rgb
 
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        return _gray_tile(_scaled_luminance(tile) // _LUMINANCE_SCALE)
+
 
 class PastelImageTransform(ImageTransform):
     def __init__(self, factor: float = 0.7):
@@ -285,15 +295,30 @@ class PastelImageTransform(ImageTransform):
         grayscale_tile = np.dstack((averaged_tile, averaged_tile, averaged_tile))
         return self._factor * grayscale_tile + (1 - self._factor) * image
 
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        factor = round(self._factor * 1000)
+        luminance = _scaled_luminance(tile)[:, :, None]
+        mixed = factor * luminance + (1000 - factor) * _LUMINANCE_SCALE * tile[
+            :, :, :3
+        ].astype(np.int64)
+        return (mixed // (1000 * _LUMINANCE_SCALE)).astype(np.uint8)
+
 
 class InverseGrayscaleImageTransform(ImageTransform):
     def transform_image(self, image: np.ndarray) -> np.ndarray:
         image = np.sum(image * [0.2126, 0.7152, 0.0722], axis=2)  # to grayscale
         return 1 - np.dstack((image, image, image))  # to rgb
 
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        # Rounding up the luminance rounds down its inverse.
+        return _gray_tile(255 + _scaled_luminance(tile) // -_LUMINANCE_SCALE)
+
 
 class BlankImageTransform(ImageTransform):
     def transform_image(self, image: np.ndarray) -> np.ndarray:
         image = np.copy(image)
         image[:, :, :] = 0.80
         return image
+
+    def transform_tile(self, tile: np.ndarray) -> np.ndarray:
+        return np.full_like(tile, int(0.80 * 255))
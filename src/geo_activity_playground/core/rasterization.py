@@ -0,0 +1,217 @@
+"""Rasterization of many thick polylines into a single count buffer.
+
+Drawing each track with PIL needs an image per track, which then has to be
+converted and added to the counts. Here all line segments of a batch of tracks
+are expanded into pixels with NumPy at once instead.
+
+A line of width ``w`` is drawn like PIL does it: along the major axis of every
+segment there is one pixel column (or row), which covers the ``w`` pixels of
+the line cross section. Segment ends are cut off perpendicular to the major
+axis instead of the line direction, which only makes a difference of a pixel at
+the corners.
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+
+# Upper bound of points that are rasterized in one go, keeps memory in check.
+_MAX_BATCH_POINTS = 200_000
+
+
+def line_width_for_zoom(zoom: int) -> int:
+    """Line width in pixels that the heatmap uses at a zoom level."""
+    return max(3, 6 * (zoom - 17))
+
+
+def count_polylines(
+    groups: Iterable[Iterable[np.ndarray]],
+    shape: tuple[int, int],
+    width: float,
+    counts: np.ndarray | None = None,
+) -> np.ndarray:
+    """Count for every pixel how many groups of polylines cover it.
+
+    Each group is a collection of polylines, given as arrays of shape ``(n, 2)``
+    with ``x`` (column) and ``y`` (row) in pixels. A group counts at most once
+    per pixel, no matter how many of its polylines cover it. Think of a group
+    as a segment of a track, which may be split into several runs.
+
+    The counts are added to ``counts`` if given, otherwise a new int32 buffer of
+    the given ``shape`` (rows, columns) is returned.
+    """
+    if counts is None:
+        counts = np.zeros(shape, dtype=np.int32)
+
+    points: list[np.ndarray] = []
+    line_ids: list[np.ndarray] = []
+    line_groups: list[int] = []
+    num_points = 0
+    for group_id, polylines in enumerate(groups):
+        for xy in polylines:
+            if len(xy) == 0:
+                continue
+            points.append(np.asarray(xy, dtype=np.float64))
+            line_ids.append(np.full(len(xy), len(line_groups), dtype=np.int64))
+            line_groups.append(group_id)
+            num_points += len(xy)
+        if num_points >= _MAX_BATCH_POINTS:
+            _count_batch(points, line_ids, line_groups, width, counts)
+            points, line_ids, line_groups = [], [], []
+            num_points = 0
+    if points:
+        _count_batch(points, line_ids, line_groups, width, counts)
+    return counts
+
+
+def _count_batch(
+    points: list[np.ndarray],
+    line_ids: list[np.ndarray],
+    line_groups: list[int],
+    width: float,
+    counts: np.ndarray,
+) -> None:
+    xy = np.concatenate(points)
+    line = np.concatenate(line_ids)
+    # Combining the two columns is faster than `np.isfinite(xy).all(axis=1)`.
+    finite = np.isfinite(xy[:, 0]) & np.isfinite(xy[:, 1])
+    if not finite.all():
+        xy = xy[finite]
+        line = line[finite]
+    if len(xy) == 0:
+        return
+    pixel = np.floor(xy).astype(np.int64)
+
+    # Consecutive points on the same pixel don't add anything to the line.
+    keep = np.ones(len(pixel), dtype=bool)
+    keep[1:] = (
+        (line[1:] != line[:-1])
+        | (pixel[1:, 0] != pixel[:-1, 0])
+        | (pixel[1:, 1] != pixel[:-1, 1])
+    )
+    pixel = pixel[keep]
+    line = line[keep]
+
+    same_line = line[1:] == line[:-1]
+    is_single = np.ones(len(pixel), dtype=bool)
+    is_single[1:] &= ~same_line
+    is_single[:-1] &= ~same_line
+    begin = np.concatenate([pixel[:-1][same_line], pixel[is_single]])
+    end = np.concatenate([pixel[1:][same_line], pixel[is_single]])
+    group = np.asarray(line_groups, dtype=np.int64)[
+        np.concatenate([line[:-1][same_line], line[is_single]])
+    ]
+
+    num_pixels = counts.shape[0] * counts.shape[1]
+    keys = _rasterize_segments(begin, end, group * num_pixels, width, counts.shape)
+    if len(keys) == 0:
+        return
+    # Each group must only count once per pixel. Sorting is much faster than
+    # `np.unique` on these integer keys.
+    keys.sort()
+    keys = keys[np.append(True, keys[1:] != keys[:-1])]
+    counts += (
+        np.bincount(keys % num_pixels, minlength=num_pixels)
+        .reshape(counts.shape)
+        .astype(counts.dtype, copy=False)
+    )
+
+
+def _rasterize_segments(
+    begin: np.ndarray,
+    end: np.ndarray,
+    key_offset: np.ndarray,
+    width: float,
+    shape: tuple[int, int],
+) -> np.ndarray:
+    """Expand segments into the pixels they cover.
+
+    Returns the flat pixel index plus the ``key_offset`` of the segment for
+    every covered pixel. Pixels outside of ``shape`` are left out.
+    """
+    height, image_width = shape
+    half_width = width / 2
+
+    lower = np.minimum(begin, end) - half_width
+    upper = np.maximum(begin, end) + half_width
+    visible = (
+        (upper[:, 0] >= 0)
+        & (lower[:, 0] < image_width)
+        & (upper[:, 1] >= 0)
+        & (lower[:, 1] < height)
+    )
+    key_offset = key_offset[visible]
+    begin = begin[visible].astype(np.float64)
+    end = end[visible].astype(np.float64)
+
+    delta = end - begin
+    steep = np.abs(delta[:, 1]) > np.abs(delta[:, 0])
+    major_axis = steep.astype(np.int64)
+    minor_axis = 1 - major_axis
+    index = np.arange(len(begin))
+    major_begin = begin[index, major_axis]
+    major_end = end[index, major_axis]
+    minor_begin = begin[index, minor_axis]
+    minor_end = end[index, minor_axis]
+
+    # Walk each segment in increasing direction along its major axis.
+    flip = major_end < major_begin
+    major_begin, major_end = (
+        np.where(flip, major_end, major_begin),
+        np.where(flip, major_begin, major_end),
+    )
+    minor_begin, minor_end = (
+        np.where(flip, minor_end, minor_begin),
+        np.where(flip, minor_begin, minor_end),
+    )
+    major_length = major_end - major_begin
+    slope = np.divide(
+        minor_end - minor_begin,
+        major_length,
+        out=np.zeros_like(major_length),
+        where=major_length > 0,
+    )
+    # The cross section along the minor axis is wider for slanted lines.
+    half_span = half_width * np.sqrt(1 + slope**2)
+
+    major_size = np.where(steep, height, image_width)
+    minor_size = np.where(steep, image_width, height)
+    first_step = np.maximum(major_begin, 0).astype(np.int64)
+    last_step = np.minimum(major_end, major_size - 1).astype(np.int64)
+    num_steps = np.maximum(last_step - first_step + 1, 0)
+
+    step_segment = np.repeat(np.arange(len(begin)), num_steps)
+    step_offset = np.arange(len(step_segment)) - np.repeat(
+        np.cumsum(num_steps) - num_steps, num_steps
+    )
+    major = first_step[step_segment] + step_offset
+    center = minor_begin[step_segment] + slope[step_segment] * (
+        major - major_begin[step_segment]
+    )
+    low = np.floor(center - half_span[step_segment]).astype(np.int64) + 1
+    high = np.floor(center + half_span[step_segment]).astype(np.int64)
+    low = np.maximum(low, 0)
+    high = np.minimum(high, minor_size[step_segment] - 1)
+    span = high - low + 1
+    nonempty = span > 0
+    step_segment = step_segment[nonempty]
+    major = major[nonempty]
+    low = low[nonempty]
+    span = span[nonempty]
+    if len(span) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Every step covers a run of pixels. In a steep segment the run goes along
+    # a row, otherwise along a column. The keys of all runs are generated as a
+    # cumulative sum of the strides, with a jump at the start of each run.
+    steep = steep[step_segment]
+    run_start = key_offset[step_segment] + np.where(
+        steep, major * image_width + low, low * image_width + major
+    )
+    stride = np.where(steep, 1, image_width)
+    keys = np.repeat(stride, span)
+    first = np.cumsum(span) - span
+    run_end = run_start + (span - 1) * stride
+    keys[first[0]] = run_start[0]
+    keys[first[1:]] = run_start[1:] - run_end[:-1]
+    return np.cumsum(keys, out=keys)
@@ -3,6 +3,8 @@ import sqlalchemy
 from ..features.activity_photos.importer import import_photos_from_directory
 from ..features.explorer.clustering import compute_tile_evolution
 from ..features.hammerhead.source import HammerheadActivitySource
+from ..features.heatmap.prewarm import start_heatmap_prewarming
+from ..features.heatmap.track_index import update_track_index
 from ..features.segments.matching import find_matches
 from ..features.segments.model import Segment
 from ..features.strava.source import StravaActivitySource
@@ -28,7 +30,10 @@ def scan_for_activities(
     hammerhead_begin: str | None = None,
     hammerhead_end: str | None = None,
     skip_hammerhead: bool = False,
+    prewarm_heatmap: bool = False,
+    jobs: int = 1,
 ) -> None:
+    known_activity_ids = set(repository.get_activity_ids())
     for activity_source in _ACTIVITY_SOURCES:
         if not activity_source.is_enabled(config_accessor):
             continue
@@ -47,13 +52,18 @@ def scan_for_activities(
             begin = None
             end = None
 
-        activity_source.import_activities(config_accessor, repository, begin, end)
+        activity_source.import_activities(config_accessor, repository, begin, end, jobs)
 
     import_photos_from_directory()
 
     if len(repository) > 0:
         compute_tile_visits_new(repository)
         compute_tile_evolution(config_accessor.ui())
+        update_track_index(repository)
+        if prewarm_heatmap:
+            start_heatmap_prewarming(
+                set(repository.get_activity_ids()) - known_activity_ids
+            )
 
     for segment in DB.session.scalars(sqlalchemy.select(Segment)).all():
         find_matches(segment, config_accessor.activity_import())
@@ -26,6 +26,7 @@ class ActivitySource(abc.ABC):
         repository: ActivityRepository,
         begin: str | None = None,  # noqa: ARG002
         end: str | None = None,  # noqa: ARG002
+        jobs: int = 1,  # noqa: ARG002
     ) -> None:
         """Import activities from this source."""
         ...
@@ -45,6 +46,7 @@ class DirectoryImportSource(ActivitySource):
         repository: ActivityRepository,
         begin: str | None = None,  # noqa: ARG002
         end: str | None = None,  # noqa: ARG002
+        jobs: int = 1,
     ) -> None:
         from ..features.directory_import.importer import import_from_directory
 
@@ -53,4 +55,5 @@ class DirectoryImportSource(ActivitySource):
             config_accessor.activity_import(),
             config_accessor.ui(),
             source=self.source,
+            jobs=jobs,
         )
@@ -0,0 +1,189 @@
+"""Download and decode base map tiles, shared by the web app and the renderers.
+
+Tiles are kept on disk in the `Open Street Map Tiles` directory. Decoded tiles
+are additionally kept in memory up to a budget of bytes. Downloads go through
+one pooled HTTP session, run on a pool of worker threads and are spaced out
+per host, such that the tile servers are not flooded. A tile that is requested
+by several threads at once is only downloaded once.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import pathlib
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterable
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Martin's Geo Activity Playground"
+
+_TileKey = tuple[int, int, int, str]
+
+
+class _HostRateLimiter:
+    """Spaces out the requests to each host by a minimum interval."""
+
+    def __init__(self, requests_per_second: float) -> None:
+        self._interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot: dict[str, float] = {}
+
+    def wait(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class TileFetcher:
+    def __init__(
+        self,
+        workers: int = 4,
+        requests_per_second: float = 10.0,
+        max_cache_bytes: int = 256 * 1024**2,
+        tile_dir: pathlib.Path = pathlib.Path("Open Street Map Tiles"),
+    ) -> None:
+        self.workers = workers
+        self.max_cache_bytes = max_cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self._tile_dir = tile_dir
+        self._rate_limiter = _HostRateLimiter(requests_per_second)
+        self._lock = threading.Lock()
+        self._images: collections.OrderedDict[_TileKey, Image.Image] = (
+            collections.OrderedDict()
+        )
+        self._num_bytes = 0
+        self._in_flight: dict[_TileKey, concurrent.futures.Future[Image.Image]] = {}
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def get_tile(self, zoom: int, x: int, y: int, url_template: str) -> Image.Image:
+        """Decoded RGB tile, which is shared and must not be modified."""
+        future, is_owner = self._claim((zoom, x, y, url_template))
+        if is_owner:
+            self._load(future, (zoom, x, y, url_template))
+        return future.result()
+
+    def get_tiles(
+        self, zoom: int, tiles: Iterable[tuple[int, int]], url_template: str
+    ) -> dict[tuple[int, int], Image.Image]:
+        """Several tiles, where the missing ones are loaded in parallel."""
+        futures = {}
+        for x, y in dict.fromkeys(tiles):
+            key = (zoom, x, y, url_template)
+            future, is_owner = self._claim(key)
+            if is_owner:
+                self._get_executor().submit(self._load, future, key)
+            futures[(x, y)] = future
+        return {tile: future.result() for tile, future in futures.items()}
+
+    def tile_path(
+        self, zoom: int, x: int, y: int, url_template: str, variant: str = ""
+    ) -> pathlib.Path:
+        """Path of the downloaded tile, or of a variant derived from it."""
+        dir_for_source = self._tile_dir / urllib.parse.quote_plus(url_template)
+        return dir_for_source / variant / f"{zoom}/{x}/{y}.png"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self._num_bytes = 0
+
+    def _claim(
+        self, key: _TileKey
+    ) -> tuple[concurrent.futures.Future[Image.Image], bool]:
+        """Future for the tile and whether the caller has to load it."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self.hits += 1
+                self._images.move_to_end(key)
+                future: concurrent.futures.Future[Image.Image] = (
+                    concurrent.futures.Future()
+                )
+                future.set_result(image)
+                return future, False
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.hits += 1
+                return in_flight, False
+            self.misses += 1
+            future = concurrent.futures.Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def _load(
+        self, future: concurrent.futures.Future[Image.Image], key: _TileKey
+    ) -> None:
+        try:
+            image = self._read_or_download(*key)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            del self._in_flight[key]
+            self._remember(key, image)
+        future.set_result(image)
+
+    def _read_or_download(
+        self, zoom: int, x: int, y: int, url_template: str
+    ) -> Image.Image:
+        destination = self.tile_path(zoom, x, y, url_template)
+        if not destination.exists():
+            logger.debug(f"Downloading OSM tile {x=}, {y=}, {zoom=} …")
+            self._download(url_template.format(x=x, y=y, zoom=zoom), destination)
+        with Image.open(destination) as image:
+            image.load()
+            return image.convert("RGB")
+
+    def _download(self, url: str, destination: pathlib.Path) -> None:
+        self._rate_limiter.wait(urllib.parse.urlsplit(url).netloc)
+        r = self._session.get(url, allow_redirects=True, timeout=30)
+        r.raise_for_status()
+        write_tile_file(destination, r.content)
+
+    def _remember(self, key: _TileKey, image: Image.Image) -> None:
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_cache_bytes:
+            return
+        self._images[key] = image
+        self._num_bytes += size
+        while self._num_bytes > self.max_cache_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._num_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="tile-fetcher"
+                )
+            return self._executor
+
+
+def write_tile_file(path: pathlib.Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Other threads and processes must never see a partially written tile.
+    partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    partial.write_bytes(data)
+    partial.replace(path)
+
+
+tile_fetcher = TileFetcher()
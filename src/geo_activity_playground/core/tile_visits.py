@@ -1,20 +1,28 @@
 import collections
 import datetime
 import logging
-import zoneinfo
 from collections.abc import Iterator
 from typing import TypedDict
 
+import numpy as np
 import pandas as pd
 import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from tqdm import tqdm
 
 from .activities import ActivityRepository
 from .datamodel import DB, Activity, ActivityTile, TileVisit
-from .tiles import interpolate_missing_tile
+from .tiles import interpolate_missing_tiles
 
 logger = logging.getLogger(__name__)
 
+# Tiles are computed at this zoom level and all levels above.
+MAX_TILE_ZOOM = 19
+# Number of activities whose tiles are merged and written together.
+TILE_VISIT_BATCH_SIZE = 100
+# Stands in for missing times, which then sort after all real ones.
+_MISSING_TIME = np.iinfo(np.int64).max
+
 
 def get_first_visits_for_activity(
     activity_id: int, zoom: int | None = None
@@ -311,9 +319,11 @@ def refresh_tile_visits_for_activity(activity_id: int) -> None:
         DB.session.commit()
 
     from ..features.explorer.clustering import rebuild_cluster_history_for_zoom
+    from ..features.explorer.tile_cache import bump_explorer_state_version
 
     for zoom in affected_zooms:
         rebuild_cluster_history_for_zoom(zoom, get_tile_history_df(zoom))
+    bump_explorer_state_version(zooms)
 
 
 def _processed_activity_ids() -> set[int]:
@@ -322,7 +332,10 @@ def _processed_activity_ids() -> set[int]:
 
 
 def compute_tile_visits_new(repository: ActivityRepository) -> None:
-    if not _consistency_check(repository):
+    from ..features.explorer.tile_cache import bump_explorer_state_version
+
+    is_consistent = _consistency_check(repository)
+    if not is_consistent:
         logger.warning("Need to recompute Explorer Tiles.")
         _reset_tile_visits_db()
 
@@ -332,120 +345,216 @@ def compute_tile_visits_new(repository: ActivityRepository) -> None:
         for activity_id in repository.get_activity_ids()
         if activity_id not in processed_ids
     ]
-    for activity_id in tqdm(unprocessed_ids, desc="Tile visits", delay=1):
-        _process_activity(repository, activity_id)
+    with tqdm(total=len(unprocessed_ids), desc="Tile visits", delay=1) as progress:
+        for begin in range(0, len(unprocessed_ids), TILE_VISIT_BATCH_SIZE):
+            batch = unprocessed_ids[begin : begin + TILE_VISIT_BATCH_SIZE]
+            _process_activities(repository, batch)
+            progress.update(len(batch))
+
+    if unprocessed_ids or not is_consistent:
+        bump_explorer_state_version(range(MAX_TILE_ZOOM + 1))
 
 
 def _process_activity(repository: ActivityRepository, activity_id: int) -> None:
-    activity = repository.get_activity_by_id(activity_id)
-    time_series = repository.get_time_series(activity_id)
-    fallback_time = _fallback_timestamp_for_activity(activity)
+    _process_activities(repository, [activity_id])
 
-    activity_tile_rows: list[ActivityTile] = []
-    activity_tiles = pd.DataFrame(
-        _tiles_from_points(time_series, 19), columns=["time", "tile_x", "tile_y"]
-    )
-    for zoom in reversed(range(20)):
-        # Keep one row per tile while preferring entries with real timestamps.
-        # This avoids freezing a tile's first/last time at NaT when the same
-        # activity has a later point on the same tile with valid time data.
-        activity_tiles = (
-            activity_tiles.assign(
-                _time_missing=activity_tiles["time"].isna(),
-            )
-            .sort_values(
-                ["tile_x", "tile_y", "_time_missing", "time"],
-                kind="stable",
-            )
-            .groupby(["tile_x", "tile_y"], sort=False)
-            .head(1)
-            .drop(columns="_time_missing")
+
+def _process_activities(
+    repository: ActivityRepository, activity_ids: list[int]
+) -> None:
+    """Add the tiles of a batch of activities to the explorer tables.
+
+    The tiles of all activities are merged in memory and written with bulk
+    upserts in one transaction. Within the batch, the first and last visit of a
+    tile go to the activities with the earliest and latest time. On ties the
+    activity that comes first in `activity_ids` wins, as if the activities had
+    been added one after the other.
+    """
+    orders: list[np.ndarray] = []
+    times: list[np.ndarray] = []
+    xs: list[np.ndarray] = []
+    ys: list[np.ndarray] = []
+    fallback_times = np.full(len(activity_ids), _MISSING_TIME)
+    for_achievements = np.zeros(len(activity_ids), dtype=bool)
+    for order, activity_id in enumerate(activity_ids):
+        activity = repository.get_activity_by_id(activity_id)
+        fallback_time = _fallback_timestamp_for_activity(activity)
+        if fallback_time is not None:
+            fallback_times[order] = fallback_time.value
+        for_achievements[order] = activity.kind.consider_for_achievements
+        time, tile_x, tile_y = _track_tiles(
+            repository.get_time_series(activity_id), MAX_TILE_ZOOM
+        )
+        orders.append(np.full(len(time), order))
+        times.append(time)
+        xs.append(tile_x)
+        ys.append(tile_y)
+
+    point_order = np.concatenate(orders)
+    time = np.concatenate(times)
+    tile_x = np.concatenate(xs)
+    tile_y = np.concatenate(ys)
+    batch_activity_ids = np.array(activity_ids)
+    activity_tile_rows: list[dict] = []
+    tile_visit_rows: list[dict] = []
+    for zoom in reversed(range(MAX_TILE_ZOOM + 1)):
+        if zoom < MAX_TILE_ZOOM:
+            # Move up one layer in the quad-tree.
+            tile_x = tile_x >> 1
+            tile_y = tile_y >> 1
+        point_order, time, tile_x, tile_y = _first_visit_per_tile(
+            point_order, time, tile_x, tile_y
         )
-        tiles = list(zip(activity_tiles["tile_x"], activity_tiles["tile_y"]))
-        existing_by_tile: dict[tuple[int, int], TileVisit] = {}
-        for i in range(0, len(tiles), 400):
-            chunk = tiles[i : i + 400]
-            if not chunk:
-                continue
-            for visit in DB.session.scalars(
-                sa.select(TileVisit).where(
-                    TileVisit.zoom == zoom,
-                    sa.tuple_(TileVisit.tile_x, TileVisit.tile_y).in_(chunk),
-                )
-            ):
-                existing_by_tile[(visit.tile_x, visit.tile_y)] = visit
 
-        for time, tile in zip(
-            activity_tiles["time"],
-            tiles,
-        ):
-            if activity.kind.consider_for_achievements:
-                if pd.isna(time) and fallback_time is not None:
-                    time = fallback_time
-                if time is not None and time.tz is None:
-                    time = time.tz_localize("UTC")
-                has_time = pd.notna(time)
-                db_time = time.to_pydatetime() if has_time else None
-                existing = existing_by_tile.get(tile)
-                if existing is None:
-                    existing_by_tile[tile] = TileVisit(
-                        zoom=zoom,
-                        tile_x=tile[0],
-                        tile_y=tile[1],
-                        first_activity_id=activity_id,
-                        first_time=db_time,
-                        last_activity_id=activity_id,
-                        last_time=db_time,
-                        visit_count=1,
-                    )
-                    DB.session.add(existing_by_tile[tile])
-                else:
-                    existing.visit_count += 1
-                    first_time = (
-                        pd.Timestamp(existing.first_time)
-                        if existing.first_time is not None
-                        else None
-                    )
-                    last_time = (
-                        pd.Timestamp(existing.last_time)
-                        if existing.last_time is not None
-                        else None
-                    )
-                    if first_time is not None and first_time.tz is None:
-                        first_time = first_time.tz_localize("UTC")
-                    if last_time is not None and last_time.tz is None:
-                        last_time = last_time.tz_localize("UTC")
-                    try:
-                        if has_time:
-                            if first_time is None or time < first_time:
-                                existing.first_activity_id = activity_id
-                                existing.first_time = db_time
-                            if last_time is None or time > last_time:
-                                existing.last_activity_id = activity_id
-                                existing.last_time = db_time
-                    except TypeError as e:
-                        raise TypeError(
-                            f"Mismatch in timezone awareness: {time=}, {first_time=}, {last_time=}"
-                        ) from e
-
-            activity_tile_rows.append(
-                ActivityTile(
-                    zoom=zoom,
-                    tile_x=tile[0],
-                    tile_y=tile[1],
-                    activity_id=activity_id,
+        activity_tile_rows.extend(
+            {"zoom": zoom, "tile_x": x, "tile_y": y, "activity_id": activity_id}
+            for x, y, activity_id in zip(
+                tile_x.tolist(),
+                tile_y.tolist(),
+                batch_activity_ids[point_order].tolist(),
+            )
+        )
+        visits = for_achievements[point_order]
+        if visits.any():
+            visit_time = time[visits]
+            visit_time = np.where(
+                visit_time == _MISSING_TIME,
+                fallback_times[point_order[visits]],
+                visit_time,
+            )
+            tile_visit_rows.extend(
+                _aggregate_tile_visits(
+                    zoom,
+                    batch_activity_ids,
+                    point_order[visits],
+                    visit_time,
+                    tile_x[visits],
+                    tile_y[visits],
                 )
             )
 
-        if activity.kind.consider_for_achievements:
-            DB.session.commit()
+    if tile_visit_rows:
+        _upsert_tile_visits(tile_visit_rows)
+    DB.session.execute(sa.insert(ActivityTile), activity_tile_rows)
+    DB.session.commit()
 
-        # Move up one layer in the quad-tree.
-        activity_tiles["tile_x"] //= 2
-        activity_tiles["tile_y"] //= 2
+    from ..features.heatmap.invalidation import add_activity_to_heatmap_cache
 
-    DB.session.add_all(activity_tile_rows)
-    DB.session.commit()
+    for activity_id in activity_ids:
+        add_activity_to_heatmap_cache(activity_id)
+
+
+def _first_visit_per_tile(
+    order: np.ndarray, time: np.ndarray, tile_x: np.ndarray, tile_y: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Keep one entry per activity and tile, the one with the earliest time.
+
+    A missing time sorts last, so it is only kept if all entries lack one.
+    """
+    index = np.lexsort((time, tile_y, tile_x, order))
+    order, time, tile_x, tile_y = (
+        order[index],
+        time[index],
+        tile_x[index],
+        tile_y[index],
+    )
+    first = _group_starts(order, tile_x, tile_y)
+    return order[first], time[first], tile_x[first], tile_y[first]
+
+
+def _group_starts(*keys: np.ndarray) -> np.ndarray:
+    """Mask of the entries that differ from their predecessor in any key."""
+    starts = np.zeros(len(keys[0]), dtype=bool)
+    starts[:1] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+
+def _aggregate_tile_visits(
+    zoom: int,
+    activity_ids: np.ndarray,
+    order: np.ndarray,
+    time: np.ndarray,
+    tile_x: np.ndarray,
+    tile_y: np.ndarray,
+) -> list[dict]:
+    """One tile visit row per tile, from the tiles of several activities."""
+    by_first = np.lexsort((order, time, tile_y, tile_x))
+    # Latest time first, but a missing time still sorts last.
+    reverse_time = np.where(time == _MISSING_TIME, _MISSING_TIME, -time)
+    by_last = np.lexsort((order, reverse_time, tile_y, tile_x))
+    starts = np.flatnonzero(_group_starts(tile_x[by_first], tile_y[by_first]))
+    first = by_first[starts]
+    last = by_last[starts]
+    visit_count = np.diff(np.append(starts, len(by_first)))
+    return [
+        {
+            "zoom": zoom,
+            "tile_x": x,
+            "tile_y": y,
+            "first_activity_id": first_activity_id,
+            "first_time": first_time,
+            "last_activity_id": last_activity_id,
+            "last_time": last_time,
+            "visit_count": count,
+        }
+        for x, y, first_activity_id, first_time, last_activity_id, last_time, count in zip(
+            tile_x[first].tolist(),
+            tile_y[first].tolist(),
+            activity_ids[order[first]].tolist(),
+            _to_db_times(time[first]),
+            activity_ids[order[last]].tolist(),
+            _to_db_times(time[last]),
+            visit_count.tolist(),
+        )
+    ]
+
+
+def _to_db_times(time: np.ndarray) -> list[datetime.datetime | None]:
+    """Naive UTC datetimes, `None` where the time is missing."""
+    return (
+        np.where(time == _MISSING_TIME, np.iinfo(np.int64).min, time)
+        .view("datetime64[ns]")
+        .astype("datetime64[us]")
+        .tolist()
+    )
+
+
+def _upsert_tile_visits(rows: list[dict]) -> None:
+    """Insert tile visits or merge them into the existing ones.
+
+    Existing first and last visits are only replaced by strictly earlier or
+    later times, and never by a visit without time.
+    """
+    statement = sqlite_insert(TileVisit)
+    new = statement.excluded
+    is_earlier = sa.and_(
+        new.first_time.is_not(None),
+        sa.or_(TileVisit.first_time.is_(None), new.first_time < TileVisit.first_time),
+    )
+    is_later = sa.and_(
+        new.last_time.is_not(None),
+        sa.or_(TileVisit.last_time.is_(None), new.last_time > TileVisit.last_time),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[TileVisit.zoom, TileVisit.tile_x, TileVisit.tile_y],
+        set_={
+            "visit_count": TileVisit.visit_count + new.visit_count,
+            "first_activity_id": sa.case(
+                (is_earlier, new.first_activity_id),
+                else_=TileVisit.first_activity_id,
+            ),
+            "first_time": sa.case(
+                (is_earlier, new.first_time), else_=TileVisit.first_time
+            ),
+            "last_activity_id": sa.case(
+                (is_later, new.last_activity_id), else_=TileVisit.last_activity_id
+            ),
+            "last_time": sa.case((is_later, new.last_time), else_=TileVisit.last_time),
+        },
+    )
+    DB.session.execute(statement, rows)
 
 
 def _fallback_timestamp_for_activity(activity: object) -> pd.Timestamp | None:
@@ -463,32 +572,56 @@ def _fallback_timestamp_for_activity(activity: object) -> pd.Timestamp | None:
     return timestamp
 
 
-def _tiles_from_points(
+def _tiles_from_points(time_series: pd.DataFrame, zoom: int) -> pd.DataFrame:
+    """Tiles that the track passes through, with the time of the first visit."""
+    time, tile_x, tile_y = _track_tiles(time_series, zoom)
+    _, time, tile_x, tile_y = _first_visit_per_tile(
+        np.zeros(len(time), dtype=np.int64), time, tile_x, tile_y
+    )
+    return pd.DataFrame(
+        {
+            "time": pd.to_datetime(
+                np.where(time == _MISSING_TIME, np.iinfo(np.int64).min, time).view(
+                    "datetime64[ns]"
+                ),
+                utc=True,
+            ),
+            "tile_x": tile_x,
+            "tile_y": tile_y,
+        }
+    )
+
+
+def _track_tiles(
     time_series: pd.DataFrame, zoom: int
-) -> Iterator[tuple[datetime.datetime, int, int]]:
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Time and tile of every point, plus the tiles that diagonal steps skip.
+
+    Times are nanoseconds since the epoch in UTC, `_MISSING_TIME` where the
+    point has none. Tiles can repeat.
+    """
     # XXX Some people haven't localized their time series yet. This breaks the tile history part. Just assume that it is UTC, should be good enough for tiles.
-    if time_series["time"].dt.tz is None:
-        time_series = time_series.copy()
-        time_series["time"] = time_series["time"].dt.tz_localize(
-            zoneinfo.ZoneInfo("UTC")
-        )
-    xf = time_series["x"] * 2**zoom
-    yf = time_series["y"] * 2**zoom
-    for t1, x1, y1, x2, y2, s1, s2 in zip(
-        time_series["time"],
-        xf,
-        yf,
-        xf.shift(1),
-        yf.shift(1),
-        time_series["segment_id"],
-        time_series["segment_id"].shift(1),
-    ):
-        yield (t1, int(x1), int(y1))
-        # We don't want to interpolate over segment boundaries.
-        if s1 == s2:
-            interpolated = interpolate_missing_tile(x1, y1, x2, y2)
-            if interpolated is not None:
-                yield (t1,) + interpolated
+    time = (
+        pd.to_datetime(time_series["time"], utc=True)
+        .dt.tz_localize(None)
+        .to_numpy(dtype="datetime64[ns]")
+        .view(np.int64)
+    )
+    time = np.where(np.isnat(time.view("datetime64[ns]")), _MISSING_TIME, time)
+    xf = time_series["x"].to_numpy() * 2**zoom
+    yf = time_series["y"].to_numpy() * 2**zoom
+    segment_id = time_series["segment_id"].to_numpy()
+
+    # We don't want to interpolate over segment boundaries.
+    (pairs,) = np.nonzero(segment_id[1:] == segment_id[:-1])
+    index, gap_x, gap_y = interpolate_missing_tiles(
+        xf[pairs + 1], yf[pairs + 1], xf[pairs], yf[pairs]
+    )
+    return (
+        np.concatenate([time, time[pairs[index] + 1]]),
+        np.concatenate([np.trunc(xf).astype(np.int64), gap_x]),
+        np.concatenate([np.trunc(yf).astype(np.int64), gap_y]),
+    )
 
 
 def get_activity_ids_in_tile(zoom: int, tile_x: int, tile_y: int) -> set[int]:
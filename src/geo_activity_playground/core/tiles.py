@@ -67,6 +67,32 @@ def interpolate_missing_tile(
         return (int(x1), y_hat)
 
 
+def interpolate_missing_tiles(
+    x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Array version of `interpolate_missing_tile` for many pairs of points.
+
+    Returns the indices of the pairs that need a tile in between, and the
+    coordinates of these tiles.
+    """
+    ix1 = np.trunc(x1)
+    iy1 = np.trunc(y1)
+    ix2 = np.trunc(x2)
+    iy2 = np.trunc(y2)
+    (index,) = np.nonzero(
+        (ix1 != ix2)
+        & (iy1 != iy2)
+        & (np.abs(ix1 - ix2) <= 1)
+        & (np.abs(iy1 - iy2) <= 1)
+    )
+    x1, y1, x2, y2 = x1[index], y1[index], x2[index], y2[index]
+    x_hat = np.trunc(np.maximum(x1, x2))
+    frac = (x_hat - x1) / (x2 - x1)
+    y_hat = np.trunc(y1 + frac * (y2 - y1))
+    tile_x = np.where(y_hat == iy1[index], ix2[index], ix1[index])
+    return index, tile_x.astype(np.int64), y_hat.astype(np.int64)
+
+
 def adjacent_to(tile: tuple[int, int]) -> Iterator[tuple[int, int]]:
     x, y = tile
     yield (x + 1, y)
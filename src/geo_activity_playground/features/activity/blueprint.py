@@ -52,6 +52,8 @@ from ...webui.authenticator import Authenticator, needs_authentication
 from ...webui.columns import TIME_SERIES_COLUMNS
 from ..directory_import.importer import get_metadata_from_path
 from ..explorer.clustering import get_cluster_tile_diff_for_activity
+from ..heatmap.invalidation import remove_activity_from_heatmap_cache
+from ..heatmap.track_index import remove_activity_track
 
 logger = logging.getLogger(__name__)
 
@@ -517,7 +519,9 @@ def make_activity_blueprint(
         activity.delete_data()
         DB.session.delete(activity)
         DB.session.commit()
+        remove_activity_from_heatmap_cache(id)
         remove_activity_from_tile_state(id)
+        remove_activity_track(id)
         flash(
             _(
                 "The activity has been deleted. Its source data is left untouched, but it will not be imported again. You can undo this from Settings → Excluded Activities."
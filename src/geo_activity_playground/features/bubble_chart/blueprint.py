@@ -12,7 +12,7 @@ def make_bubble_chart_blueprint(repository) -> Blueprint:
 
     @blueprint.route("/", endpoint="index")
     def bubble_chart() -> ResponseReturnValue:
-        activities = repository.meta.copy()
+        activities = repository.meta
 
         if "id" not in activities.columns:
             activities["id"] = activities.index
@@ -1,10 +1,19 @@
-import hashlib
+import collections
+import concurrent.futures
+import dataclasses
+import itertools
 import logging
+import multiprocessing
+import os
 import pathlib
 import re
 import traceback
+import uuid
+from collections.abc import Iterator
+from typing import Any, Literal
 
 import sqlalchemy
+from flask import current_app
 from tqdm import tqdm
 
 from ...core.activities import ActivityRepository
@@ -17,8 +26,14 @@ from ...core.datamodel import (
     get_or_make_equipment,
     get_or_make_kind,
 )
-from ...core.enrichment import update_and_commit
-from ...core.import_exclusion import clear_exclusion, is_excluded, record_exclusion
+from ...core.enrichment import apply_enrichments, update_heatmap_for_time_series
+from ...core.file_fingerprints import file_hashes, forget_other_files
+from ...core.import_exclusion import (
+    ImportExclusion,
+    clear_exclusion,
+    record_exclusion,
+)
+from ...core.tag_extraction import apply_tag_extraction_from_database
 from ...core.tile_visits import compute_tile_visits_new
 from ...importers.activity_parsers import (
     ActivityParseError,
@@ -31,130 +46,331 @@ logger = logging.getLogger(__name__)
 
 ACTIVITY_DIR = pathlib.Path("Activities")
 
+# New activities are committed together, the tile visits are updated after each
+# batch.
+_COMMIT_BATCH_SIZE = 50
+
 
 def import_from_directory(
     repository: ActivityRepository,
     config: ActivityImportConfig,
     ui_config: UiConfig,
     source: str | None = None,
+    jobs: int = 1,
 ) -> None:
-    activity_paths = [
-        path
-        for path in ACTIVITY_DIR.rglob("*.*")
-        if path.is_file()
-        and path.suffixes
-        and not path.stem.startswith(".")
-        and path.suffix not in config.ignore_suffixes
+    known = _KnownFiles()
+    activity_paths = _scan_activity_files(config.ignore_suffixes)
+    new_paths = [path for path in activity_paths if str(path) not in known.paths]
+    forget_other_files(activity_paths)
+    hashes = file_hashes(
+        new_paths + [pathlib.Path(path) for _, path in known.without_hash],
+        workers=max(jobs, 4),
+    )
+
+    # Activities imported before the hashes were stored get them now.
+    new_hashes = [
+        (activity_id, hashes[pathlib.Path(path)])
+        for activity_id, path in known.without_hash
+        if pathlib.Path(path) in hashes
     ]
-    activity_paths.sort()
+    if new_hashes:
+        DB.session.execute(
+            sqlalchemy.update(Activity),
+            [
+                {"id": activity_id, "upstream_id": file_hash}
+                for activity_id, file_hash in new_hashes
+            ],
+        )
+        DB.session.commit()
+        for activity_id, file_hash in new_hashes:
+            known.activity_ids_by_hash[file_hash].append(activity_id)
 
+    # Files that are known to be excluded or imported don't need to be parsed.
+    # Everything else is decided here again, after the workers have parsed it.
     paths_to_import = [
-        activity_path
-        for activity_path in tqdm(
-            activity_paths, desc="Scanning for new files", delay=1
-        )
-        if DB.session.scalar(
-            sqlalchemy.select(Activity).filter(Activity.path == str(activity_path))
-        )
-        is None
+        path
+        for path in new_paths
+        if path in hashes
+        and hashes[path] not in known.excluded_hashes
+        and len(known.activity_ids_by_hash.get(hashes[path], [])) != 1
     ]
 
-    for activity in DB.session.scalars(
-        sqlalchemy.select(Activity).filter(
-            Activity.upstream_id.is_(sqlalchemy.null()),
-            Activity.path.is_not(sqlalchemy.null()),
+    batch: list[Activity] = []
+    for i, prepared in enumerate(
+        tqdm(
+            _prepare_files(paths_to_import, hashes, config, jobs),
+            desc="Importing activity files",
+            total=len(paths_to_import),
+            delay=0,
         )
-    ):
-        assert activity.path is not None
-        if pathlib.Path(activity.path).exists():
-            activity.upstream_id = file_sha256(pathlib.Path(activity.path))
-    DB.session.commit()
-
-    for i, activity_path in enumerate(
-        tqdm(paths_to_import, desc="Importing activity files", delay=0)
     ):
         with DB.session.no_autoflush:
-            activity = DB.session.scalar(
-                sqlalchemy.select(Activity).filter(Activity.path == str(activity_path))
-            )
-            if activity is not None:
-                continue
-
-            current_hash = file_sha256(activity_path)
-
-            if is_excluded("directory", current_hash):
-                continue
-
-            with_same_hash = DB.session.scalars(
-                sqlalchemy.select(Activity).filter(Activity.upstream_id == current_hash)
-            ).all()
-            if with_same_hash:
-                if len(with_same_hash) == 1:
-                    continue
-                else:
-                    logger.warning(
-                        "The following activities are duplicates: "
-                        + ", ".join(str(activity.id) for activity in with_same_hash)
-                    )
+            activity = _import_prepared_file(prepared, config, source, known)
+        if activity is not None:
+            # The following files need to find the new kinds and equipments.
+            DB.session.flush()
+            known.activity_ids_by_hash[prepared.file_hash].append(activity.id)
+            batch.append(activity)
+        if len(batch) >= _COMMIT_BATCH_SIZE or (
+            batch and i == len(paths_to_import) - 1
+        ):
+            _commit_batch(batch)
+            batch = []
+            if len(repository) > 0:
+                compute_tile_visits_new(repository)
+                compute_tile_evolution(ui_config)
+
+
+class _KnownFiles:
+    """What the database knows about activity files, loaded with two queries."""
 
-            import_from_file(
-                activity_path,
-                repository,
-                config,
-                ui_config,
-                i,
-                current_hash,
-                source,
+    def __init__(self) -> None:
+        self.paths: set[str] = set()
+        self.activity_ids_by_hash: dict[str, list[int]] = collections.defaultdict(list)
+        self.without_hash: list[tuple[int, str]] = []
+        for activity_id, path, upstream_id in DB.session.execute(
+            sqlalchemy.select(Activity.id, Activity.path, Activity.upstream_id)
+        ):
+            if path is not None:
+                self.paths.add(path)
+            if upstream_id is not None:
+                self.activity_ids_by_hash[upstream_id].append(activity_id)
+            elif path is not None:
+                self.without_hash.append((activity_id, path))
+        self.excluded_hashes: set[str] = set(
+            DB.session.scalars(
+                sqlalchemy.select(ImportExclusion.upstream_id).where(
+                    ImportExclusion.source == "directory"
+                )
             )
+        )
 
 
-def import_from_file(
-    path: pathlib.Path,
-    repository: ActivityRepository,
+def _scan_activity_files(ignore_suffixes: list[str]) -> list[pathlib.Path]:
+    """Sorted paths of the activity files in the activity directory."""
+    paths = []
+    directories = [ACTIVITY_DIR] if ACTIVITY_DIR.is_dir() else []
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                # Like `rglob`, symlinked directories are not entered, they
+                # could form a cycle.
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(pathlib.Path(entry.path))
+                elif "." in entry.name and entry.is_file():
+                    path = pathlib.Path(entry.path)
+                    if (
+                        path.suffixes
+                        and not path.stem.startswith(".")
+                        and path.suffix not in ignore_suffixes
+                    ):
+                        paths.append(path)
+    paths.sort()
+    return paths
+
+
+@dataclasses.dataclass
+class _PreparedFile:
+    """An activity file after the work that doesn't need the main database."""
+
+    path: pathlib.Path
+    file_hash: str
+    status: Literal[
+        "parsed", "no_geo_data", "parse_error", "empty_time_series", "short"
+    ]
+    columns: dict[str, Any] = dataclasses.field(default_factory=dict)
+    kind_name: str | None = None
+    time_series_path: pathlib.Path | None = None
+    error_message: str | None = None
+
+
+_worker_config: ActivityImportConfig | None = None
+
+
+def _prepare_files(
+    paths: list[pathlib.Path],
+    hashes: dict[pathlib.Path, str],
     config: ActivityImportConfig,
-    ui_config: UiConfig,
-    i: int,
-    file_hash: str,
-    source: str | None = None,
-) -> None:
+    jobs: int,
+) -> Iterator[_PreparedFile]:
+    """Parse, enrich and store the time series of the files in order.
+
+    With several jobs, the files are prepared in a process pool while the
+    previous ones are written to the database.
+    """
+    database_uri = current_app.config["SQLALCHEMY_DATABASE_URI"]
+    if jobs < 2 or len(paths) < 2 or database_uri == "sqlite:///:memory:":
+        for path in paths:
+            yield _prepare_file(path, hashes[path], config)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        # Forking is not safe, this may run next to the web server.
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(database_uri, _column_values(config)),
+    ) as executor:
+        pending: collections.deque[concurrent.futures.Future[_PreparedFile]] = (
+            collections.deque()
+        )
+        paths_iter = iter(paths)
+        try:
+            while True:
+                # The queue is bounded, such that not too many time series are
+                # written before their activities are.
+                for path in itertools.islice(paths_iter, 4 * jobs - len(pending)):
+                    pending.append(
+                        executor.submit(_prepare_file_in_worker, path, hashes[path])
+                    )
+                if not pending:
+                    break
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _column_values(config: ActivityImportConfig) -> dict[str, Any]:
+    # The settings are passed as plain values. A pickled model could only be
+    # loaded once the worker has imported all models.
+    return {
+        attribute.key: getattr(config, attribute.key)
+        for attribute in sqlalchemy.inspect(ActivityImportConfig).column_attrs
+    }
+
+
+def _init_worker(database_uri: str, config_values: dict[str, Any]) -> None:
+    from ...webui.app import create_worker_app
+
+    global _worker_config
+    # The parsers look up the kinds of the activities.
+    create_worker_app(database_uri).app_context().push()
+    _worker_config = ActivityImportConfig(**config_values)
+
+
+def _prepare_file_in_worker(path: pathlib.Path, file_hash: str) -> _PreparedFile:
+    assert _worker_config is not None
+    return _prepare_file(path, file_hash, _worker_config)
+
+
+def _prepare_file(
+    path: pathlib.Path, file_hash: str, config: ActivityImportConfig
+) -> _PreparedFile:
     logger.info(f"Importing {path} …")
     try:
         activity, time_series = read_activity(path)
     except NoGeoDataError as e:
-        logger.warning(
-            f"Activity with {path=} has no geospatial series data, skipping."
-        )
-        record_exclusion(
-            "directory", file_hash, "no_geo_data", path=str(path), error_message=str(e)
-        )
-        return
+        return _PreparedFile(path, file_hash, "no_geo_data", error_message=str(e))
     except ActivityParseError as e:
         logger.error(f"Error while parsing file {path}:")
         traceback.print_exc()
-        record_exclusion(
-            "directory", file_hash, "parse_error", path=str(path), error_message=str(e)
-        )
-        return
+        return _PreparedFile(path, file_hash, "parse_error", error_message=str(e))
     except:
         logger.error(f"Encountered a problem with {path=}, see details below.")
         raise
 
+    # Only the name of the kind is passed on, the writer looks it up again.
+    kind_name = None
+    if activity.kind is not None:
+        kind_name = activity.kind.name
+        # Also takes the activity out of the activities of the kind.
+        del activity.kind
+
     if len(time_series) == 0:
+        return _PreparedFile(path, file_hash, "empty_time_series")
+    if len(time_series) < 2:
+        return _PreparedFile(path, file_hash, "short")
+
+    apply_enrichments(activity, time_series, config, force=False)
+    activity.time_series_uuid = str(uuid.uuid4())
+    activity.replace_time_series(time_series)
+    # Columns that have not been set are left out, such that their defaults
+    # apply.
+    values: dict[str, Any] = sqlalchemy.inspect(activity).dict
+    columns = {
+        attribute.key: values[attribute.key]
+        for attribute in sqlalchemy.inspect(Activity).column_attrs
+        if attribute.key in values
+        and attribute.key not in ["id", "kind_id", "equipment_id"]
+    }
+    return _PreparedFile(
+        path, file_hash, "parsed", columns, kind_name, activity.time_series_path
+    )
+
+
+def _import_prepared_file(
+    prepared: _PreparedFile,
+    config: ActivityImportConfig,
+    source: str | None,
+    known: _KnownFiles,
+) -> Activity | None:
+    path = prepared.path
+    file_hash = prepared.file_hash
+
+    if file_hash in known.excluded_hashes:
+        _discard_time_series(prepared)
+        return None
+
+    with_same_hash = known.activity_ids_by_hash.get(file_hash, [])
+    if with_same_hash:
+        if len(with_same_hash) == 1:
+            _discard_time_series(prepared)
+            return None
+        else:
+            logger.warning(
+                "The following activities are duplicates: "
+                + ", ".join(str(activity_id) for activity_id in with_same_hash)
+            )
+
+    if prepared.status == "no_geo_data":
+        logger.warning(
+            f"Activity with {path=} has no geospatial series data, skipping."
+        )
+        record_exclusion(
+            "directory",
+            file_hash,
+            "no_geo_data",
+            path=str(path),
+            error_message=prepared.error_message,
+        )
+        known.excluded_hashes.add(file_hash)
+        return None
+    elif prepared.status == "parse_error":
+        record_exclusion(
+            "directory",
+            file_hash,
+            "parse_error",
+            path=str(path),
+            error_message=prepared.error_message,
+        )
+        known.excluded_hashes.add(file_hash)
+        return None
+    elif prepared.status == "empty_time_series":
         logger.warning(f"Activity with {path=} has no time series data, skipping.")
         record_exclusion("directory", file_hash, "empty_time_series", path=str(path))
-        return
+        known.excluded_hashes.add(file_hash)
+        return None
 
     clear_exclusion("directory", file_hash)
+    if prepared.status == "short":
+        logger.warning(
+            f"Skipping activity with {path=} because it has fewer than two track points."
+        )
+        return None
 
+    activity = Activity(**prepared.columns)
     activity.path = str(path)
     activity.upstream_id = file_hash
     activity.name_from_file = activity.name
-    activity.kind_from_file = activity.kind.name if activity.kind is not None else None
+    activity.kind_from_file = prepared.kind_name
     if activity.name is None:
         activity.name = path.name.removesuffix("".join(path.suffixes))
 
     meta_from_path = get_metadata_from_path(path, config.metadata_extraction_regexes)
     activity.name = meta_from_path.get("name", activity.name)
+    if prepared.kind_name is not None:
+        activity.kind = get_or_make_kind(prepared.kind_name)
     if "equipment" in meta_from_path:
         activity.equipment = get_or_make_equipment(meta_from_path["equipment"])
     if "kind" in meta_from_path:
@@ -169,11 +385,20 @@ def import_from_file(
         )
     activity.source = source
 
-    update_and_commit(activity, time_series, config)
+    apply_tag_extraction_from_database(activity)
+    DB.session.add(activity)
+    return activity
+
+
+def _discard_time_series(prepared: _PreparedFile) -> None:
+    if prepared.time_series_path is not None:
+        prepared.time_series_path.unlink(missing_ok=True)
 
-    if len(repository) > 0 and i % 50 == 0:
-        compute_tile_visits_new(repository)
-        compute_tile_evolution(ui_config)
+
+def _commit_batch(batch: list[Activity]) -> None:
+    DB.session.commit()
+    for activity in batch:
+        update_heatmap_for_time_series(activity)
 
 
 def get_metadata_from_path(
@@ -183,16 +408,3 @@ def get_metadata_from_path(
         if m := re.search(regex, path.relative_to(ACTIVITY_DIR).as_posix()):
             return m.groupdict()
     return {}
-
-
-def file_sha256(filename: pathlib.Path) -> str:
-    """
-    Based on https://stackoverflow.com/a/44873382/653152.
-    """
-    h = hashlib.sha256(usedforsecurity=False)
-    b = bytearray(128 * 1024)
-    mv = memoryview(b)
-    with open(filename, "rb", buffering=0) as f:
-        while n := f.readinto(mv):
-            h.update(mv[:n])
-    return h.hexdigest()
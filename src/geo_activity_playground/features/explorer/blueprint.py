@@ -1,11 +1,9 @@
-import io
 import json
 from types import SimpleNamespace
 from typing import Any
 
 import altair as alt
 import geojson
-import matplotlib.pyplot as pl
 import numpy as np
 import pandas as pd
 import requests
@@ -25,7 +23,7 @@ from flask_babel import gettext as _
 
 from ...core.config import ConfigAccessor
 from ...core.coordinates import Bounds
-from ...core.datamodel import DB, Activity, TileVisit
+from ...core.datamodel import DB, Activity, TileVisit, UiConfig
 from ...core.grid import (
     geojson_bounding_box_for_tile_collection,
     get_border_tiles,
@@ -38,6 +36,7 @@ from ...core.grid import (
     make_grid_points,
 )
 from ...core.raster_map import ImageTransform, TileGetter
+from ...core.tile_encoding import encode_png, encoded_png_response, png_response
 from ...core.tile_visits import (
     get_activity_ids_in_bounds,
     get_tile_count,
@@ -50,11 +49,11 @@ from ...webui.authenticator import Authenticator, needs_authentication
 from .clustering import (
     compute_tile_evolution,
     get_biggest_cluster_members,
+    get_cached_cluster_state_at_cutoff,
     get_cluster_history_latest_event_index,
     get_cluster_id_for_tile,
     get_cluster_members,
     get_cluster_size_history_df,
-    get_cluster_state_at_cutoff,
     get_cluster_tile_count,
     get_cluster_tile_diff_for_activity,
     get_cluster_tiles_at_cutoff,
@@ -65,6 +64,12 @@ from .clustering import (
 from .garmin_img import build_garmin_img, mkgmap_available
 from .inaccessible import get_inaccessible_tiles
 from .model import ExplorerTileBookmark, InaccessibleTile
+from .tile_cache import (
+    explorer_tile_variant,
+    get_explorer_state_version,
+    get_explorer_tile_cache,
+    write_explorer_tile_cache,
+)
 from .tile_rendering import (
     _render_tile_image,
     _resolve_color_strategy,
@@ -110,15 +115,45 @@ def _grid_points_response(
         abort(404)
 
 
-def _png_response(image: np.ndarray) -> ResponseReturnValue:
-    f = io.BytesIO()
-    pl.imsave(f, image, format="png")
-    return Response(
-        bytes(f.getbuffer()),
-        mimetype="image/png",
-        headers={"Cache-Control": "no-cache"},
+def _render_explorer_tile(
+    zoom: int, z: int, x: int, y: int, config: UiConfig
+) -> np.ndarray:
+    square_x, square_y, square_size = get_explorer_square(zoom)
+    evolution_state = SimpleNamespace(
+        square_x=square_x, square_y=square_y, max_square_size=square_size
+    )
+    history_event_index = request.args.get("event_index", type=int)
+    historical_state = None
+    if history_event_index is not None:
+        history_event_index = max(
+            0,
+            min(history_event_index, get_cluster_history_latest_event_index(zoom)),
+        )
+        historical_state = get_cached_cluster_state_at_cutoff(zoom, history_event_index)
+
+    tile_bounds = _tile_bounds(zoom, z, x, y)
+    tile_visits = get_tile_visits_in_bounds(
+        zoom,
+        tile_bounds.x_min,
+        tile_bounds.x_max,
+        tile_bounds.y_min,
+        tile_bounds.y_max,
     )
 
+    color_strategy = _resolve_color_strategy(
+        request,
+        zoom,
+        tile_visits,
+        tile_bounds.x_min,
+        tile_bounds.x_max,
+        tile_bounds.y_min,
+        tile_bounds.y_max,
+        historical_state,
+        config,
+    )
+
+    return _render_tile_image(zoom, z, x, y, color_strategy, evolution_state)
+
 
 def _explorer_layer(zoom: int, color_strategy: str) -> tuple[str, dict, dict]:
     source_id = f"gap-explorer-{zoom}-{color_strategy}"
@@ -403,42 +438,15 @@ def make_explorer_blueprint(
     @blueprint.route("/<int:zoom>/tile/<int:z>/<int:x>/<int:y>.png")
     def tile(zoom: int, z: int, x: int, y: int) -> ResponseReturnValue:
         config = config_accessor.ui()
-        square_x, square_y, square_size = get_explorer_square(zoom)
-        evolution_state = SimpleNamespace(
-            square_x=square_x, square_y=square_y, max_square_size=square_size
-        )
-        history_event_index = request.args.get("event_index", type=int)
-        historical_state = None
-        if history_event_index is not None:
-            history_event_index = max(
-                0,
-                min(history_event_index, get_cluster_history_latest_event_index(zoom)),
-            )
-            historical_state = get_cluster_state_at_cutoff(zoom, history_event_index)
-
-        tile_bounds = _tile_bounds(zoom, z, x, y)
-        tile_visits = get_tile_visits_in_bounds(
-            zoom,
-            tile_bounds.x_min,
-            tile_bounds.x_max,
-            tile_bounds.y_min,
-            tile_bounds.y_max,
-        )
-
-        color_strategy = _resolve_color_strategy(
-            request,
-            zoom,
-            tile_visits,
-            tile_bounds.x_min,
-            tile_bounds.x_max,
-            tile_bounds.y_min,
-            tile_bounds.y_max,
-            historical_state,
-            config,
-        )
-
-        result = _render_tile_image(zoom, z, x, y, color_strategy, evolution_state)
-        return _png_response(result)
+        # Read before rendering, such that a tile rendered while the explorer
+        # state changes is stored as outdated.
+        version = get_explorer_state_version(zoom)
+        variant = explorer_tile_variant(request.args, config)
+        png = get_explorer_tile_cache(zoom, z, x, y, variant, version)
+        if png is None:
+            png = encode_png(_render_explorer_tile(zoom, z, x, y, config))
+            write_explorer_tile_cache(zoom, z, x, y, variant, version, png)
+        return encoded_png_response(png)
 
     @blueprint.route("/<int:zoom>/inaccessible-tile/<int:z>/<int:x>/<int:y>.png")
     def inaccessible_tile(zoom: int, z: int, x: int, y: int) -> ResponseReturnValue:
@@ -450,7 +458,7 @@ def make_explorer_blueprint(
             tile_bounds.y_min,
             tile_bounds.y_max,
         )
-        return _png_response(
+        return png_response(
             render_inaccessible_tile_image(zoom, z, x, y, inaccessible_tiles)
         )
 
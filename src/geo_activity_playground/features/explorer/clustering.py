@@ -1,39 +1,46 @@
+import array
+import bisect
+import concurrent.futures
 import itertools
-import json
 import logging
-
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from tqdm import tqdm
 
-from ...core.datamodel import DB, UiConfig
+from ...core.datamodel import DB, TileVisit, UiConfig
 from ...core.tile_visits import get_tile_history_df
-from ...core.tiles import adjacent_to
 from .model import (
     ClusterHistoryCheckpoint,
     ClusterHistoryEvent,
+    ClusterHistoryVersion,
     ClusterMembership,
     ClusterSizeHistory,
     ExplorerSquare,
     SquareHistory,
 )
+from .tile_cache import bump_explorer_state_version
 
 logger = logging.getLogger(__name__)
 
 
 class TileEvolutionState:
     def __init__(self) -> None:
-        self.num_neighbors: dict[tuple[int, int], int] = {}
-        "Mapping from tile to the number of its neighbors."
-
-        self.memberships: dict[tuple[int, int], tuple[int, int]] = {}
-        "Mapping from tile to the representative tile."
-        self.clusters: dict[tuple[int, int], list[tuple[int, int]]] = {}
-        "Mapping from representative tile to the list of all cluster members."
+        self.clusters = ClusterReplayState()
+        "Visited tiles and the clusters that they form."
 
         self.cluster_evolution = pd.DataFrame()
         self.square_start = 0
         self.cluster_start = 0
+        self.max_cluster_size = 0
         self.max_square_size = 0
         self.visited_tiles: set[tuple[int, int]] = set()
         self.square_evolution = pd.DataFrame()
@@ -42,151 +49,589 @@ class TileEvolutionState:
 
 
 class ClusterReplayState:
+    """Visited tiles and the clusters that they form, as a union-find in flat arrays.
+
+    Tiles are numbered in the order in which they are added, and per tile only
+    its key, the number of visited neighbors, the parent and the cluster size
+    are stored. Tiles are looked up by their key in a sorted array. Tiles that
+    have been added since it was last sorted are kept in a small dict.
+    """
+
     def __init__(self) -> None:
-        self.visited_tiles: set[tuple[int, int]] = set()
-        self.neighbor_counts: dict[tuple[int, int], int] = {}
-        self.cluster_tiles: set[tuple[int, int]] = set()
-        self.parents: dict[tuple[int, int], tuple[int, int]] = {}
-        self.component_sizes: dict[tuple[int, int], int] = {}
+        self.keys = array.array("q")
+        self.neighbor_counts = array.array("b")
+        # Parent in the union-find forest, -1 for tiles outside of clusters.
+        self.parents = array.array("i")
+        # Number of tiles in the cluster, only valid for the roots.
+        self.sizes = array.array("i")
         self.max_cluster_size = 0
+        # Never modified in place, such that copies can share them.
+        self._sorted_keys = array.array("q")
+        self._sorted_indices = array.array("i")
+        self._recent: dict[int, int] = {}
+
+    @classmethod
+    def from_arrays(cls, arrays: "_CheckpointArrays") -> "ClusterReplayState":
+        """State with the tile columns of a checkpoint, which are sorted by tile."""
+        state = cls()
+        keys = arrays.keys()
+        parents = np.searchsorted(keys, _tile_keys(arrays.parent_x, arrays.parent_y))
+        state.keys.frombytes(keys.tobytes())
+        state.neighbor_counts.frombytes(arrays.neighbor_count.astype(np.int8).tobytes())
+        state.parents.frombytes(
+            np.where(arrays.in_cluster, parents, -1).astype(np.int32).tobytes()
+        )
+        state.sizes.frombytes(arrays.size.astype(np.int32).tobytes())
+        state.max_cluster_size = int(arrays.size.max(initial=0))
+        state._sorted_keys = state.keys[:]
+        state._sorted_indices.frombytes(np.arange(len(keys), dtype=np.int32).tobytes())
+        return state
+
+    def copy(self) -> "ClusterReplayState":
+        other = ClusterReplayState()
+        other.keys = self.keys[:]
+        other.neighbor_counts = self.neighbor_counts[:]
+        other.parents = self.parents[:]
+        other.sizes = self.sizes[:]
+        other.max_cluster_size = self.max_cluster_size
+        other._sorted_keys = self._sorted_keys
+        other._sorted_indices = self._sorted_indices
+        other._recent = dict(self._recent)
+        return other
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, tile: tuple[int, int]) -> bool:
+        return self._index(_tile_key(*tile)) != -1
+
+    def visit_many(self, tile_x: np.ndarray, tile_y: np.ndarray) -> np.ndarray:
+        """Add visited tiles in order, return the maximum cluster size after each.
+
+        The tiles and their neighbors are looked up all at once. New tiles are
+        numbered in the order of their visits, so a neighbor with a higher
+        number than a tile hasn't been visited yet when the tile is.
+        """
+        keys = _tile_keys(np.asarray(tile_x), np.asarray(tile_y))
+        is_new = np.zeros(len(keys), dtype=bool)
+        is_new[np.unique(keys, return_index=True)[1]] = True
+        is_new &= self._lookup(keys) == -1
+        new_keys = keys[is_new]
+        previous_max = self.max_cluster_size
+        start = len(self.keys)
+        self._append(new_keys)
+        neighbors = self._lookup(
+            (new_keys[:, None] + np.array(_NEIGHBOR_OFFSETS)).ravel()
+        )
+
+        maxima = []
+        neighbor_counts = self.neighbor_counts
+        for index, others in enumerate(
+            itertools.batched(neighbors.tolist(), 4), start=start
+        ):
+            for other in others:
+                if other == -1 or other > index:
+                    continue
+                neighbor_counts[index] += 1
+                neighbor_counts[other] += 1
+                if neighbor_counts[other] == 4:
+                    self._activate(other)
+            if neighbor_counts[index] == 4:
+                self._activate(index)
+            maxima.append(self.max_cluster_size)
+
+        # Tiles that had been visited before don't change the maximum.
+        result = np.full(len(keys), previous_max, dtype=np.int64)
+        result[is_new] = maxima
+        return np.maximum.accumulate(result)
+
+    def is_cluster_tile(self, tile: tuple[int, int]) -> bool:
+        index = self._index(_tile_key(*tile))
+        return index != -1 and self.parents[index] != -1
+
+    def cluster_root(self, tile: tuple[int, int]) -> tuple[int, int] | None:
+        """Representative tile of the cluster that a tile belongs to, if any."""
+        index = self._index(_tile_key(*tile))
+        if index == -1 or self.parents[index] == -1:
+            return None
+        return _key_to_tile(self.keys[self._root(index)])
+
+    def largest_cluster_root(self) -> tuple[int, int] | None:
+        parents = np.array(self.parents, dtype=np.int32)
+        sizes = np.where(
+            parents == np.arange(len(parents)), np.array(self.sizes, dtype=np.int32), 0
+        )
+        if not sizes.any():
+            return None
+        return _key_to_tile(self.keys[int(sizes.argmax())])
+
+    def tiles(self) -> set[tuple[int, int]]:
+        x, y = _split_tile_keys(np.array(self.keys, dtype=np.int64))
+        return set(zip(x.tolist(), y.tolist()))
+
+    def cluster_tiles(self) -> set[tuple[int, int]]:
+        x, y = _split_tile_keys(self.cluster_members()[0])
+        return set(zip(x.tolist(), y.tolist()))
+
+    def cluster_members(self) -> tuple[np.ndarray, np.ndarray]:
+        """Keys of all cluster tiles and the keys of their cluster roots."""
+        parents = np.array(self.parents, dtype=np.int32)
+        members = np.flatnonzero(parents != -1)
+        roots = parents[members]
+        # Follow the parents of all tiles at once until they all are roots.
+        while True:
+            grandparents = parents[roots]
+            if np.array_equal(grandparents, roots):
+                break
+            roots = grandparents
+        keys = np.array(self.keys, dtype=np.int64)
+        return keys[members], keys[roots]
+
+    def to_arrays(self) -> "_CheckpointArrays":
+        """Tile columns sorted by tile, with the cluster roots as parents."""
+        keys = np.array(self.keys, dtype=np.int64)
+        order = np.argsort(keys)
+        parents = np.array(self.parents, dtype=np.int32)
+        in_cluster = parents != -1
+        parent_keys = keys.copy()
+        parent_keys[in_cluster] = self.cluster_members()[1]
+        is_root = parents == np.arange(len(parents))
+        sizes = np.where(is_root, np.array(self.sizes, dtype=np.int32), 0)
+        x, y = _split_tile_keys(keys[order])
+        parent_x, parent_y = _split_tile_keys(parent_keys[order])
+        return _CheckpointArrays(
+            x=x,
+            y=y,
+            neighbor_count=np.array(self.neighbor_counts, dtype=np.int8)[order],
+            in_cluster=in_cluster[order],
+            parent_x=parent_x,
+            parent_y=parent_y,
+            size=sizes[order],
+        )
+
+    def num_bytes(self) -> int:
+        """Approximate memory use of the state."""
+        arrays = [self.keys, self.neighbor_counts, self.parents, self.sizes]
+        return (
+            sum(a.itemsize * len(a) for a in arrays)
+            + self._sorted_keys.itemsize * len(self._sorted_keys)
+            + self._sorted_indices.itemsize * len(self._sorted_indices)
+            + 100 * len(self._recent)
+        )
+
+    def _index(self, key: int) -> int:
+        """Index of the tile with the key, -1 if it hasn't been visited."""
+        index = self._recent.get(key)
+        if index is not None:
+            return index
+        position = bisect.bisect_left(self._sorted_keys, key)
+        if position < len(self._sorted_keys) and self._sorted_keys[position] == key:
+            return self._sorted_indices[position]
+        return -1
+
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Like `_index`, for many keys at once."""
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if self._sorted_keys:
+            sorted_keys = np.frombuffer(self._sorted_keys, dtype=np.int64)
+            position = np.minimum(
+                np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1
+            )
+            found = sorted_keys[position] == keys
+            sorted_indices = np.frombuffer(self._sorted_indices, dtype=np.int32)
+            result[found] = sorted_indices[position[found]]
+        if self._recent:
+            missing = np.flatnonzero(result == -1)
+            result[missing] = [
+                self._recent.get(key, -1) for key in keys[missing].tolist()
+            ]
+        return result
+
+    def _append(self, keys: np.ndarray) -> None:
+        start = len(self.keys)
+        self.keys.frombytes(keys.astype(np.int64).tobytes())
+        self.neighbor_counts.frombytes(bytes(len(keys)))
+        self.parents.frombytes(np.full(len(keys), -1, dtype=np.int32).tobytes())
+        self.sizes.frombytes(np.zeros(len(keys), dtype=np.int32).tobytes())
+        self._recent.update(zip(keys.tolist(), range(start, len(self.keys))))
+        if len(self._recent) > max(_MIN_RECENT_TILES, len(self.keys) // 8):
+            self._sort_recent()
+
+    def _sort_recent(self) -> None:
+        keys = np.concatenate(
+            [
+                np.array(self._sorted_keys, dtype=np.int64),
+                np.fromiter(self._recent, dtype=np.int64),
+            ]
+        )
+        indices = np.concatenate(
+            [
+                np.array(self._sorted_indices, dtype=np.int32),
+                np.fromiter(self._recent.values(), dtype=np.int32),
+            ]
+        )
+        order = np.argsort(keys)
+        self._sorted_keys = array.array("q", keys[order].tobytes())
+        self._sorted_indices = array.array("i", indices[order].tobytes())
+        self._recent = {}
+
+    def _activate(self, index: int) -> None:
+        self.parents[index] = index
+        self.sizes[index] = 1
+        self.max_cluster_size = max(self.max_cluster_size, 1)
+        key = self.keys[index]
+        for offset in _NEIGHBOR_OFFSETS:
+            other = self._index(key + offset)
+            if other != -1 and self.parents[other] != -1:
+                self._union(index, other)
+
+    def _root(self, index: int) -> int:
+        """Like `_find`, but without modifying the state."""
+        while self.parents[index] != index:
+            index = self.parents[index]
+        return index
+
+    def _find(self, index: int) -> int:
+        root = self._root(index)
+        while self.parents[index] != root:
+            self.parents[index], index = root, self.parents[index]
+        return root
+
+    def _union(self, left: int, right: int) -> None:
+        left = self._find(left)
+        right = self._find(right)
+        if left == right:
+            return
+        if self.sizes[left] < self.sizes[right]:
+            left, right = right, left
+        self.parents[right] = left
+        self.sizes[left] += self.sizes[right]
+        self.max_cluster_size = max(self.max_cluster_size, self.sizes[left])
+
+
+# The sorted keys are rebuilt when this many tiles, or an eighth of all tiles,
+# have been added since.
+_MIN_RECENT_TILES = 4096
+_KEY_X_STEP = 2**32
+_KEY_Y_OFFSET = 2**31
+
+
+def _tile_key(tile_x: int, tile_y: int) -> int:
+    """One integer per tile that sorts like the tiles."""
+    return tile_x * _KEY_X_STEP + tile_y + _KEY_Y_OFFSET
+
+
+def _tile_keys(tile_x: np.ndarray, tile_y: np.ndarray) -> np.ndarray:
+    return tile_x.astype(np.int64) * _KEY_X_STEP + (
+        tile_y.astype(np.int64) + _KEY_Y_OFFSET
+    )
+
+
+def _key_to_tile(key: int) -> tuple[int, int]:
+    return key >> 32, (key & (_KEY_X_STEP - 1)) - _KEY_Y_OFFSET
+
+
+def _split_tile_keys(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        (keys >> 32).astype(np.int32),
+        ((keys & (_KEY_X_STEP - 1)) - _KEY_Y_OFFSET).astype(np.int32),
+    )
+
+
+# Differences between the keys of the tiles next to a tile and its own key, in
+# the order of `adjacent_to`.
+_NEIGHBOR_OFFSETS = (_KEY_X_STEP, -_KEY_X_STEP, 1, -1)
 
 
 CLUSTER_CHECKPOINT_INTERVAL = 1_000
+CLUSTER_KEYFRAME_INTERVAL = 10
+
+
+class _CheckpointArrays(NamedTuple):
+    """Per-tile columns of a replay state, sorted by tile."""
+
+    x: np.ndarray
+    y: np.ndarray
+    neighbor_count: np.ndarray
+    in_cluster: np.ndarray
+    # Parents of tiles outside of clusters are the tiles themselves.
+    parent_x: np.ndarray
+    parent_y: np.ndarray
+    # Cluster size for the roots, zero for all other tiles.
+    size: np.ndarray
+
+    def keys(self) -> np.ndarray:
+        return _tile_keys(self.x, self.y)
+
+    def take(self, index: np.ndarray) -> "_CheckpointArrays":
+        return _CheckpointArrays(*(column[index] for column in self))
+
+
+# Checkpoint payloads start with the format version, the event index of the
+# checkpoint that they are relative to (0 for the empty state) and the number
+# of tiles. A zlib compressed body with the tile columns follows.
+_CHECKPOINT_HEADER = struct.Struct("<BiI")
+_CHECKPOINT_VERSION = 1
+
+
+def _keyframe_event_index(event_index: int) -> int:
+    """Event index of the checkpoint that a checkpoint is stored relative to.
+
+    Every `CLUSTER_KEYFRAME_INTERVAL`-th checkpoint holds the whole state, the
+    others only the tiles that have changed since then.
+    """
+    keyframe_interval = CLUSTER_CHECKPOINT_INTERVAL * CLUSTER_KEYFRAME_INTERVAL
+    keyframe = event_index // keyframe_interval * keyframe_interval
+    return 0 if keyframe == event_index else keyframe
+
+
+def _encode_checkpoint(
+    arrays: _CheckpointArrays,
+    base_event_index: int,
+    base: _CheckpointArrays | None,
+) -> bytes:
+    if base is not None and len(base.x):
+        keys = arrays.keys()
+        base_keys = base.keys()
+        position = np.minimum(np.searchsorted(base_keys, keys), len(base_keys) - 1)
+        changed = base_keys[position] != keys
+        for column, base_column in zip(arrays, base):
+            changed |= column != base_column[position]
+        arrays = arrays.take(changed)
+    body = b"".join(
+        [
+            np.diff(arrays.x, prepend=0).astype("<i4").tobytes(),
+            arrays.y.astype("<i4").tobytes(),
+            (arrays.parent_x - arrays.x).astype("<i4").tobytes(),
+            (arrays.parent_y - arrays.y).astype("<i4").tobytes(),
+            arrays.size.astype("<i4").tobytes(),
+            (arrays.neighbor_count | (arrays.in_cluster.astype(np.int8) << 3))
+            .astype("i1")
+            .tobytes(),
+        ]
+    )
+    return _CHECKPOINT_HEADER.pack(
+        _CHECKPOINT_VERSION, base_event_index, len(arrays.x)
+    ) + zlib.compress(body)
+
+
+def _decode_checkpoint(payload: bytes) -> tuple[int, _CheckpointArrays]:
+    """Event index of the base checkpoint and the tile columns of a payload."""
+    version, base_event_index, num_tiles = _CHECKPOINT_HEADER.unpack_from(payload)
+    if version != _CHECKPOINT_VERSION:
+        raise ValueError(f"Unknown cluster checkpoint format {version}.")
+    body = zlib.decompress(memoryview(payload)[_CHECKPOINT_HEADER.size :])
+    columns = np.frombuffer(body, dtype="<i4", count=5 * num_tiles).reshape(
+        5, num_tiles
+    )
+    flags = np.frombuffer(body, dtype="i1", offset=20 * num_tiles, count=num_tiles)
+    x = np.cumsum(columns[0], dtype=np.int32)
+    return base_event_index, _CheckpointArrays(
+        x=x,
+        y=columns[1],
+        neighbor_count=flags & 7,
+        in_cluster=(flags & 8) != 0,
+        parent_x=x + columns[2],
+        parent_y=columns[1] + columns[3],
+        size=columns[4],
+    )
 
 
-def _find_root(
-    parents: dict[tuple[int, int], tuple[int, int]], tile: tuple[int, int]
-) -> tuple[int, int]:
-    root = tile
-    while parents[root] != root:
-        root = parents[root]
-    while parents[tile] != tile:
-        parent = parents[tile]
-        parents[tile] = root
-        tile = parent
-    return root
+def _load_checkpoint_arrays(zoom: int, event_index: int) -> _CheckpointArrays:
+    """Tile columns of a checkpoint that holds the whole state."""
+    payload = DB.session.scalars(
+        sa.select(ClusterHistoryCheckpoint.payload).where(
+            ClusterHistoryCheckpoint.zoom == zoom,
+            ClusterHistoryCheckpoint.event_index == event_index,
+        )
+    ).one()
+    base_event_index, arrays = _decode_checkpoint(payload)
+    assert base_event_index == 0, base_event_index
+    return arrays
+
+
+def _state_from_checkpoint(
+    zoom: int, checkpoint: ClusterHistoryCheckpoint
+) -> ClusterReplayState:
+    base_event_index, arrays = _decode_checkpoint(checkpoint.payload)
+    if base_event_index:
+        arrays = _merge_checkpoint_arrays(
+            _load_checkpoint_arrays(zoom, base_event_index), arrays
+        )
+    return ClusterReplayState.from_arrays(arrays)
+
+
+def _merge_checkpoint_arrays(
+    base: _CheckpointArrays, changed: _CheckpointArrays
+) -> _CheckpointArrays:
+    """Tile columns of a keyframe with the rows of a delta checkpoint applied."""
+    unchanged = ~np.isin(base.keys(), changed.keys())
+    merged = _CheckpointArrays(
+        *(
+            np.concatenate([column[unchanged], changed_column])
+            for column, changed_column in zip(base, changed)
+        )
+    )
+    return merged.take(np.argsort(merged.keys(), kind="stable"))
 
 
-def _union_roots(
-    state: ClusterReplayState,
-    left: tuple[int, int],
-    right: tuple[int, int],
-) -> None:
-    left_root = _find_root(state.parents, left)
-    right_root = _find_root(state.parents, right)
-    if left_root == right_root:
-        return
-    if state.component_sizes[left_root] < state.component_sizes[right_root]:
-        left_root, right_root = right_root, left_root
-    state.parents[right_root] = left_root
-    state.component_sizes[left_root] += state.component_sizes[right_root]
-    del state.component_sizes[right_root]
-    if state.component_sizes[left_root] > state.max_cluster_size:
-        state.max_cluster_size = state.component_sizes[left_root]
-
-
-def _activate_cluster_tile(state: ClusterReplayState, tile: tuple[int, int]) -> None:
-    if tile in state.cluster_tiles:
-        return
-    state.cluster_tiles.add(tile)
-    state.parents[tile] = tile
-    state.component_sizes[tile] = 1
-    if state.max_cluster_size < 1:
-        state.max_cluster_size = 1
-    for other in adjacent_to(tile):
-        if other in state.cluster_tiles:
-            _union_roots(state, tile, other)
-
-
-def apply_cluster_history_event(
-    state: ClusterReplayState, tile: tuple[int, int]
-) -> int | None:
-    if tile in state.visited_tiles:
+def compute_tile_evolution(config: UiConfig) -> None:
+    changed_zooms = []
+    for zoom in config.explorer_zoom_levels:
+        new_tiles = _get_new_tile_history(zoom)
+        if new_tiles is None:
+            logger.info(f"Computing the explorer evolution for {zoom=} from scratch.")
+            tile_history = get_tile_history_df(zoom)
+            rebuild_cluster_history_for_zoom(zoom, tile_history)
+            state = TileEvolutionState()
+            _compute_cluster_evolution(tile_history, state)
+            _compute_square_history(tile_history, state, zoom)
+            _delete_evolution_from_db(zoom)
+            _persist_evolution_to_db(zoom, state, len(tile_history))
+            changed_zooms.append(zoom)
+        elif len(new_tiles):
+            num_events = get_cluster_history_latest_event_index(zoom)
+            replay_state = get_cluster_state_at_cutoff(zoom, num_events)
+            state = _evolution_state_from_replay(zoom, replay_state)
+            _append_cluster_history_for_zoom(zoom, new_tiles, replay_state, num_events)
+            _compute_cluster_evolution(new_tiles, state)
+            _compute_square_history(new_tiles, state, zoom)
+            _persist_evolution_to_db(zoom, state, num_events + len(new_tiles))
+            changed_zooms.append(zoom)
+    bump_explorer_state_version(changed_zooms)
+
+
+def _get_new_tile_history(zoom: int) -> pd.DataFrame | None:
+    """First visits that come after the cluster history, in chronological order.
+
+    The history can only be continued if all recorded events still match the
+    first visits, and all other first visits sort after the last event. This is
+    not the case after an older activity has been imported late, or after
+    activities have been deleted. Then `None` is returned and everything has to
+    be computed again.
+    """
+    num_events = get_cluster_history_latest_event_index(zoom)
+    square = DB.session.get(ExplorerSquare, zoom)
+    if square is None or square.event_index != num_events:
         return None
-    previous_max = state.max_cluster_size
-    state.visited_tiles.add(tile)
-    state.neighbor_counts.setdefault(tile, 0)
-
-    for other in adjacent_to(tile):
-        if other in state.visited_tiles:
-            state.neighbor_counts[tile] += 1
-            state.neighbor_counts[other] = state.neighbor_counts.get(other, 0) + 1
-            if state.neighbor_counts[other] == 4:
-                _activate_cluster_tile(state, other)
-
-    if state.neighbor_counts[tile] == 4:
-        _activate_cluster_tile(state, tile)
-
-    if state.max_cluster_size > previous_max:
-        return state.max_cluster_size
-    return None
-
-
-def _state_to_payload(state: ClusterReplayState) -> str:
-    payload = {
-        "visited_tiles": [list(tile) for tile in sorted(state.visited_tiles)],
-        "neighbor_counts": [
-            [tile[0], tile[1], count]
-            for tile, count in sorted(state.neighbor_counts.items())
-        ],
-        "cluster_tiles": [list(tile) for tile in sorted(state.cluster_tiles)],
-        "parents": [
-            [tile[0], tile[1], parent[0], parent[1]]
-            for tile, parent in sorted(state.parents.items())
-        ],
-        "component_sizes": [
-            [tile[0], tile[1], size]
-            for tile, size in sorted(state.component_sizes.items())
-        ],
-        "max_cluster_size": state.max_cluster_size,
-    }
-    return json.dumps(payload, separators=(",", ":"))
 
+    num_matching = DB.session.scalar(
+        sa.select(sa.func.count())
+        .select_from(ClusterHistoryEvent)
+        .join(
+            TileVisit,
+            sa.and_(
+                TileVisit.zoom == ClusterHistoryEvent.zoom,
+                TileVisit.tile_x == ClusterHistoryEvent.tile_x,
+                TileVisit.tile_y == ClusterHistoryEvent.tile_y,
+            ),
+        )
+        .where(
+            ClusterHistoryEvent.zoom == zoom,
+            TileVisit.first_activity_id == ClusterHistoryEvent.activity_id,
+            TileVisit.first_time.is_not_distinct_from(ClusterHistoryEvent.time),
+        )
+    )
+    if num_matching != num_events:
+        return None
 
-def _state_from_payload(payload_json: str) -> ClusterReplayState:
-    raw = json.loads(payload_json)
-    state = ClusterReplayState()
-    state.visited_tiles = {tuple(tile) for tile in raw.get("visited_tiles", [])}
-    state.neighbor_counts = {
-        (entry[0], entry[1]): entry[2] for entry in raw.get("neighbor_counts", [])
-    }
-    state.cluster_tiles = {tuple(tile) for tile in raw.get("cluster_tiles", [])}
-    state.parents = {
-        (entry[0], entry[1]): (entry[2], entry[3]) for entry in raw.get("parents", [])
-    }
-    state.component_sizes = {
-        (entry[0], entry[1]): entry[2] for entry in raw.get("component_sizes", [])
-    }
-    state.max_cluster_size = raw.get("max_cluster_size", 0)
+    query = sa.select(
+        TileVisit.first_activity_id.label("activity_id"),
+        TileVisit.first_time.label("time"),
+        TileVisit.tile_x,
+        TileVisit.tile_y,
+    ).where(TileVisit.zoom == zoom)
+    if num_events:
+        # The latest event index is taken from this row, so it exists.
+        last = DB.session.scalars(
+            sa.select(ClusterHistoryEvent).where(
+                ClusterHistoryEvent.zoom == zoom,
+                ClusterHistoryEvent.event_index == num_events,
+            )
+        ).one()
+        # Same order as `get_tile_history_df`, where missing times come first.
+        rest_is_later = sa.tuple_(
+            TileVisit.first_activity_id, TileVisit.tile_x, TileVisit.tile_y
+        ) > sa.tuple_(
+            sa.literal(last.activity_id),
+            sa.literal(last.tile_x),
+            sa.literal(last.tile_y),
+        )
+        if last.time is None:
+            query = query.where(
+                sa.or_(
+                    TileVisit.first_time.is_not(None),
+                    sa.and_(TileVisit.first_time.is_(None), rest_is_later),
+                )
+            )
+        else:
+            query = query.where(
+                sa.or_(
+                    TileVisit.first_time > last.time,
+                    sa.and_(TileVisit.first_time == last.time, rest_is_later),
+                )
+            )
+    rows = DB.session.execute(
+        query.order_by(
+            TileVisit.first_time,
+            TileVisit.first_activity_id,
+            TileVisit.tile_x,
+            TileVisit.tile_y,
+        )
+    ).all()
+
+    num_tiles = DB.session.scalar(
+        sa.select(sa.func.count()).select_from(TileVisit).where(TileVisit.zoom == zoom)
+    )
+    if num_events + len(rows) != num_tiles:
+        return None
+    return pd.DataFrame(
+        {
+            "activity_id": [row.activity_id for row in rows],
+            "time": [pd.Timestamp(row.time) if row.time else pd.NaT for row in rows],
+            "tile_x": [row.tile_x for row in rows],
+            "tile_y": [row.tile_y for row in rows],
+        }
+    )
+
+
+def _evolution_state_from_replay(
+    zoom: int, replay_state: ClusterReplayState
+) -> TileEvolutionState:
+    """Evolution state that continues from the persisted one."""
+    state = TileEvolutionState()
+    state.clusters = replay_state.copy()
+    state.visited_tiles = replay_state.tiles()
+    state.max_cluster_size = (
+        DB.session.scalar(
+            sa.select(sa.func.max(ClusterSizeHistory.max_cluster_size)).where(
+                ClusterSizeHistory.zoom == zoom
+            )
+        )
+        or 0
+    )
+    state.square_x, state.square_y, state.max_square_size = get_explorer_square(zoom)
     return state
 
 
-def compute_tile_evolution(config: UiConfig) -> None:
-    for zoom in config.explorer_zoom_levels:
-        # Get tile history from database
-        tile_history = get_tile_history_df(zoom)
-        rebuild_cluster_history_for_zoom(zoom, tile_history)
-        # Recompute from the full history each time and persist to the database.
-        state = TileEvolutionState()
-        _compute_cluster_evolution(tile_history, state, zoom)
-        _compute_square_history(tile_history, state, zoom)
-        _persist_evolution_to_db(zoom, state)
-
-
-def _persist_evolution_to_db(zoom: int, state: "TileEvolutionState") -> None:
-    """Write the square state and evolution plot series of a zoom to the database."""
-    DB.session.query(ExplorerSquare).filter(ExplorerSquare.zoom == zoom).delete()
+def _delete_evolution_from_db(zoom: int) -> None:
     DB.session.query(SquareHistory).filter(SquareHistory.zoom == zoom).delete()
     DB.session.query(ClusterSizeHistory).filter(
         ClusterSizeHistory.zoom == zoom
     ).delete()
 
-    DB.session.add(
+
+def _persist_evolution_to_db(
+    zoom: int, state: "TileEvolutionState", event_index: int
+) -> None:
+    """Write the square state and new rows of the evolution plot series."""
+    DB.session.merge(
         ExplorerSquare(
             zoom=zoom,
             square_x=state.square_x,
             square_y=state.square_y,
             max_square_size=state.max_square_size,
+            event_index=event_index,
         )
     )
 
@@ -266,34 +711,92 @@ def rebuild_cluster_history_for_zoom(zoom: int, tile_history: pd.DataFrame) -> N
         ClusterHistoryCheckpoint.zoom == zoom
     ).delete()
     DB.session.query(ClusterMembership).filter(ClusterMembership.zoom == zoom).delete()
+    # The square and the evolution series don't belong to this history.
+    DB.session.query(ExplorerSquare).filter(ExplorerSquare.zoom == zoom).update(
+        {ExplorerSquare.event_index: None}
+    )
+    _bump_cluster_history_version(zoom)
 
     state = ClusterReplayState()
+    _extend_cluster_history(zoom, tile_history, state, 0)
+    _materialize_cluster_membership(zoom, state)
+
+    DB.session.commit()
+
+
+def _append_cluster_history_for_zoom(
+    zoom: int, new_tiles: pd.DataFrame, state: ClusterReplayState, num_events: int
+) -> None:
+    """Continue the cluster history of a zoom level with the given first visits.
+
+    `state` has to be the replay state after the existing `num_events` events.
+    """
+    if num_events % CLUSTER_CHECKPOINT_INTERVAL != 0:
+        # This checkpoint was only written because the history ended there.
+        DB.session.query(ClusterHistoryCheckpoint).filter(
+            ClusterHistoryCheckpoint.zoom == zoom,
+            ClusterHistoryCheckpoint.event_index == num_events,
+        ).delete()
+    _extend_cluster_history(zoom, new_tiles, state, num_events)
+    _update_cluster_membership(zoom, state)
+
+    DB.session.commit()
+
+
+def _extend_cluster_history(
+    zoom: int, tiles: pd.DataFrame, state: ClusterReplayState, num_events: int
+) -> None:
+    """Add events and checkpoints for the tiles after the first `num_events`."""
     event_batch: list[ClusterHistoryEvent] = []
     checkpoint_batch: list[ClusterHistoryCheckpoint] = []
-
-    for event_index, row in enumerate(tile_history.itertuples(index=False), start=1):
-        tile = (int(row.tile_x), int(row.tile_y))
+    keyframes: dict[int, _CheckpointArrays] = {}
+
+    def make_payload(event_index: int) -> bytes:
+        arrays = state.to_arrays()
+        base_event_index = _keyframe_event_index(event_index)
+        if base_event_index == 0:
+            if (
+                event_index % (CLUSTER_CHECKPOINT_INTERVAL * CLUSTER_KEYFRAME_INTERVAL)
+                == 0
+            ):
+                keyframes.clear()
+                keyframes[event_index] = arrays
+            return _encode_checkpoint(arrays, 0, None)
+        if base_event_index not in keyframes:
+            keyframes[base_event_index] = _load_checkpoint_arrays(
+                zoom, base_event_index
+            )
+        return _encode_checkpoint(arrays, base_event_index, keyframes[base_event_index])
+
+    # The state is brought up to date before each checkpoint.
+    tile_x = tiles["tile_x"].to_numpy(dtype=np.int64)
+    tile_y = tiles["tile_y"].to_numpy(dtype=np.int64)
+    num_visited = 0
+    for position, row in enumerate(tiles.itertuples(index=False)):
+        event_index = num_events + position + 1
         event_batch.append(
             ClusterHistoryEvent(
                 zoom=zoom,
                 event_index=event_index,
                 activity_id=int(row.activity_id),
                 time=(row.time.to_pydatetime() if pd.notna(row.time) else None),
-                tile_x=tile[0],
-                tile_y=tile[1],
+                tile_x=int(row.tile_x),
+                tile_y=int(row.tile_y),
             )
         )
 
-        apply_cluster_history_event(state, tile)
-
         if event_index % CLUSTER_CHECKPOINT_INTERVAL == 0:
+            state.visit_many(
+                tile_x[num_visited : position + 1], tile_y[num_visited : position + 1]
+            )
+            num_visited = position + 1
             checkpoint_batch.append(
                 ClusterHistoryCheckpoint(
                     zoom=zoom,
                     event_index=event_index,
                     time=(row.time.to_pydatetime() if pd.notna(row.time) else None),
                     max_cluster_size=state.max_cluster_size,
-                    payload_json=_state_to_payload(state),
+                    payload=make_payload(event_index),
                 )
             )
 
@@ -306,37 +809,34 @@ def rebuild_cluster_history_for_zoom(zoom: int, tile_history: pd.DataFrame) -> N
 
     if event_batch:
         DB.session.add_all(event_batch)
-    if len(tile_history) > 0 and len(tile_history) % CLUSTER_CHECKPOINT_INTERVAL != 0:
-        last = tile_history.iloc[-1]
+    state.visit_many(tile_x[num_visited:], tile_y[num_visited:])
+    last_index = num_events + len(tiles)
+    if len(tiles) > 0 and last_index % CLUSTER_CHECKPOINT_INTERVAL != 0:
+        last = tiles.iloc[-1]
         checkpoint_batch.append(
             ClusterHistoryCheckpoint(
                 zoom=zoom,
-                event_index=len(tile_history),
+                event_index=last_index,
                 time=(last["time"].to_pydatetime() if pd.notna(last["time"]) else None),
                 max_cluster_size=state.max_cluster_size,
-                payload_json=_state_to_payload(state),
+                payload=make_payload(last_index),
             )
         )
     if checkpoint_batch:
         DB.session.add_all(checkpoint_batch)
 
-    _materialize_cluster_membership(zoom, state)
-
-    DB.session.commit()
-
 
 def _materialize_cluster_membership(zoom: int, state: ClusterReplayState) -> None:
     """Persist the final cluster membership of a replay state for a zoom level."""
     batch: list[ClusterMembership] = []
-    for tile in state.cluster_tiles:
-        root = _find_root(state.parents, tile)
+    for tile_x, tile_y, cluster_x, cluster_y in _cluster_member_rows(state):
         batch.append(
             ClusterMembership(
                 zoom=zoom,
-                tile_x=tile[0],
-                tile_y=tile[1],
-                cluster_x=root[0],
-                cluster_y=root[1],
+                tile_x=tile_x,
+                tile_y=tile_y,
+                cluster_x=cluster_x,
+                cluster_y=cluster_y,
             )
         )
         if len(batch) >= 1_000:
@@ -346,6 +846,60 @@ def _materialize_cluster_membership(zoom: int, state: ClusterReplayState) -> Non
         DB.session.add_all(batch)
 
 
+def _cluster_member_rows(
+    state: ClusterReplayState,
+) -> Iterable[tuple[int, int, int, int]]:
+    """Cluster tiles of a replay state with the representative tiles of their clusters."""
+    keys, root_keys = state.cluster_members()
+    tile_x, tile_y = _split_tile_keys(keys)
+    cluster_x, cluster_y = _split_tile_keys(root_keys)
+    return zip(tile_x.tolist(), tile_y.tolist(), cluster_x.tolist(), cluster_y.tolist())
+
+
+def _update_cluster_membership(zoom: int, state: ClusterReplayState) -> None:
+    """Bring the persisted cluster membership in line with a replay state.
+
+    Tiles only join clusters as the history grows, so only new tiles and tiles
+    of merged clusters are written.
+    """
+    existing = {
+        (row.tile_x, row.tile_y): (row.id, row.cluster_x, row.cluster_y)
+        for row in DB.session.execute(
+            sa.select(
+                ClusterMembership.id,
+                ClusterMembership.tile_x,
+                ClusterMembership.tile_y,
+                ClusterMembership.cluster_x,
+                ClusterMembership.cluster_y,
+            ).where(ClusterMembership.zoom == zoom)
+        )
+    }
+    new_rows: list[dict] = []
+    changed_rows: list[dict] = []
+    for tile_x, tile_y, cluster_x, cluster_y in _cluster_member_rows(state):
+        tile = (tile_x, tile_y)
+        root = (cluster_x, cluster_y)
+        row = existing.get(tile)
+        if row is None:
+            new_rows.append(
+                {
+                    "zoom": zoom,
+                    "tile_x": tile[0],
+                    "tile_y": tile[1],
+                    "cluster_x": root[0],
+                    "cluster_y": root[1],
+                }
+            )
+        elif row[1:] != root:
+            changed_rows.append(
+                {"id": row[0], "cluster_x": root[0], "cluster_y": root[1]}
+            )
+    if new_rows:
+        DB.session.execute(sa.insert(ClusterMembership), new_rows)
+    if changed_rows:
+        DB.session.execute(sa.update(ClusterMembership), changed_rows)
+
+
 def get_cluster_membership_in_bounds(
     zoom: int, x_min: int, x_max: int, y_min: int, y_max: int
 ) -> dict[tuple[int, int], tuple[int, int]]:
@@ -462,10 +1016,11 @@ def get_cluster_history_latest_event_index(zoom: int) -> int:
 
 
 def get_cluster_tiles_at_cutoff(zoom: int, event_index: int) -> set[tuple[int, int]]:
-    return set(get_cluster_state_at_cutoff(zoom, event_index).cluster_tiles)
+    return get_cached_cluster_state_at_cutoff(zoom, event_index).cluster_tiles()
 
 
 def get_cluster_state_at_cutoff(zoom: int, event_index: int) -> ClusterReplayState:
+    """Replay state after the first `event_index` events, for the caller to modify."""
     if event_index <= 0:
         return ClusterReplayState()
 
@@ -482,11 +1037,18 @@ def get_cluster_state_at_cutoff(zoom: int, event_index: int) -> ClusterReplaySta
         state = ClusterReplayState()
         start_event_index = 0
     else:
-        state = _state_from_payload(checkpoint.payload_json)
+        state = _state_from_checkpoint(zoom, checkpoint)
         start_event_index = checkpoint.event_index
 
-    events = DB.session.scalars(
-        sa.select(ClusterHistoryEvent)
+    _replay_cluster_events(state, zoom, start_event_index, event_index)
+    return state
+
+
+def _replay_cluster_events(
+    state: ClusterReplayState, zoom: int, start_event_index: int, event_index: int
+) -> None:
+    events = DB.session.execute(
+        sa.select(ClusterHistoryEvent.tile_x, ClusterHistoryEvent.tile_y)
         .where(
             ClusterHistoryEvent.zoom == zoom,
             ClusterHistoryEvent.event_index > start_event_index,
@@ -494,9 +1056,178 @@ def get_cluster_state_at_cutoff(zoom: int, event_index: int) -> ClusterReplaySta
         )
         .order_by(ClusterHistoryEvent.event_index)
     ).all()
-    for event in events:
-        apply_cluster_history_event(state, (event.tile_x, event.tile_y))
-    return state
+    state.visit_many(
+        np.array([event.tile_x for event in events], dtype=np.int64),
+        np.array([event.tile_y for event in events], dtype=np.int64),
+    )
+
+
+def get_cluster_history_version(zoom: int) -> int:
+    version = DB.session.scalar(
+        sa.select(ClusterHistoryVersion.version).where(
+            ClusterHistoryVersion.zoom == zoom
+        )
+    )
+    return int(version or 0)
+
+
+def _bump_cluster_history_version(zoom: int) -> None:
+    statement = sqlite_insert(ClusterHistoryVersion).values(zoom=zoom, version=1)
+    DB.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ClusterHistoryVersion.zoom],
+            set_={"version": ClusterHistoryVersion.version + 1},
+        )
+    )
+
+
+class ClusterStateCache:
+    """Replayed cluster states for the history slider, shared by request threads.
+
+    States are keyed by zoom, event index and `ClusterHistoryVersion`. A missing
+    state is replayed forward from the closest earlier cached state, unless a
+    checkpoint is closer. The size of all states is bounded, the least
+    recently used ones are dropped first. Replays happen outside of the lock.
+    Requests for a state that is being replayed wait for that replay instead
+    of starting their own, like the tiles of one viewport. The states are
+    shared and must not be modified.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._engine: sa.Engine | None = None
+        self._states: OrderedDict[tuple[int, int, int], ClusterReplayState] = (
+            OrderedDict()
+        )
+        self._num_bytes = 0
+        self._in_flight: dict[
+            tuple[int, int, int], concurrent.futures.Future[ClusterReplayState]
+        ] = {}
+
+    def get(self, zoom: int, event_index: int) -> ClusterReplayState:
+        key = (zoom, max(event_index, 0), get_cluster_history_version(zoom))
+        with self._lock:
+            if self._engine is not DB.engine:
+                self._states.clear()
+                self._num_bytes = 0
+                self._in_flight.clear()
+                self._engine = DB.engine
+            state = self._states.get(key)
+            if state is not None:
+                self.hits += 1
+                self._states.move_to_end(key)
+                return state
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                self.misses += 1
+                future: concurrent.futures.Future[ClusterReplayState] = (
+                    concurrent.futures.Future()
+                )
+                self._in_flight[key] = future
+                base_event_index, base = self._closest_state(*key)
+            else:
+                self.hits += 1
+        if in_flight is not None:
+            return in_flight.result()
+
+        try:
+            state = self._replay(zoom, key[1], base_event_index, base)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # The cache might have been reset for another database meanwhile.
+            if self._in_flight.pop(key, None) is future:
+                self._put(key, state)
+        future.set_result(state)
+        logger.debug(
+            f"Replayed cluster state {key}, {self.hits} hits and "
+            f"{self.misses} misses so far."
+        )
+        return state
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "states": len(self._states),
+                "bytes": self._num_bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+            self._num_bytes = 0
+
+    def _closest_state(
+        self, zoom: int, event_index: int, version: int
+    ) -> tuple[int, ClusterReplayState | None]:
+        """Latest cached state at or before the event index, with its index."""
+        # States of a replaced history won't be asked for again.
+        for key in [
+            key for key in self._states if key[0] == zoom and key[2] != version
+        ]:
+            self._remove(key)
+        return max(
+            (
+                (key[1], state)
+                for key, state in self._states.items()
+                if key[0] == zoom and key[1] <= event_index
+            ),
+            key=lambda item: item[0],
+            default=(0, None),
+        )
+
+    def _replay(
+        self,
+        zoom: int,
+        event_index: int,
+        base_event_index: int,
+        base: ClusterReplayState | None,
+    ) -> ClusterReplayState:
+        checkpoint_event_index = DB.session.scalar(
+            sa.select(sa.func.max(ClusterHistoryCheckpoint.event_index)).where(
+                ClusterHistoryCheckpoint.zoom == zoom,
+                ClusterHistoryCheckpoint.event_index <= event_index,
+            )
+        )
+        if base is None or base_event_index < (checkpoint_event_index or 0):
+            return get_cluster_state_at_cutoff(zoom, event_index)
+        state = base.copy()
+        _replay_cluster_events(state, zoom, base_event_index, event_index)
+        return state
+
+    def _put(self, key: tuple[int, int, int], state: ClusterReplayState) -> None:
+        size = _estimate_replay_state_bytes(state)
+        if size > self.max_bytes:
+            return
+        self._states[key] = state
+        self._num_bytes += size
+        while self._num_bytes > self.max_bytes:
+            self._remove(next(iter(self._states)))
+
+    def _remove(self, key: tuple[int, int, int]) -> None:
+        self._num_bytes -= _estimate_replay_state_bytes(self._states.pop(key))
+
+
+def _estimate_replay_state_bytes(state: ClusterReplayState) -> int:
+    return 1024 + state.num_bytes()
+
+
+cluster_state_cache = ClusterStateCache()
+
+
+def get_cached_cluster_state_at_cutoff(
+    zoom: int, event_index: int
+) -> ClusterReplayState:
+    """Like `get_cluster_state_at_cutoff`, but shared and not to be modified."""
+    return cluster_state_cache.get(zoom, event_index)
 
 
 def get_cluster_tile_diff_for_activity(
@@ -521,165 +1252,172 @@ def get_cluster_tile_activations_df(zoom: int) -> pd.DataFrame:
             columns=["time", "event_index", "activity_id", "tile_x", "tile_y"]
         )
 
-    state = ClusterReplayState()
-    rows: list[dict[str, object]] = []
-    for event in events:
-        event_tile = (event.tile_x, event.tile_y)
-        candidates = [event_tile, *adjacent_to(event_tile)]
-        active_before = {tile for tile in candidates if tile in state.cluster_tiles}
-        apply_cluster_history_event(state, event_tile)
-        for tile in candidates:
-            if tile in active_before or tile not in state.cluster_tiles:
-                continue
-            rows.append(
-                {
-                    "time": pd.Timestamp(event.time)
-                    if event.time is not None
-                    else pd.NaT,
-                    "event_index": event.event_index,
-                    "activity_id": event.activity_id,
-                    "tile_x": tile[0],
-                    "tile_y": tile[1],
-                }
-            )
-    return pd.DataFrame(rows)
-
-
-def _compute_cluster_evolution(
-    tiles: pd.DataFrame, s: TileEvolutionState, zoom: int
-) -> None:
-    if len(s.cluster_evolution) > 0:
-        max_cluster_so_far = s.cluster_evolution["max_cluster_size"].iloc[-1]
-    else:
-        max_cluster_so_far = 0
-
-    rows = []
-    for _index, row in tqdm(
-        tiles.iterrows(),
-        desc=f"Cluster evolution for {zoom=}",
-        delay=1,
-    ):
-        new_clusters = False
-        # Current tile.
-        tile = (row["tile_x"], row["tile_y"])
+    # A tile becomes a cluster tile with the event that visits the last one of
+    # the tile and its four neighbors.
+    keys = _tile_keys(
+        np.array([event.tile_x for event in events], dtype=np.int64),
+        np.array([event.tile_y for event in events], dtype=np.int64),
+    )
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    visits = [np.arange(len(keys))]
+    for offset in _NEIGHBOR_OFFSETS:
+        position = np.minimum(
+            np.searchsorted(sorted_keys, keys + offset), len(keys) - 1
+        )
+        visits.append(
+            np.where(sorted_keys[position] == keys + offset, order[position], -1)
+        )
+    visit_table = np.stack(visits)
+    tiles = np.flatnonzero((visit_table != -1).all(axis=0))
+    activations = visit_table[:, tiles].max(axis=0)
+    by_event = np.lexsort((tiles, activations))
+    tiles = tiles[by_event].tolist()
+    activations = activations[by_event].tolist()
+    return pd.DataFrame(
+        {
+            "time": [
+                pd.Timestamp(events[i].time) if events[i].time is not None else pd.NaT
+                for i in activations
+            ],
+            "event_index": [events[i].event_index for i in activations],
+            "activity_id": [events[i].activity_id for i in activations],
+            "tile_x": [events[i].tile_x for i in tiles],
+            "tile_y": [events[i].tile_y for i in tiles],
+        }
+    )
 
-        if tile in s.num_neighbors:
-            continue
 
-        # This tile is new, therefore it doesn't have an entries in the neighbor list yet.
-        s.num_neighbors[tile] = 0
-
-        # Go through the adjacent tile and check whether there are neighbors.
-        for other in adjacent_to(tile):
-            if other in s.num_neighbors:
-                # The other tile is already visited. That means that the current tile has a neighbor.
-                s.num_neighbors[tile] += 1
-                # Alto the other tile has gained a neighbor.
-                s.num_neighbors[other] += 1
-
-        # If the current tile has all neighbors, make it it's own cluster.
-        if s.num_neighbors[tile] == 4:
-            s.clusters[tile] = [tile]
-            s.memberships[tile] = tile
-
-        # Also make the adjacent tiles their own clusters, if they are full.
-        this_and_neighbors = [tile] + list(adjacent_to(tile))
-        for other in this_and_neighbors:
-            if s.num_neighbors.get(other, 0) == 4:
-                s.clusters[other] = [other]
-                s.memberships[other] = other
-
-        for candidate in this_and_neighbors:
-            # If the the candidate is not a cluster tile, skip.
-            if candidate not in s.memberships:
-                continue
-            # The candidate is a cluster tile. Let's see whether any of the neighbors are also cluster tiles but with a different cluster. Then we need to join them.
-            for other in adjacent_to(candidate):
-                if other not in s.memberships:
-                    continue
-                # The other tile is also a cluster tile.
-                if s.memberships[candidate] == s.memberships[other]:
-                    continue
-                # The two clusters are not the same. We add the other's cluster tile to this tile.
-                this_cluster = s.clusters[s.memberships[candidate]]
-                assert isinstance(other, tuple), other
-                assert isinstance(s.memberships[other], tuple), s.memberships[other]
-                other_cluster = s.clusters[s.memberships[other]]
-                other_cluster_name = s.memberships[other]
-                this_cluster.extend(other_cluster)
-                # Update the other cluster tiles that they now point to the new cluster. This also updates the other tile.
-                for member in other_cluster:
-                    s.memberships[member] = s.memberships[candidate]
-                del s.clusters[other_cluster_name]
-                new_clusters = True
-
-        if new_clusters:
-            max_cluster_size = max(
-                (len(members) for members in s.clusters.values()),
-                default=0,
-            )
-            if max_cluster_size > max_cluster_so_far:
-                rows.append(
-                    {
-                        "time": row["time"],
-                        "max_cluster_size": max_cluster_size,
-                    }
-                )
-                max_cluster_so_far = max_cluster_size
+def _compute_cluster_evolution(tiles: pd.DataFrame, s: TileEvolutionState) -> None:
+    maxima = s.clusters.visit_many(
+        tiles["tile_x"].to_numpy(dtype=np.int64),
+        tiles["tile_y"].to_numpy(dtype=np.int64),
+    )
+    # A single cluster tile doesn't count, the series starts with the first
+    # cluster that two tiles form.
+    previous = np.maximum.accumulate(
+        np.concatenate([[max(s.max_cluster_size, 1)], maxima])
+    )[:-1]
+    grown = np.flatnonzero(maxima > previous)
+    rows = pd.DataFrame(
+        {
+            "time": tiles["time"].iloc[grown].reset_index(drop=True),
+            "max_cluster_size": maxima[grown],
+        }
+    )
+    if len(grown):
+        s.max_cluster_size = int(maxima[grown[-1]])
 
-    new_cluster_evolution = pd.DataFrame(rows)
-    s.cluster_evolution = pd.concat([s.cluster_evolution, new_cluster_evolution])
+    s.cluster_evolution = pd.concat([s.cluster_evolution, rows])
     s.cluster_start = len(tiles)
 
 
 def _compute_square_history(
     tiles: pd.DataFrame, s: TileEvolutionState, zoom: int
 ) -> None:
+    bitmap = _TileBitmap(s.visited_tiles)
     rows = []
-    for _index, row in tqdm(
-        tiles.iterrows(),
+    for time, tile_x, tile_y in tqdm(
+        zip(tiles["time"], tiles["tile_x"], tiles["tile_y"]),
         desc=f"Square evolution for {zoom=}",
+        total=len(tiles),
         delay=1,
     ):
-        tile = (row["tile_x"], row["tile_y"])
+        tile = (tile_x, tile_y)
         if tile in s.visited_tiles:
             continue
-        x, y = tile
         s.visited_tiles.add(tile)
-        for square_size in itertools.count(s.max_square_size + 1):
-            this_tile_size_viable = False
-            for x_offset in range(square_size):
-                for y_offset in range(square_size):
-                    this_offset_viable = True
-                    for xx in range(square_size):
-                        for yy in range(square_size):
-                            if (
-                                x + xx - x_offset,
-                                y + yy - y_offset,
-                            ) not in s.visited_tiles:
-                                this_offset_viable = False
-                                break
-                        if not this_offset_viable:
-                            break
-                    if this_offset_viable:
-                        s.max_square_size = square_size
-                        s.square_x = x - x_offset
-                        s.square_y = y - y_offset
-                        rows.append(
-                            {
-                                "time": row["time"],
-                                "max_square_size": square_size,
-                                "square_x": s.square_x,
-                                "square_y": s.square_y,
-                            }
-                        )
-                        this_tile_size_viable = True
-                        break
-                if this_tile_size_viable:
-                    break
-            if not this_tile_size_viable:
-                break
+        bitmap.add(int(tile_x), int(tile_y))
+        # Every square bigger than the current one has to contain this tile.
+        while corner := _find_square_with_tile(
+            bitmap, int(tile_x), int(tile_y), s.max_square_size + 1
+        ):
+            s.max_square_size += 1
+            s.square_x, s.square_y = corner
+            rows.append(
+                {
+                    "time": time,
+                    "max_square_size": s.max_square_size,
+                    "square_x": s.square_x,
+                    "square_y": s.square_y,
+                }
+            )
 
     new_square_history = pd.DataFrame(rows)
     s.square_evolution = pd.concat([s.square_evolution, new_square_history])
     s.square_start = len(tiles)
+
+
+_BITMAP_CHUNK_BITS = 8
+_BITMAP_CHUNK_SIZE = 1 << _BITMAP_CHUNK_BITS
+
+
+class _TileBitmap:
+    """Visited tiles in dense chunks, such that windows can be cut out quickly."""
+
+    def __init__(self, tiles: Iterable[tuple[int, int]] = ()) -> None:
+        self._chunks: dict[tuple[int, int], np.ndarray] = {}
+        for tile_x, tile_y in tiles:
+            self.add(int(tile_x), int(tile_y))
+
+    def add(self, tile_x: int, tile_y: int) -> None:
+        key = (tile_x >> _BITMAP_CHUNK_BITS, tile_y >> _BITMAP_CHUNK_BITS)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = np.zeros((_BITMAP_CHUNK_SIZE, _BITMAP_CHUNK_SIZE), dtype=bool)
+            self._chunks[key] = chunk
+        chunk[tile_x & (_BITMAP_CHUNK_SIZE - 1), tile_y & (_BITMAP_CHUNK_SIZE - 1)] = (
+            True
+        )
+
+    def window(self, x0: int, y0: int, size: int) -> np.ndarray:
+        """Visited flags of the square window with the given corner, indexed by x and y."""
+        result = np.zeros((size, size), dtype=bool)
+        for chunk_x in range(
+            x0 >> _BITMAP_CHUNK_BITS, ((x0 + size - 1) >> _BITMAP_CHUNK_BITS) + 1
+        ):
+            for chunk_y in range(
+                y0 >> _BITMAP_CHUNK_BITS, ((y0 + size - 1) >> _BITMAP_CHUNK_BITS) + 1
+            ):
+                chunk = self._chunks.get((chunk_x, chunk_y))
+                if chunk is None:
+                    continue
+                offset_x = chunk_x << _BITMAP_CHUNK_BITS
+                offset_y = chunk_y << _BITMAP_CHUNK_BITS
+                begin_x = max(x0, offset_x)
+                end_x = min(x0 + size, offset_x + _BITMAP_CHUNK_SIZE)
+                begin_y = max(y0, offset_y)
+                end_y = min(y0 + size, offset_y + _BITMAP_CHUNK_SIZE)
+                result[begin_x - x0 : end_x - x0, begin_y - y0 : end_y - y0] = chunk[
+                    begin_x - offset_x : end_x - offset_x,
+                    begin_y - offset_y : end_y - offset_y,
+                ]
+        return result
+
+
+def _find_square_with_tile(
+    bitmap: _TileBitmap, tile_x: int, tile_y: int, size: int
+) -> tuple[int, int] | None:
+    """Upper left corner of a visited square of the size that contains the tile.
+
+    All squares are tested at once with a summed-area table of the window
+    around the tile. If there are several, the one with the largest x and then
+    the largest y is taken.
+    """
+    x0 = tile_x - size + 1
+    y0 = tile_y - size + 1
+    window = bitmap.window(x0, y0, 2 * size - 1)
+    table = np.zeros((2 * size, 2 * size), dtype=np.int64)
+    table[1:, 1:] = window.cumsum(axis=0).cumsum(axis=1)
+    visited_in_square = (
+        table[size:, size:]
+        - table[:size, size:]
+        - table[size:, :size]
+        + table[:size, :size]
+    )
+    corners = np.argwhere(visited_in_square == size * size)
+    if len(corners) == 0:
+        return None
+    # `argwhere` returns the corners in lexicographic order.
+    offset_x, offset_y = corners[-1]
+    return x0 + int(offset_x), y0 + int(offset_y)
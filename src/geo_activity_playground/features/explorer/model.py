@@ -51,7 +51,8 @@ class ClusterHistoryCheckpoint(DB.Model):
     event_index: Mapped[int] = mapped_column(sa.Integer, nullable=False)
     time: Mapped[datetime.datetime | None] = mapped_column(sa.DateTime, nullable=True)
     max_cluster_size: Mapped[int] = mapped_column(sa.Integer, nullable=False, default=0)
-    payload_json: Mapped[str] = mapped_column(sa.Text, nullable=False, default="{}")
+    # Replay state in the binary format of `clustering._encode_checkpoint`.
+    payload: Mapped[bytes] = mapped_column(sa.LargeBinary, nullable=False)
 
     __table_args__ = (
         sa.Index("idx_cluster_history_checkpoints_zoom_index", "zoom", "event_index"),
@@ -70,6 +71,57 @@ class ExplorerSquare(DB.Model):
     square_x: Mapped[int | None] = mapped_column(sa.Integer, nullable=True)
     square_y: Mapped[int | None] = mapped_column(sa.Integer, nullable=True)
     max_square_size: Mapped[int] = mapped_column(sa.Integer, nullable=False, default=0)
+    # Number of cluster history events that the square and the evolution
+    # series include, such that they can be continued from there. `None` if
+    # they have to be computed again.
+    event_index: Mapped[int | None] = mapped_column(sa.Integer, nullable=True)
+
+
+class ClusterHistoryVersion(DB.Model):
+    """Counter per zoom level, increased whenever the cluster history is replaced.
+
+    Appending events keeps the earlier states valid and doesn't change it.
+    """
+
+    __tablename__ = "cluster_history_versions"
+
+    zoom: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(sa.Integer, nullable=False, default=0)
+
+
+class ExplorerStateVersion(DB.Model):
+    """Counter per zoom level, increased whenever the explorer tiles change."""
+
+    __tablename__ = "explorer_state_versions"
+
+    zoom: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(sa.Integer, nullable=False, default=0)
+
+
+class ExplorerTileCache(DB.Model):
+    """Encoded explorer map tile, valid for one `ExplorerStateVersion`."""
+
+    __tablename__ = "explorer_tile_cache"
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "zoom",
+            "z",
+            "tile_x",
+            "tile_y",
+            "variant",
+            name="uq_explorer_tile_cache_tile_variant",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    zoom: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    z: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    tile_x: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    tile_y: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    # Hash of the color strategy, its parameters and the colors of the config.
+    variant: Mapped[str] = mapped_column(sa.String, nullable=False)
+    version: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    png: Mapped[bytes] = mapped_column(sa.LargeBinary, nullable=False)
 
 
 class SquareHistory(DB.Model):
@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Iterable
+
+import sqlalchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import MultiDict
+
+from ...core.datamodel import DB, UiConfig
+from .model import ExplorerStateVersion, ExplorerTileCache
+
+logger = logging.getLogger(__name__)
+
+_write_lock = threading.Lock()
+
+# Settings that the colors of the explorer tiles depend on.
+_TILE_CONFIG_FIELDS = [
+    "cluster_color_strategy",
+    "color_strategy_cmap_opacity",
+    "color_strategy_max_cluster_color",
+    "color_strategy_max_cluster_other_color",
+    "color_strategy_new_cluster_color",
+    "color_strategy_new_tile_color",
+    "color_strategy_visited_color",
+]
+
+
+def explorer_tile_variant(args: MultiDict[str, str], config: UiConfig) -> str:
+    """Hash of everything besides the explorer state that a tile depends on."""
+    key: list = [
+        sorted(args.items(multi=True)),
+        [getattr(config, field) for field in _TILE_CONFIG_FIELDS],
+    ]
+    color_strategy = args.get("color_strategy", "colorful_cluster")
+    if color_strategy == "default":
+        color_strategy = config.cluster_color_strategy
+    if color_strategy in ["first", "last"]:
+        # The colors show the age of the visits.
+        key.append(datetime.date.today().isoformat())
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def get_explorer_state_version(zoom: int) -> int:
+    version = DB.session.scalar(
+        sqlalchemy.select(ExplorerStateVersion.version).where(
+            ExplorerStateVersion.zoom == zoom
+        )
+    )
+    return int(version or 0)
+
+
+def bump_explorer_state_version(zooms: Iterable[int]) -> None:
+    """Mark the explorer tiles of the zoom levels as changed and drop them."""
+    zooms = sorted(set(zooms))
+    if not zooms:
+        return
+    statement = sqlite_insert(ExplorerStateVersion).values(
+        [{"zoom": zoom, "version": 1} for zoom in zooms]
+    )
+    DB.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ExplorerStateVersion.zoom],
+            set_={"version": ExplorerStateVersion.version + 1},
+        )
+    )
+    DB.session.commit()
+    delete_stale_explorer_tile_cache()
+
+
+def get_explorer_tile_cache(
+    zoom: int, z: int, tile_x: int, tile_y: int, variant: str, version: int
+) -> bytes | None:
+    return DB.session.scalar(
+        sqlalchemy.select(ExplorerTileCache.png).where(
+            ExplorerTileCache.zoom == zoom,
+            ExplorerTileCache.z == z,
+            ExplorerTileCache.tile_x == tile_x,
+            ExplorerTileCache.tile_y == tile_y,
+            ExplorerTileCache.variant == variant,
+            ExplorerTileCache.version == version,
+        )
+    )
+
+
+def write_explorer_tile_cache(
+    zoom: int, z: int, tile_x: int, tile_y: int, variant: str, version: int, png: bytes
+) -> None:
+    values = {
+        "zoom": zoom,
+        "z": z,
+        "tile_x": tile_x,
+        "tile_y": tile_y,
+        "variant": variant,
+        "version": version,
+        "png": png,
+    }
+    statement = sqlite_insert(ExplorerTileCache).values(values)
+    with _write_lock:
+        try:
+            DB.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[
+                        ExplorerTileCache.zoom,
+                        ExplorerTileCache.z,
+                        ExplorerTileCache.tile_x,
+                        ExplorerTileCache.tile_y,
+                        ExplorerTileCache.variant,
+                    ],
+                    set_={"version": version, "png": png},
+                )
+            )
+            DB.session.commit()
+        except sqlalchemy.exc.OperationalError:
+            # Another process can hold the database, the tile is rendered
+            # again next time.
+            logger.warning(
+                f"Database is locked, explorer tile {z}/{tile_x}/{tile_y} is not cached."
+            )
+            DB.session.rollback()
+
+
+def delete_stale_explorer_tile_cache() -> int:
+    """Delete tiles rendered for an earlier version of the explorer state.
+
+    Tiles that were rendered while the version was increased can still end up
+    in the cache, they are deleted with the next increase.
+    """
+    current_version = (
+        sqlalchemy.select(ExplorerStateVersion.version)
+        .where(ExplorerStateVersion.zoom == ExplorerTileCache.zoom)
+        .scalar_subquery()
+    )
+    result = DB.session.execute(
+        sqlalchemy.delete(ExplorerTileCache).where(
+            ExplorerTileCache.version < sqlalchemy.func.coalesce(current_version, 0)
+        )
+    )
+    DB.session.commit()
+    deleted = int(getattr(result, "rowcount", 0) or 0)
+    if deleted:
+        logger.debug(f"Deleted {deleted} outdated explorer tiles.")
+    return deleted
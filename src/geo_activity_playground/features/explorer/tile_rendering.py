@@ -19,6 +19,7 @@ from ...core.tile_visits import (
     get_latest_new_tiles_activity_id,
 )
 from .clustering import (
+    ClusterReplayState,
     get_cluster_history_latest_event_index,
     get_cluster_membership_in_bounds,
     get_cluster_tile_diff_for_activity,
@@ -179,35 +180,27 @@ class ColorfulClusterColorStrategy(ColorStrategy):
             return None
 
 
-def _replay_root(
-    parents: dict[tuple[int, int], tuple[int, int]], tile: tuple[int, int]
-) -> tuple[int, int]:
-    root = tile
-    while parents[root] != root:
-        root = parents[root]
-    return root
-
-
 class HistoricalColorfulClusterColorStrategy(ColorStrategy):
-    def __init__(self, state, config: UiConfig):
+    def __init__(self, state: ClusterReplayState, config: UiConfig):
+        self._state = state
         self._config = config
         self._cmap = matplotlib.colormaps["hsv"]
-        self._color_by_tile: dict[tuple[int, int], TilePattern] = {}
-        self._visited_tiles = set(state.visited_tiles)
-        for tile in state.cluster_tiles:
-            cluster_id = _replay_root(state.parents, tile)
-            m = hashlib.sha256()
-            m.update(str(cluster_id).encode())
-            d = int(m.hexdigest(), base=16) / (256.0**m.digest_size)
-            self._color_by_tile[tile] = SolidColor(
-                self._cmap(d)[:3] + (self._config.color_strategy_cmap_opacity,)
-            )
+        self._color_by_cluster: dict[tuple[int, int], TilePattern] = {}
 
     def color(self, tile_xy: tuple[int, int]) -> TilePattern | None:
-        color = self._color_by_tile.get(tile_xy)
-        if color is not None:
+        cluster_id = self._state.cluster_root(tile_xy)
+        if cluster_id is not None:
+            color = self._color_by_cluster.get(cluster_id)
+            if color is None:
+                m = hashlib.sha256()
+                m.update(str(cluster_id).encode())
+                d = int(m.hexdigest(), base=16) / (256.0**m.digest_size)
+                color = SolidColor(
+                    self._cmap(d)[:3] + (self._config.color_strategy_cmap_opacity,)
+                )
+                self._color_by_cluster[cluster_id] = color
             return color
-        if tile_xy in self._visited_tiles:
+        if tile_xy in self._state:
             return SolidColor(
                 hex_color_to_float(self._config.color_strategy_visited_color)
             )
@@ -215,31 +208,22 @@ class HistoricalColorfulClusterColorStrategy(ColorStrategy):
 
 
 class HistoricalMaxClusterColorStrategy(ColorStrategy):
-    def __init__(self, state, config: UiConfig):
+    def __init__(self, state: ClusterReplayState, config: UiConfig):
+        self._state = state
         self._config = config
-        max_root = max(
-            state.component_sizes, key=state.component_sizes.get, default=None
-        )
-        self._max_members: set[tuple[int, int]] = set()
-        if max_root is not None:
-            self._max_members = {
-                tile
-                for tile in state.cluster_tiles
-                if _replay_root(state.parents, tile) == max_root
-            }
-        self._cluster_tiles = set(state.cluster_tiles)
-        self._visited_tiles = set(state.visited_tiles)
+        self._max_root = state.largest_cluster_root()
 
     def color(self, tile_xy: tuple[int, int]) -> TilePattern | None:
-        if tile_xy in self._max_members:
+        cluster_id = self._state.cluster_root(tile_xy)
+        if cluster_id is not None and cluster_id == self._max_root:
             return SolidColor(
                 hex_color_to_float(self._config.color_strategy_max_cluster_color)
             )
-        if tile_xy in self._cluster_tiles:
+        if cluster_id is not None:
             return SolidColor(
                 hex_color_to_float(self._config.color_strategy_max_cluster_other_color)
             )
-        if tile_xy in self._visited_tiles:
+        if tile_xy in self._state:
             return SolidColor(
                 hex_color_to_float(self._config.color_strategy_visited_color)
             )
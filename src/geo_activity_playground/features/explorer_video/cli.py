@@ -1,4 +1,5 @@
 import argparse
+import os
 import pathlib
 
 from .video import ExplorerVideoOptions, generate_explorer_video
@@ -17,6 +18,7 @@ def main_video_explorer(options) -> None:
             fade_frames=options.fade_frames,
             pause_frames=options.pause_frames,
             download_workers=options.download_workers,
+            render_workers=options.render_workers,
             map_tile_url=options.map_tile_url,
         )
     )
@@ -75,6 +77,12 @@ def register_main_explorer_video(subparsers: argparse._SubParsersAction) -> None
         default=16,
         help="Parallel workers for OSM tile downloads (default: %(default)s)",
     )
+    subparser.add_argument(
+        "--render-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel processes for rendering frames (default: %(default)s)",
+    )
     subparser.add_argument(
         "--output-path",
         type=pathlib.Path,
@@ -1,5 +1,9 @@
+import collections
+import concurrent.futures
 import dataclasses
+import functools
 import math
+import multiprocessing
 import os
 import pathlib
 from collections.abc import Iterable
@@ -9,11 +13,12 @@ from typing import Any, cast
 import numpy as np
 import pandas as pd
 import sqlalchemy as sa
-from PIL import Image, ImageEnhance
+from PIL import ImageEnhance
 from tqdm import tqdm
 
 from ...core.config import ConfigAccessor
-from ...core.raster_map import get_tile, osm_tile_path
+from ...core.raster_map import OSM_TILE_SIZE, get_tile, osm_tile_path
+from ...core.tile_fetcher import tile_fetcher
 
 
 @dataclasses.dataclass
@@ -28,6 +33,7 @@ class ExplorerVideoOptions:
     fade_frames: int = 12
     pause_frames: int = 12
     download_workers: int = 16
+    render_workers: int = dataclasses.field(default_factory=lambda: os.cpu_count() or 1)
     map_tile_url: str | None = None
 
 
@@ -124,43 +130,141 @@ def iter_chunk_frames(
     return frames
 
 
-def render_frame(
-    *,
-    zoom: int,
-    center_x: float,
-    center_y: float,
-    explored: set[tuple[int, int]],
-    brightness: float,
-    width: int,
-    height: int,
-    map_tile_url: str,
-) -> np.ndarray:
-    tile_pixels = 256
-    image = Image.new("RGB", (width, height))
+# Sprites of a tile, bright and darkened, take 384 KiB. Every worker keeps a
+# few more than fit into a 4K frame, such that panning rarely reloads them.
+_SPRITE_CACHE_TILES = 256
+_UNEXPLORED_BRIGHTNESS = 0.3
+# Frames rendered by one task of the pool. Each frame of 1920×1080 pixels is
+# 6 MiB that needs to be sent back to the writer.
+_FRAMES_PER_BATCH = 16
+# Rendered frames that may wait for the writer, independent of the workers.
+_MAX_PENDING_FRAME_BYTES = 1024**3
+
+
+class FrameRenderer:
+    """Composes frames on a canvas that follows the viewport.
+
+    The canvas holds the tiles around the viewport and a frame is a crop of
+    it. Tiles are only drawn again when the viewport moves on to the next tile
+    or when they get explored. The sprites are kept in bright and darkened
+    versions, such that the darkening is only computed once per tile.
+    """
+
+    def __init__(self, *, zoom: int, width: int, height: int, map_tile_url: str):
+        self.zoom = zoom
+        self.width = width
+        self.height = height
+        self.map_tile_url = map_tile_url
+        self._tiles_x = math.ceil(width / OSM_TILE_SIZE) + 2
+        self._tiles_y = math.ceil(height / OSM_TILE_SIZE) + 2
+        self._canvas = np.zeros(
+            (self._tiles_y * OSM_TILE_SIZE, self._tiles_x * OSM_TILE_SIZE, 3),
+            dtype=np.uint8,
+        )
+        self._canvas_origin: tuple[int, int] | None = None
+        self._canvas_explored: dict[tuple[int, int], bool] = {}
+        self._sprites: collections.OrderedDict[
+            tuple[int, int], tuple[np.ndarray, np.ndarray]
+        ] = collections.OrderedDict()
+
+    def render(self, frame: FrameSpec, explored: set[tuple[int, int]]) -> np.ndarray:
+        x0 = frame.center_x + 0.5 - self.width / (2 * OSM_TILE_SIZE)
+        y0 = frame.center_y + 0.5 - self.height / (2 * OSM_TILE_SIZE)
+        min_tile_x = math.floor(x0)
+        min_tile_y = math.floor(y0)
+        offset_x = int((min_tile_x - x0) * OSM_TILE_SIZE)
+        offset_y = int((min_tile_y - y0) * OSM_TILE_SIZE)
+
+        if self._canvas_origin != (min_tile_x, min_tile_y):
+            self._canvas_origin = (min_tile_x, min_tile_y)
+            self._canvas_explored.clear()
+        for i in range(self._tiles_x):
+            for j in range(self._tiles_y):
+                tile = (min_tile_x + i, min_tile_y + j)
+                is_explored = tile in explored
+                if self._canvas_explored.get(tile) is not is_explored:
+                    bright, dark = self._get_sprites(tile)
+                    self._canvas[
+                        j * OSM_TILE_SIZE : (j + 1) * OSM_TILE_SIZE,
+                        i * OSM_TILE_SIZE : (i + 1) * OSM_TILE_SIZE,
+                    ] = bright if is_explored else dark
+                    self._canvas_explored[tile] = is_explored
+
+        image = self._canvas[
+            -offset_y : -offset_y + self.height, -offset_x : -offset_x + self.width
+        ]
+        if frame.brightness == 1.0:
+            return image.copy()
+        # Truncates like `ImageEnhance.Brightness`.
+        return (image * np.float32(frame.brightness)).astype(np.uint8)
 
-    x0 = center_x + 0.5 - width / (2 * tile_pixels)
-    y0 = center_y + 0.5 - height / (2 * tile_pixels)
+    def _get_sprites(self, tile: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        sprites = self._sprites.get(tile)
+        if sprites is not None:
+            self._sprites.move_to_end(tile)
+            return sprites
+        sprite = get_tile(self.zoom, tile[0], tile[1], self.map_tile_url)
+        dark = ImageEnhance.Brightness(sprite).enhance(_UNEXPLORED_BRIGHTNESS)
+        sprites = (np.asarray(sprite), np.asarray(dark))
+        self._sprites[tile] = sprites
+        while len(self._sprites) > _SPRITE_CACHE_TILES:
+            self._sprites.popitem(last=False)
+        return sprites
 
-    min_tile_x = math.floor(x0)
-    min_tile_y = math.floor(y0)
 
-    offset_x = int((min_tile_x - x0) * tile_pixels)
-    offset_y = int((min_tile_y - y0) * tile_pixels)
+_worker_renderer: FrameRenderer | None = None
+
+
+def batch_sizes(width: int, height: int, workers: int) -> tuple[int, int]:
+    """Frames per task and how many tasks may be pending at once.
+
+    Each worker should have about two tasks queued, but with many workers or
+    large frames the batches get smaller such that the rendered frames stay
+    within the memory budget.
+    """
+    max_frames = max(_MAX_PENDING_FRAME_BYTES // (width * height * 3), 1)
+    frames_per_batch = min(_FRAMES_PER_BATCH, max(max_frames // (2 * workers), 1))
+    max_pending = min(2 * workers, max(max_frames // frames_per_batch, 1))
+    return frames_per_batch, max_pending
 
-    tiles_x = math.ceil(width / tile_pixels) + 2
-    tiles_y = math.ceil(height / tile_pixels) + 2
-    for i in range(tiles_x):
-        for j in range(tiles_y):
-            tile = (min_tile_x + i, min_tile_y + j)
-            sprite = get_tile(zoom, tile[0], tile[1], map_tile_url)
-            if tile not in explored:
-                sprite = ImageEnhance.Brightness(sprite).enhance(0.3)
-            box = (offset_x + i * tile_pixels, offset_y + j * tile_pixels)
-            image.paste(sprite, box)
 
-    if brightness != 1.0:
-        image = ImageEnhance.Brightness(image).enhance(brightness)
-    return np.asarray(image, dtype=np.uint8)
+def _init_render_worker() -> None:
+    # The renderer keeps the sprites, the decoded tiles would only take memory
+    # a second time.
+    tile_fetcher.max_cache_bytes = 0
+
+
+def render_frames(
+    *,
+    zoom: int,
+    width: int,
+    height: int,
+    map_tile_url: str,
+    explored: set[tuple[int, int]],
+    frames: list[FrameSpec],
+) -> list[np.ndarray]:
+    """Render consecutive frames, reusing the renderer of the process.
+
+    `explored` needs to contain the tiles visible in these frames that are
+    explored before the first one.
+    """
+    global _worker_renderer
+    renderer = _worker_renderer
+    if renderer is None or (
+        renderer.zoom,
+        renderer.width,
+        renderer.height,
+        renderer.map_tile_url,
+    ) != (zoom, width, height, map_tile_url):
+        renderer = FrameRenderer(
+            zoom=zoom, width=width, height=height, map_tile_url=map_tile_url
+        )
+        _worker_renderer = renderer
+    result = []
+    for frame in frames:
+        explored.update(frame.new_tiles)
+        result.append(renderer.render(frame, explored))
+    return result
 
 
 def visible_tiles_for_frame(
@@ -240,43 +344,90 @@ def generate_explorer_video(options: ExplorerVideoOptions) -> pathlib.Path:
         output_path = pathlib.Path("Explorer Video") / f"explorer-z{options.zoom}.mp4"
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    frames_per_batch, max_pending = batch_sizes(
+        options.width, options.height, options.render_workers
+    )
     explored: set[tuple[int, int]] = set()
-    with imageio.get_writer(output_path, fps=options.fps) as writer:
-        for chunk_idx, chunk in enumerate(
-            tqdm(chunks, desc="Explorer video chunks"), start=1
+    pending: collections.deque[concurrent.futures.Future[list[np.ndarray]]] = (
+        collections.deque()
+    )
+    executor = None
+    if options.render_workers > 1:
+        # Forking a process that runs threads, like the web server, is unsafe.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=options.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+        )
+    try:
+        with (
+            imageio.get_writer(output_path, fps=options.fps) as writer,
+            tqdm(desc="Explorer video frames", unit="frame") as frame_progress,
         ):
-            frame_specs = iter_chunk_frames(
-                chunk,
-                steps_per_tile=options.steps_per_tile,
-                fade_frames=options.fade_frames,
-                pause_frames=options.pause_frames,
-            )
-            prefetch_tiles(
-                zoom=options.zoom,
-                frames=frame_specs,
-                width=options.width,
-                height=options.height,
-                map_tile_url=map_tile_url,
-                workers=options.download_workers,
-            )
-            with tqdm(
-                total=None,
-                desc=f"Chunk {chunk_idx} frames",
-                unit="frame",
-                leave=False,
-            ) as chunk_progress:
-                for frame in frame_specs:
-                    explored.update(frame.new_tiles)
-                    data = render_frame(
+
+            def write_frames(
+                future: concurrent.futures.Future[list[np.ndarray]],
+            ) -> None:
+                for data in future.result():
+                    cast(Any, writer).append_data(data)
+                    frame_progress.update()
+
+            for chunk in tqdm(chunks, desc="Explorer video chunks"):
+                frame_specs = iter_chunk_frames(
+                    chunk,
+                    steps_per_tile=options.steps_per_tile,
+                    fade_frames=options.fade_frames,
+                    pause_frames=options.pause_frames,
+                )
+                prefetch_tiles(
+                    zoom=options.zoom,
+                    frames=frame_specs,
+                    width=options.width,
+                    height=options.height,
+                    map_tile_url=map_tile_url,
+                    workers=options.download_workers,
+                )
+                for start in range(0, len(frame_specs), frames_per_batch):
+                    batch = frame_specs[start : start + frames_per_batch]
+                    # Only the visible part of the explored tiles is sent along.
+                    batch_explored = {
+                        tile
+                        for frame in batch
+                        for tile in visible_tiles_for_frame(
+                            frame.center_x,
+                            frame.center_y,
+                            options.width,
+                            options.height,
+                        )
+                        if tile in explored
+                    }
+                    task = functools.partial(
+                        render_frames,
                         zoom=options.zoom,
-                        center_x=frame.center_x,
-                        center_y=frame.center_y,
-                        explored=explored,
-                        brightness=frame.brightness,
                         width=options.width,
                         height=options.height,
                         map_tile_url=map_tile_url,
+                        explored=batch_explored,
+                        frames=batch,
                     )
-                    cast(Any, writer).append_data(data)
-                    chunk_progress.update()
+                    if executor is None:
+                        future: concurrent.futures.Future[list[np.ndarray]] = (
+                            concurrent.futures.Future()
+                        )
+                        future.set_result(task())
+                    else:
+                        future = executor.submit(task)
+                    pending.append(future)
+                    for frame in batch:
+                        explored.update(frame.new_tiles)
+
+                    # Batches finish in any order but are written in order. The
+                    # queue is bounded to keep the rendered frames in memory few.
+                    while len(pending) > max_pending:
+                        write_frames(pending.popleft())
+            while pending:
+                write_frames(pending.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
     return output_path
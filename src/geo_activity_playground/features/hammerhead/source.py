@@ -23,6 +23,7 @@ class HammerheadActivitySource(ActivitySource):
         repository: ActivityRepository,
         begin: str | None = None,
         end: str | None = None,
+        jobs: int = 1,  # noqa: ARG002
     ) -> None:
         import_from_hammerhead_api(
             config_accessor.activity_import(),
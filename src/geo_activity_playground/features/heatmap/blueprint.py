@@ -1,5 +1,4 @@
 import datetime
-import io
 import logging
 import pathlib
 import shutil
@@ -10,9 +9,8 @@ from typing import Any
 import matplotlib.pylab as pl
 import numpy as np
 import sqlalchemy
-from flask import Blueprint, Response, redirect, render_template, request, url_for
+from flask import Blueprint, redirect, render_template, request, url_for
 from flask_babel import gettext as _
-from PIL import Image, ImageDraw
 
 from ...core.activities import ActivityRepository
 from ...core.config import ConfigAccessor
@@ -34,6 +32,7 @@ from ...core.raster_map import (
     PixelBounds,
     get_sensible_zoom_level,
 )
+from ...core.tile_encoding import png_response
 from ...core.tile_visits import (
     get_activity_ids_in_tile,
     get_tile_medians,
@@ -50,6 +49,9 @@ from .cache import (
     write_tile_cache,
 )
 from .model import HeatmapTileCache
+from .painting import paint_segments, time_series_segments
+from .pyramid import counts_from_children
+from .track_index import get_track_runs
 
 logger = logging.getLogger(__name__)
 
@@ -115,9 +117,7 @@ def make_heatmap_blueprint(
     @blueprint.route("/tile/<int:z>/<int:x>/<int:y>.png")
     def tile(x: int, y: int, z: int):
         primitives = parse_search_params(request.args)
-        f = io.BytesIO()
-        pl.imsave(
-            f,
+        return png_response(
             _render_tile_image(
                 x,
                 y,
@@ -125,13 +125,7 @@ def make_heatmap_blueprint(
                 primitives,
                 config_accessor.ui(),
                 repository,
-            ),
-            format="png",
-        )
-        return Response(
-            bytes(f.getbuffer()),
-            mimetype="image/png",
-            headers={"Cache-Control": "no-cache"},
+            )
         )
 
     @blueprint.route(
@@ -163,15 +157,11 @@ def make_heatmap_blueprint(
                     repository,
                 )
 
-        f = io.BytesIO()
-        pl.imsave(f, background, format="png")
-        return Response(
-            bytes(f.getbuffer()),
-            mimetype="image/png",
-            headers={
-                "Content-disposition": 'attachment; filename="heatmap.png"',
-                "Cache-Control": "no-cache",
-            },
+        # A download is encoded once, so it's worth compressing it better.
+        return png_response(
+            background,
+            headers={"Content-disposition": 'attachment; filename="heatmap.png"'},
+            compress_level=6,
         )
 
     return blueprint
@@ -304,6 +294,7 @@ def _get_counts(
 
     if should_use_cache:
         parsed_activities: set[int] = set()
+        painted_from = "track_index"
         cache_entry = None
         with _handle_db_lock(
             f"Failed to read heatmap cache for {x=}/{y=}/{z=}, recomputing."
@@ -311,7 +302,7 @@ def _get_counts(
             cache_entry = get_tile_cache(
                 zoom=z, tile_x=x, tile_y=y, search_query_id=search_query_id
             )
-        if cache_entry:
+        if cache_entry and not cache_entry.is_dirty:
             try:
                 tile_counts = blob_to_counts(cache_entry.counts).astype(
                     np.int32, copy=False
@@ -319,37 +310,47 @@ def _get_counts(
                 if tile_counts.shape != tile_pixels:
                     raise ValueError("invalid tile shape in cache")
                 parsed_activities = set(cache_entry.included_activity_ids or [])
+                painted_from = cache_entry.painted_from
             except ValueError:
                 logger.warning(
                     f"Resetting corrupted heatmap cache for {x=}/{y=}/{z=}/{search_query_id=}."
                 )
                 tile_counts = np.zeros(tile_pixels, dtype=np.int32)
                 parsed_activities = set()
+                painted_from = "track_index"
 
+        # Removed activities are normally subtracted right away, see
+        # `remove_activity_from_heatmap_cache`.
         if parsed_activities - activity_ids:
             logger.warning(
                 f"Resetting heatmap cache for {x=}/{y=}/{z=}/{search_query_id=} because activities have been removed."
             )
             tile_counts = np.zeros(tile_pixels, dtype=np.int32)
             parsed_activities.clear()
+            painted_from = "track_index"
 
-        for activity_id in activity_ids:
-            if activity_id in parsed_activities:
-                continue
-            time_series = None
+        if not parsed_activities and activity_ids:
             with _handle_db_lock(
-                f"Skipping activity {activity_id} for {x=}/{y=}/{z=} due to DB error."
+                f"Failed to read heatmap cache below {x=}/{y=}/{z=}, recomputing."
             ):
-                try:
-                    time_series = repository.get_time_series(activity_id)
-                except ValueError:
-                    logger.warning(
-                        f"Skipping deleted activity {activity_id} for {x=}/{y=}/{z=}."
-                    )
-            if time_series is None:
-                continue
-            parsed_activities.add(activity_id)
-            _paint_activity(tile_counts, time_series, x=x, y=y, z=z)
+                from_children = counts_from_children(
+                    z, x, y, search_query_id, activity_ids
+                )
+                if from_children is not None:
+                    tile_counts, parsed_activities = from_children
+                    painted_from = "pyramid"
+
+        painted, from_time_series = _paint_activities(
+            tile_counts,
+            activity_ids - parsed_activities,
+            repository,
+            x=x,
+            y=y,
+            z=z,
+        )
+        parsed_activities |= painted
+        if from_time_series:
+            painted_from = "time_series"
 
         with _handle_db_lock(
             f"Failed to write heatmap cache for {x=}/{y=}/{z=}, skipping."
@@ -362,18 +363,58 @@ def _get_counts(
                 counts=tile_counts,
                 included_activity_ids=parsed_activities,
                 min_activities=config.heatmap_cache_min_activities,
+                painted_from=painted_from,
             )
     else:
-        for activity_id in activity_ids:
+        _paint_activities(tile_counts, activity_ids, repository, x=x, y=y, z=z)
+    return tile_counts
+
+
+def _paint_activities(
+    tile_counts: np.ndarray,
+    activity_ids: set[int],
+    repository: ActivityRepository,
+    *,
+    x: int,
+    y: int,
+    z: int,
+) -> tuple[set[int], bool]:
+    """Paint the activities from the track index and return the painted ones.
+
+    Activities which are not in the index yet are painted from their time
+    series instead, the second return value tells whether there were any.
+    """
+    track_runs: dict[int, dict[int, list[np.ndarray]]] = {}
+    with _handle_db_lock(
+        f"Failed to read track index for {x=}/{y=}/{z=}, using time series."
+    ):
+        track_runs = get_track_runs(z, x, y, activity_ids)
+
+    painted: set[int] = set()
+    from_time_series = False
+    segments: list[list[np.ndarray]] = []
+    for activity_id in activity_ids:
+        if activity_id in track_runs:
+            segments.extend(track_runs[activity_id].values())
+            painted.add(activity_id)
+            continue
+        time_series = None
+        with _handle_db_lock(
+            f"Skipping activity {activity_id} for {x=}/{y=}/{z=} due to DB error."
+        ):
             try:
                 time_series = repository.get_time_series(activity_id)
             except ValueError:
                 logger.warning(
                     f"Skipping deleted activity {activity_id} for {x=}/{y=}/{z=}."
                 )
-                continue
-            _paint_activity(tile_counts, time_series, x=x, y=y, z=z)
-    return tile_counts
+        if time_series is None:
+            continue
+        segments.extend(time_series_segments(time_series))
+        painted.add(activity_id)
+        from_time_series = True
+    paint_segments(tile_counts, segments, x=x, y=y, z=z)
+    return painted, from_time_series
 
 
 def _favorite_search_query_id(primitives: dict) -> int | None:
@@ -389,17 +430,7 @@ def _favorite_search_query_id(primitives: dict) -> int | None:
 def _paint_activity(
     tile_counts: np.ndarray, time_series, *, x: int, y: int, z: int
 ) -> None:
-    tile_pixels = (OSM_TILE_SIZE, OSM_TILE_SIZE)
-    for _segment_id, group in time_series.groupby("segment_id"):
-        xy_pixels = (
-            np.array([group["x"] * 2**z - x, group["y"] * 2**z - y]).T * OSM_TILE_SIZE
-        )
-        im = Image.new("L", tile_pixels)
-        draw = ImageDraw.Draw(im)
-        pixels = list(map(int, xy_pixels.flatten()))
-        draw.line(pixels, fill=1, width=max(3, 6 * (z - 17)))
-        aim = np.array(im)
-        tile_counts += aim
+    paint_segments(tile_counts, time_series_segments(time_series), x=x, y=y, z=z)
 
 
 def _render_tile_image(
@@ -48,6 +48,22 @@ def get_tile_cache(
     return DB.session.scalars(query).first()
 
 
+def get_child_tile_caches(
+    zoom: int, tile_x: int, tile_y: int, search_query_id: int | None
+) -> list[HeatmapTileCache]:
+    """Cached tiles of the four children of a tile, one zoom level deeper."""
+    query = sqlalchemy.select(HeatmapTileCache).where(
+        HeatmapTileCache.zoom == zoom + 1,
+        HeatmapTileCache.tile_x.between(2 * tile_x, 2 * tile_x + 1),
+        HeatmapTileCache.tile_y.between(2 * tile_y, 2 * tile_y + 1),
+    )
+    if search_query_id is None:
+        query = query.where(HeatmapTileCache.search_query_id.is_(None))
+    else:
+        query = query.where(HeatmapTileCache.search_query_id == search_query_id)
+    return list(DB.session.scalars(query).all())
+
+
 def write_tile_cache(
     zoom: int,
     tile_x: int,
@@ -56,6 +72,7 @@ def write_tile_cache(
     counts: np.ndarray,
     included_activity_ids: set[int],
     min_activities: int,
+    painted_from: str,
 ) -> None:
     with _write_lock:
         num_activities = len(included_activity_ids)
@@ -80,6 +97,8 @@ def write_tile_cache(
         cache_entry.included_activity_ids = sorted(included_activity_ids)
         cache_entry.num_activities = num_activities
         cache_entry.last_used = datetime.datetime.now()
+        cache_entry.is_dirty = False
+        cache_entry.painted_from = painted_from
         DB.session.commit()
 
 
@@ -0,0 +1,59 @@
+import argparse
+import datetime
+import logging
+import os
+import pathlib
+
+from ...core.config import ConfigAccessor
+from .prewarm import (
+    RECENTLY_BROWSED,
+    browsed_zoom_levels,
+    prewarm_heatmap_cache,
+    tiles_to_prewarm,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main_heatmap_prewarm(options: argparse.Namespace) -> None:
+    from ...webui.app import create_app
+
+    os.chdir(options.basedir)
+    database_path = pathlib.Path("database.sqlite")
+    database_uri = f"sqlite:///{database_path.absolute()}"
+    app = create_app(database_uri=database_uri, run_migrations=False)
+
+    with app.app_context():
+        zoom_levels = options.zoom or browsed_zoom_levels(
+            datetime.datetime.now() - RECENTLY_BROWSED
+        )
+        if not zoom_levels:
+            logger.warning(
+                "The heatmap has not been browsed recently, specify the zoom levels with --zoom."
+            )
+            return
+        tiles = tiles_to_prewarm(
+            zoom_levels, ConfigAccessor().ui().heatmap_cache_min_activities
+        )
+        logger.info(f"Pre-warming {len(tiles)} tiles at zoom levels {zoom_levels}.")
+        prewarm_heatmap_cache(tiles, database_uri, options.workers)
+
+
+def register_main_heatmap_prewarm(subparsers: argparse._SubParsersAction) -> None:
+    subparser = subparsers.add_parser(
+        "heatmap-prewarm",
+        help="Render the heatmap tiles which are not cached yet",
+    )
+    subparser.add_argument(
+        "--zoom",
+        type=int,
+        action="append",
+        help="Zoom level to render, can be given multiple times (default: the zoom levels browsed recently)",
+    )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: %(default)s)",
+    )
+    subparser.set_defaults(func=main_heatmap_prewarm)
@@ -0,0 +1,144 @@
+"""Keep the cached heatmap tiles up to date when an activity changes.
+
+When an activity is removed or its track changes, its contribution is
+subtracted from every cached tile that includes it. New tracks are added to the
+cached tiles of the global heatmap. The contribution is rasterized from the
+track index, exactly like `_get_counts` paints it. This only gives the correct
+counts for tiles that have been painted from the track index alone. Other tiles
+are assembled from their children again or marked dirty and computed again on
+the next request.
+"""
+
+import logging
+
+import numpy as np
+import sqlalchemy
+
+from ...core.datamodel import DB, ActivityTile
+from ...core.raster_map import OSM_TILE_SIZE
+from .cache import blob_to_counts, counts_to_blob
+from .model import HeatmapTileCache
+from .painting import paint_segments
+from .pyramid import PYRAMID_MAX_CHILD_ZOOM, counts_from_children
+from .track_index import get_track_runs
+
+logger = logging.getLogger(__name__)
+
+
+def remove_activity_from_heatmap_cache(activity_id: int) -> int:
+    """Subtract an activity from the cached tiles that include it.
+
+    This needs the tile visits and the indexed track of the activity, so it
+    has to run before these are removed or replaced. Returns the number of
+    updated tiles.
+    """
+    updated = 0
+    for cache_entry in _cache_entries_along_activity(activity_id):
+        included_activity_ids = set(cache_entry.included_activity_ids or [])
+        if activity_id not in included_activity_ids:
+            continue
+        included_activity_ids.remove(activity_id)
+        _update_counts(cache_entry, activity_id, included_activity_ids, sign=-1)
+        updated += 1
+    DB.session.commit()
+    if updated:
+        logger.info(f"Removed activity {activity_id} from {updated} heatmap tiles.")
+    return updated
+
+
+def add_activity_to_heatmap_cache(activity_id: int) -> int:
+    """Add an activity to the cached tiles of the global heatmap.
+
+    Tiles cached for a favorite search query are left alone, they pick up the
+    activity when they are requested next, if it matches. Returns the number of
+    updated tiles.
+    """
+    updated = 0
+    for cache_entry in _cache_entries_along_activity(activity_id):
+        if cache_entry.search_query_id is not None:
+            continue
+        included_activity_ids = set(cache_entry.included_activity_ids or [])
+        if activity_id in included_activity_ids:
+            continue
+        included_activity_ids.add(activity_id)
+        _update_counts(cache_entry, activity_id, included_activity_ids, sign=1)
+        updated += 1
+    DB.session.commit()
+    if updated:
+        logger.info(f"Added activity {activity_id} to {updated} heatmap tiles.")
+    return updated
+
+
+def _cache_entries_along_activity(activity_id: int) -> list[HeatmapTileCache]:
+    """Cached tiles that the activity passes through, deepest zoom first.
+
+    The deeper tiles are updated first, such that the tiles above can be
+    assembled from them again.
+    """
+    return list(
+        DB.session.scalars(
+            sqlalchemy.select(HeatmapTileCache)
+            .join(
+                ActivityTile,
+                sqlalchemy.and_(
+                    ActivityTile.zoom == HeatmapTileCache.zoom,
+                    ActivityTile.tile_x == HeatmapTileCache.tile_x,
+                    ActivityTile.tile_y == HeatmapTileCache.tile_y,
+                ),
+            )
+            .where(ActivityTile.activity_id == activity_id)
+            .order_by(HeatmapTileCache.zoom.desc())
+        ).all()
+    )
+
+
+def _update_counts(
+    cache_entry: HeatmapTileCache,
+    activity_id: int,
+    included_activity_ids: set[int],
+    sign: int,
+) -> None:
+    cache_entry.included_activity_ids = sorted(included_activity_ids)
+    cache_entry.num_activities = len(included_activity_ids)
+    if cache_entry.is_dirty:
+        return
+
+    zoom, tile_x, tile_y = cache_entry.zoom, cache_entry.tile_x, cache_entry.tile_y
+    if zoom < PYRAMID_MAX_CHILD_ZOOM:
+        from_children = counts_from_children(
+            zoom, tile_x, tile_y, cache_entry.search_query_id, included_activity_ids
+        )
+        if from_children is not None and from_children[1] == included_activity_ids:
+            cache_entry.counts = counts_to_blob(from_children[0])
+            cache_entry.painted_from = "pyramid"
+            return
+
+    # Tiles assembled from children are rounded, and time series are painted
+    # differently than the track index.
+    if cache_entry.painted_from != "track_index":
+        cache_entry.is_dirty = True
+        return
+
+    try:
+        counts = blob_to_counts(cache_entry.counts).astype(np.int32)
+    except ValueError:
+        cache_entry.is_dirty = True
+        return
+    track_runs = get_track_runs(zoom, tile_x, tile_y, {activity_id})
+    if activity_id not in track_runs or counts.shape != (
+        OSM_TILE_SIZE,
+        OSM_TILE_SIZE,
+    ):
+        cache_entry.is_dirty = True
+        return
+
+    contribution = np.zeros_like(counts)
+    paint_segments(
+        contribution, track_runs[activity_id].values(), x=tile_x, y=tile_y, z=zoom
+    )
+    counts += sign * contribution
+    if np.any(counts < 0):
+        # The track index has changed since the tile was painted.
+        cache_entry.is_dirty = True
+        return
+    cache_entry.counts = counts_to_blob(counts)
@@ -45,3 +45,38 @@ class HeatmapTileCache(DB.Model):
     last_used: Mapped[datetime.datetime | None] = mapped_column(
         sa.DateTime, nullable=True
     )
+    # The counts could not be corrected after an activity changed and have to
+    # be computed again.
+    is_dirty: Mapped[bool] = mapped_column(sa.Boolean, nullable=False, default=False)
+    # How the counts were computed: "track_index" if every activity was painted
+    # from the track index, "pyramid" if the tile was assembled from its
+    # children, "time_series" if an activity was painted from its time series.
+    # Only the first can be corrected by painting the changed activity.
+    painted_from: Mapped[str] = mapped_column(
+        sa.String, nullable=False, default="time_series"
+    )
+
+
+class ActivityTrackChunk(DB.Model):
+    """The part of an activity's projected track that lies in one zoom-17 tile.
+
+    A chunk holds a run of consecutive points of one segment as pairs of
+    float64 ``x``/``y`` in zoom-0 tile coordinates. The run is extended by one
+    point on either side, such that the lines leaving the tile are part of it.
+    Lines that jump over tiles are also stored as two points in the tiles they
+    cross. Heatmap tiles read these runs instead of loading whole time series.
+    """
+
+    __tablename__ = "activity_track_chunks"
+    __table_args__ = (sa.Index("idx_activity_track_chunks_tile", "tile_x", "tile_y"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    activity_id: Mapped[int] = mapped_column(
+        ForeignKey("activities.id", name="activity_track_chunk_activity_id"),
+        nullable=False,
+        index=True,
+    )
+    segment_id: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    tile_x: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    tile_y: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    xy: Mapped[bytes] = mapped_column(sa.LargeBinary, nullable=False)
@@ -0,0 +1,40 @@
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from ...core.raster_map import OSM_TILE_SIZE
+from ...core.rasterization import count_polylines, line_width_for_zoom
+
+
+def time_series_segments(time_series: pd.DataFrame) -> list[list[np.ndarray]]:
+    return [
+        [np.column_stack((group["x"], group["y"]))]
+        for _segment_id, group in time_series.groupby("segment_id")
+    ]
+
+
+def paint_segments(
+    tile_counts: np.ndarray,
+    segments: Iterable[list[np.ndarray]],
+    *,
+    x: int,
+    y: int,
+    z: int,
+) -> None:
+    """Add one to every pixel that a segment covers.
+
+    Each segment is given as a list of polylines with ``x``/``y`` in zoom-0
+    tile coordinates. A segment counts once per pixel, no matter how many of
+    its polylines cover it.
+    """
+    offset = np.array([x, y])
+    count_polylines(
+        (
+            [(xy * 2**z - offset) * OSM_TILE_SIZE for xy in polylines]
+            for polylines in segments
+        ),
+        tile_counts.shape,
+        line_width_for_zoom(z),
+        counts=tile_counts,
+    )
@@ -0,0 +1,194 @@
+"""Fill the heatmap cache ahead of time.
+
+Without this, the first visit of the heatmap after an import renders all tiles
+of the new activities while the map is panned. Pre-warming renders the tiles
+that the activities touch in a process pool instead, at the zoom levels that
+have been browsed recently. The workers use `_get_counts` like the web
+interface does, so they write to the same cache.
+"""
+
+import datetime
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, cast
+
+import sqlalchemy
+from flask import Flask, current_app
+from tqdm import tqdm
+
+from ...core.activities import ActivityRepository
+from ...core.config import ConfigAccessor
+from ...core.datamodel import DB, ActivityTile, UiConfig
+from .blueprint import _get_counts
+from .model import HeatmapTileCache
+
+logger = logging.getLogger(__name__)
+
+# Zoom levels of cached tiles used within this time count as browsed.
+RECENTLY_BROWSED = datetime.timedelta(days=90)
+
+# Keeps the metadata of the activities cached in a worker process.
+_worker_repository = ActivityRepository()
+
+
+def browsed_zoom_levels(since: datetime.datetime) -> list[int]:
+    """Zoom levels with tiles of the plain heatmap that were used since then."""
+    return list(
+        DB.session.scalars(
+            sqlalchemy.select(HeatmapTileCache.zoom)
+            .where(
+                HeatmapTileCache.search_query_id.is_(None),
+                HeatmapTileCache.last_used >= since,
+            )
+            .distinct()
+            .order_by(HeatmapTileCache.zoom)
+        ).all()
+    )
+
+
+def tiles_to_prewarm(
+    zoom_levels: list[int],
+    min_activities: int,
+    activity_ids: set[int] | None = None,
+) -> list[tuple[int, int, int]]:
+    """Tiles without an up to date cache entry, deepest zoom first.
+
+    Only tiles with enough activities to be cached are considered. If
+    `activity_ids` is given, only the tiles that these activities touch.
+    """
+    query = (
+        sqlalchemy.select(ActivityTile.zoom, ActivityTile.tile_x, ActivityTile.tile_y)
+        .where(ActivityTile.zoom.in_(zoom_levels))
+        .group_by(ActivityTile.zoom, ActivityTile.tile_x, ActivityTile.tile_y)
+        .having(
+            sqlalchemy.func.count(sqlalchemy.distinct(ActivityTile.activity_id))
+            >= max(min_activities, 1)
+        )
+    )
+    if activity_ids is None:
+        tiles = set(DB.session.execute(query).tuples())
+    else:
+        tiles = set()
+        # SQLite limits the number of parameters of a statement.
+        for chunk in itertools.batched(sorted(activity_ids), 500):
+            touched = (
+                sqlalchemy.select(
+                    ActivityTile.zoom, ActivityTile.tile_x, ActivityTile.tile_y
+                )
+                .where(
+                    ActivityTile.zoom.in_(zoom_levels),
+                    ActivityTile.activity_id.in_(chunk),
+                )
+                .distinct()
+            )
+            tiles.update(
+                DB.session.execute(
+                    query.where(
+                        sqlalchemy.tuple_(
+                            ActivityTile.zoom, ActivityTile.tile_x, ActivityTile.tile_y
+                        ).in_(touched)
+                    )
+                ).tuples()
+            )
+
+    cached = DB.session.execute(
+        sqlalchemy.select(
+            HeatmapTileCache.zoom, HeatmapTileCache.tile_x, HeatmapTileCache.tile_y
+        ).where(
+            HeatmapTileCache.search_query_id.is_(None),
+            HeatmapTileCache.zoom.in_(zoom_levels),
+            sqlalchemy.not_(HeatmapTileCache.is_dirty),
+        )
+    ).tuples()
+    tiles.difference_update(cached)
+    return sorted(tiles, key=lambda tile: (-tile[0], tile[1], tile[2]))
+
+
+def prewarm_heatmap_cache(
+    tiles: list[tuple[int, int, int]], database_uri: str, workers: int
+) -> int:
+    """Render the tiles into the heatmap cache and return how many there were.
+
+    The tiles are rendered one zoom level after the other, deepest first, such
+    that the tiles above can be assembled from the ones just rendered. With
+    fewer than two workers, or an in-memory database, everything is rendered
+    in this process.
+    """
+    if not tiles:
+        return 0
+    zoom_levels = sorted({zoom for zoom, _, _ in tiles}, reverse=True)
+    with tqdm(total=len(tiles), desc="Pre-warm heatmap", delay=1) as progress:
+        if workers < 2 or database_uri == "sqlite:///:memory:":
+            repository = ActivityRepository()
+            config = ConfigAccessor().ui()
+            for zoom, tile_x, tile_y in tiles:
+                _get_counts(tile_x, tile_y, zoom, {}, config, repository)
+                progress.update()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                # Forking is not safe, this may run next to the web server.
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(database_uri,),
+            ) as executor:
+                for zoom in zoom_levels:
+                    for _ in executor.map(
+                        _render_tile,
+                        [tile for tile in tiles if tile[0] == zoom],
+                        chunksize=16,
+                    ):
+                        progress.update()
+    logger.info(f"Pre-warmed {len(tiles)} heatmap tiles.")
+    return len(tiles)
+
+
+def start_heatmap_prewarming(
+    activity_ids: set[int], workers: int | None = None
+) -> threading.Thread | None:
+    """Pre-warm the tiles of the given activities in a background thread."""
+    zoom_levels = browsed_zoom_levels(datetime.datetime.now() - RECENTLY_BROWSED)
+    if not activity_ids or not zoom_levels:
+        return None
+    tiles = tiles_to_prewarm(
+        zoom_levels, ConfigAccessor().ui().heatmap_cache_min_activities, activity_ids
+    )
+    if not tiles:
+        return None
+    logger.info(
+        f"Pre-warming {len(tiles)} heatmap tiles at zoom levels {zoom_levels} in the background."
+    )
+    # The thread needs the app itself, not the proxy of this context.
+    app: Flask = cast(Any, current_app)._get_current_object()
+    thread = threading.Thread(
+        target=_prewarm_in_app,
+        args=(app, tiles, workers or os.cpu_count() or 1),
+        name="heatmap-prewarm",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _prewarm_in_app(app: Flask, tiles: list[tuple[int, int, int]], workers: int):
+    with app.app_context():
+        try:
+            prewarm_heatmap_cache(tiles, app.config["SQLALCHEMY_DATABASE_URI"], workers)
+        except Exception:
+            logger.exception("Pre-warming the heatmap cache failed.")
+
+
+def _init_worker(database_uri: str) -> None:
+    from ...webui.app import create_worker_app
+
+    create_worker_app(database_uri).app_context().push()
+
+
+def _render_tile(tile: tuple[int, int, int]) -> None:
+    zoom, tile_x, tile_y = tile
+    config: UiConfig = ConfigAccessor().ui()
+    _get_counts(tile_x, tile_y, zoom, {}, config, _worker_repository)
@@ -0,0 +1,80 @@
+"""Heatmap tiles computed from the cached tiles one zoom level deeper.
+
+Rasterizing a tile at a low zoom level needs every activity in a large area.
+When the four children of a tile are cached, the tile is assembled from them
+instead. This is only done up to zoom 17, below that the line width grows with
+the zoom level and the children would have thicker lines.
+"""
+
+import numpy as np
+
+from ...core.raster_map import OSM_TILE_SIZE
+from ...core.tile_visits import get_activity_ids_in_tile
+from .cache import blob_to_counts, get_child_tile_caches
+
+PYRAMID_MAX_CHILD_ZOOM = 17
+
+
+def downsample_counts(counts: np.ndarray) -> np.ndarray:
+    """Halve the resolution of a count tile.
+
+    The four pixels of each 2×2 block are summed up and divided by four. This
+    is rounded up, such that a single track doesn't vanish.
+    """
+    height, width = counts.shape
+    block_sums = counts.reshape(height // 2, 2, width // 2, 2).sum(axis=(1, 3))
+    return (block_sums + 3) // 4
+
+
+def counts_from_children(
+    zoom: int,
+    tile_x: int,
+    tile_y: int,
+    search_query_id: int | None,
+    activity_ids: set[int],
+) -> tuple[np.ndarray, set[int]] | None:
+    """Assemble a tile from its cached children.
+
+    Returns the counts and the included activities, or `None` if a child with
+    activities is not cached, is dirty or does not hold exactly the activities
+    that pass through it.
+    """
+    if zoom + 1 > PYRAMID_MAX_CHILD_ZOOM:
+        return None
+    cache_entries = {
+        (entry.tile_x, entry.tile_y): entry
+        for entry in get_child_tile_caches(zoom, tile_x, tile_y, search_query_id)
+    }
+    if not cache_entries:
+        return None
+
+    half = OSM_TILE_SIZE // 2
+    counts = np.zeros((OSM_TILE_SIZE, OSM_TILE_SIZE), dtype=np.int32)
+    included_activity_ids: set[int] = set()
+    for i in range(2):
+        for j in range(2):
+            child_x = 2 * tile_x + j
+            child_y = 2 * tile_y + i
+            child_activity_ids = (
+                get_activity_ids_in_tile(zoom + 1, child_x, child_y) & activity_ids
+            )
+            cache_entry = cache_entries.get((child_x, child_y))
+            if cache_entry is None:
+                if child_activity_ids:
+                    return None
+                continue
+            if cache_entry.is_dirty:
+                return None
+            if set(cache_entry.included_activity_ids or []) != child_activity_ids:
+                return None
+            try:
+                child_counts = blob_to_counts(cache_entry.counts)
+            except ValueError:
+                return None
+            if child_counts.shape != (OSM_TILE_SIZE, OSM_TILE_SIZE):
+                return None
+            counts[i * half : (i + 1) * half, j * half : (j + 1) * half] = (
+                downsample_counts(child_counts)
+            )
+            included_activity_ids |= child_activity_ids
+    return counts, included_activity_ids
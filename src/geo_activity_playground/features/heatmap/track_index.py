@@ -0,0 +1,210 @@
+"""Index of the projected activity tracks, cut into zoom-17 tiles.
+
+Rendering a heatmap tile only needs the parts of the tracks that cross it.
+Instead of reading every time series that touches a tile, the heatmap reads
+the runs of points stored in `ActivityTrackChunk` for the tiles in question.
+"""
+
+import collections
+import logging
+import math
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from tqdm import tqdm
+
+from ...core.activities import ActivityRepository
+from ...core.datamodel import DB, Activity
+from .model import ActivityTrackChunk
+
+logger = logging.getLogger(__name__)
+
+TRACK_INDEX_ZOOM = 17
+
+
+def split_track_into_chunks(
+    time_series: pd.DataFrame,
+) -> list[tuple[int, int, int, np.ndarray]]:
+    """Cut a time series into runs of points that lie in the same zoom-17 tile.
+
+    Returns tuples of ``(segment_id, tile_x, tile_y, xy)`` where ``xy`` has the
+    shape ``(n, 2)``. Runs don't cross segment boundaries, but they include the
+    neighboring point of the same segment on either side.
+
+    A line between two points that are further apart is also stored under the
+    tiles that it crosses on the way, as a run of just these two points. The
+    tiles next to the ends already find the line in the runs of its ends.
+    """
+    if len(time_series) == 0:
+        return []
+    x = time_series["x"].to_numpy(dtype=np.float64)
+    y = time_series["y"].to_numpy(dtype=np.float64)
+    segment = time_series["segment_id"].to_numpy(dtype=np.int64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y, segment = x[finite], y[finite], segment[finite]
+    if len(x) == 0:
+        return []
+
+    tile_x = np.floor(x * 2**TRACK_INDEX_ZOOM).astype(np.int64)
+    tile_y = np.floor(y * 2**TRACK_INDEX_ZOOM).astype(np.int64)
+
+    same_segment = segment[1:] == segment[:-1]
+    is_start = np.ones(len(x), dtype=bool)
+    is_start[1:] = (
+        (tile_x[1:] != tile_x[:-1]) | (tile_y[1:] != tile_y[:-1]) | ~same_segment
+    )
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(x))
+
+    # Extend each run by one point on either side, unless that point belongs to
+    # another segment. The lines to the neighboring tiles are then drawn, too.
+    begins = starts.copy()
+    extend_begin = starts > 0
+    extend_begin[extend_begin] = same_segment[starts[extend_begin] - 1]
+    begins[extend_begin] -= 1
+    stops = ends.copy()
+    extend_end = ends < len(x)
+    extend_end[extend_end] = same_segment[ends[extend_end] - 1]
+    stops[extend_end] += 1
+
+    xy = np.column_stack((x, y))
+    chunks = [
+        (int(segment[start]), int(tile_x[start]), int(tile_y[start]), xy[begin:stop])
+        for start, begin, stop in zip(starts, begins, stops)
+    ]
+
+    (long_lines,) = np.nonzero(
+        same_segment
+        & (
+            (np.abs(tile_x[1:] - tile_x[:-1]) > 1)
+            | (np.abs(tile_y[1:] - tile_y[:-1]) > 1)
+        )
+    )
+    for i in long_lines:
+        ends_x = (tile_x[i], tile_x[i + 1])
+        ends_y = (tile_y[i], tile_y[i + 1])
+        for crossed_x, crossed_y in _crossed_tiles(
+            *(xy[i : i + 2] * 2**TRACK_INDEX_ZOOM).ravel()
+        ):
+            if any(
+                abs(crossed_x - end_x) <= 1 and abs(crossed_y - end_y) <= 1
+                for end_x, end_y in zip(ends_x, ends_y)
+            ):
+                continue
+            chunks.append((int(segment[i]), crossed_x, crossed_y, xy[i : i + 2]))
+    return chunks
+
+
+def _crossed_tiles(
+    x1: float, y1: float, x2: float, y2: float
+) -> Iterator[tuple[int, int]]:
+    """Tiles that the line between two points in tile coordinates touches."""
+    if x1 > x2:
+        x1, y1, x2, y2 = x2, y2, x1, y1
+    for column in range(math.floor(x1), math.floor(x2) + 1):
+        if x1 == x2:
+            y_begin, y_end = y1, y2
+        else:
+            slope = (y2 - y1) / (x2 - x1)
+            y_begin = y1 + (max(column, x1) - x1) * slope
+            y_end = y1 + (min(column + 1, x2) - x1) * slope
+        for row in range(
+            math.floor(min(y_begin, y_end)), math.floor(max(y_begin, y_end)) + 1
+        ):
+            yield column, row
+
+
+def index_activity_track(activity: Activity) -> int:
+    """Replace the indexed track of an activity with its current time series."""
+    DB.session.execute(
+        sqlalchemy.delete(ActivityTrackChunk).where(
+            ActivityTrackChunk.activity_id == activity.id
+        )
+    )
+    chunks = split_track_into_chunks(activity.time_series)
+    DB.session.add_all(
+        ActivityTrackChunk(
+            activity_id=activity.id,
+            segment_id=segment_id,
+            tile_x=tile_x,
+            tile_y=tile_y,
+            xy=xy.tobytes(),
+        )
+        for segment_id, tile_x, tile_y, xy in chunks
+    )
+    DB.session.commit()
+    return len(chunks)
+
+
+def remove_activity_track(activity_id: int) -> int:
+    result = DB.session.execute(
+        sqlalchemy.delete(ActivityTrackChunk).where(
+            ActivityTrackChunk.activity_id == activity_id
+        )
+    )
+    DB.session.commit()
+    return int(getattr(result, "rowcount", 0) or 0)
+
+
+def update_track_index(repository: ActivityRepository) -> None:
+    """Index the tracks of all activities that are not in the index yet."""
+    indexed_ids = set(
+        DB.session.scalars(
+            sqlalchemy.select(ActivityTrackChunk.activity_id).distinct()
+        ).all()
+    )
+    unindexed_ids = [
+        activity_id
+        for activity_id in repository.get_activity_ids()
+        if activity_id not in indexed_ids
+    ]
+    for activity_id in tqdm(unindexed_ids, desc="Track index", delay=1):
+        try:
+            index_activity_track(repository.get_activity_by_id(activity_id))
+        except OSError:
+            logger.warning(f"Cannot index track of activity {activity_id}.")
+
+
+def get_track_runs(
+    zoom: int, tile_x: int, tile_y: int, activity_ids: set[int]
+) -> dict[int, dict[int, list[np.ndarray]]]:
+    """Indexed track runs near a tile, by activity and segment.
+
+    The lookup includes the zoom-17 tiles bordering the tile, so that lines
+    which cut across a corner of the tile without a point inside are found.
+    """
+    if not activity_ids:
+        return {}
+    if zoom <= TRACK_INDEX_ZOOM:
+        factor = 2 ** (TRACK_INDEX_ZOOM - zoom)
+        x_min, x_max = tile_x * factor, (tile_x + 1) * factor - 1
+        y_min, y_max = tile_y * factor, (tile_y + 1) * factor - 1
+    else:
+        x_min = x_max = tile_x // 2 ** (zoom - TRACK_INDEX_ZOOM)
+        y_min = y_max = tile_y // 2 ** (zoom - TRACK_INDEX_ZOOM)
+
+    rows = DB.session.execute(
+        sqlalchemy.select(
+            ActivityTrackChunk.activity_id,
+            ActivityTrackChunk.segment_id,
+            ActivityTrackChunk.xy,
+        )
+        .where(
+            ActivityTrackChunk.tile_x >= x_min - 1,
+            ActivityTrackChunk.tile_x <= x_max + 1,
+            ActivityTrackChunk.tile_y >= y_min - 1,
+            ActivityTrackChunk.tile_y <= y_max + 1,
+        )
+        .order_by(ActivityTrackChunk.id)
+    )
+    runs: dict[int, dict[int, list[np.ndarray]]] = collections.defaultdict(
+        lambda: collections.defaultdict(list)
+    )
+    for activity_id, segment_id, xy in rows:
+        if activity_id in activity_ids:
+            runs[activity_id][segment_id].append(
+                np.frombuffer(xy, dtype=np.float64).reshape(-1, 2)
+            )
+    return runs
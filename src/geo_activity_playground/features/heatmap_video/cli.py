@@ -1,12 +1,17 @@
 import argparse
 import collections
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
 import os
 import pathlib
+from collections.abc import Iterator
+from typing import Any, cast
 
-import matplotlib.pyplot as pl
 import numpy as np
 import pandas as pd
-from PIL import Image, ImageDraw
+from PIL import Image
 from tqdm import tqdm
 
 from ...core.activities import ActivityRepository
@@ -17,7 +22,9 @@ from ...core.raster_map import (
     map_image_from_tile_bounds,
     tile_bounds_around_center,
 )
+from ...core.rasterization import line_width_for_zoom
 from ...core.tiles import compute_tile_float
+from .video import DecayingCounts, HeatmapColorizer, rasterize_day
 
 
 def main_heatmap_video(options) -> None:
@@ -62,6 +69,24 @@ def register_main_heatmap_video(subparsers: argparse._SubParsersAction) -> None:
         default=1080,
         help="Output video height in pixels (default: %(default)s)",
     )
+    subparser.add_argument(
+        "--video",
+        type=pathlib.Path,
+        default=None,
+        help="Write the frames into this video file instead of one PNG per day",
+    )
+    subparser.add_argument(
+        "--fps",
+        type=int,
+        default=30,
+        help="Frames per second for the video file (default: %(default)s)",
+    )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel processes for drawing the tracks (default: %(default)s)",
+    )
     subparser.set_defaults(func=main_heatmap_video)
 
 
@@ -80,55 +105,93 @@ def _render_heatmap_video(options, zoom: int, video_size) -> None:
 
     activities_per_day = collections.defaultdict(set)
     for activity in tqdm(
-        repository.iter_activities(), desc="Gather activities per day"
+        repository.iter_activities(drop_na=True), desc="Gather activities per day"
     ):
-        activities_per_day[activity["start"].date()].add(activity["id"])
+        activities_per_day[activity.start.date()].add(activity.id)
 
-    running_counts = np.zeros(background.shape[:2], np.float64)
-
-    output_dir = pathlib.Path("Heatmap Video")
-    output_dir.mkdir(exist_ok=True)
+    shape = background.shape[:2]
+    pixel_center = np.array([options.video_width / 2, options.video_height / 2])
+    width = line_width_for_zoom(zoom)
 
     first_day = min(activities_per_day)
     last_day = max(activities_per_day)
     days = pd.date_range(first_day, last_day)
-    for current_day in tqdm(days, desc="Generate video frames"):
-        for activity_id in activities_per_day[current_day.date()]:
-            im = Image.new("L", video_size)
-            draw = ImageDraw.Draw(im)
-
-            time_series = repository.get_time_series(activity_id)
-            for _, group in time_series.groupby("segment_id"):
-                tile_xz = group["x"] * 2**zoom
-                tile_yz = group["y"] * 2**zoom
-
-                xy_pixels = list(
-                    zip(
-                        (tile_xz - center_xy[0]) * OSM_TILE_SIZE
-                        + options.video_width / 2,
-                        (tile_yz - center_xy[1]) * OSM_TILE_SIZE
-                        + options.video_height / 2,
-                    )
-                )
-                pixels = [int(value) for t in xy_pixels for value in t]
-                draw.line(pixels, fill=1, width=max(3, 6 * (zoom - 17)))
-                aim = np.array(im)
-                running_counts += aim
-
-        tile_counts = np.sqrt(running_counts) / 5
-        tile_counts[tile_counts > 1.0] = 1.0
-
-        cmap = pl.get_cmap(config_accessor.ui().color_scheme_for_heatmap)
-        data_color = cmap(tile_counts)
-        data_color[data_color == cmap(0.0)] = 0.0  # remove background color
 
-        rendered = np.zeros_like(background)
-        for c in range(3):
-            rendered[:, :, c] = (1.0 - data_color[:, :, c]) * background[
-                :, :, c
-            ] + data_color[:, :, c]
-
-        img = Image.fromarray((rendered * 255).astype("uint8"), "RGB")
-        img.save(output_dir / f"{current_day.date()}.png", format="png")
+    def iter_rasterizations() -> Iterator[tuple[int, functools.partial]]:
+        for day_index, current_day in enumerate(days):
+            activity_ids = activities_per_day[current_day.date()]
+            if not activity_ids:
+                continue
+            segments = []
+            for activity_id in activity_ids:
+                time_series = repository.get_time_series(activity_id)
+                for _, group in time_series.groupby("segment_id"):
+                    xy = np.column_stack((group["x"], group["y"])) * 2**zoom
+                    xy = (xy - center_xy) * OSM_TILE_SIZE + pixel_center
+                    if _is_in_frame(xy, shape, width):
+                        segments.append([xy])
+            yield day_index, functools.partial(rasterize_day, segments, shape, width)
+
+    counts = DecayingCounts(shape, options.decay)
+    colorizer = HeatmapColorizer(
+        background, config_accessor.ui().color_scheme_for_heatmap
+    )
 
-        running_counts *= 1 - options.decay
+    executor = None
+    if options.workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=options.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    pending: collections.deque[
+        tuple[int, concurrent.futures.Future[tuple[np.ndarray, np.ndarray]]]
+    ] = collections.deque()
+    rasterizations = iter_rasterizations()
+
+    with contextlib.ExitStack() as stack:
+        if executor is not None:
+            stack.callback(executor.shutdown, cancel_futures=True)
+        if options.video is not None:
+            import imageio.v2 as imageio
+
+            options.video.parent.mkdir(parents=True, exist_ok=True)
+            writer = stack.enter_context(
+                imageio.get_writer(options.video, fps=options.fps)
+            )
+        else:
+            output_dir = pathlib.Path("Heatmap Video")
+            output_dir.mkdir(exist_ok=True)
+
+        for day_index, current_day in enumerate(
+            tqdm(days, desc="Generate video frames")
+        ):
+            # The following days are rasterized by the workers in the meantime.
+            while len(pending) < max(2 * options.workers, 1):
+                task = next(rasterizations, None)
+                if task is None:
+                    break
+                if executor is None:
+                    future: concurrent.futures.Future[tuple[np.ndarray, np.ndarray]] = (
+                        concurrent.futures.Future()
+                    )
+                    future.set_result(task[1]())
+                else:
+                    future = executor.submit(task[1])
+                pending.append((task[0], future))
+            if pending and pending[0][0] == day_index:
+                counts.add(day_index, *pending.popleft()[1].result())
+
+            rendered = colorizer.render(*counts.decayed(day_index))
+            if options.video is not None:
+                cast(Any, writer).append_data(rendered)
+            else:
+                img = Image.fromarray(rendered, "RGB")
+                img.save(output_dir / f"{current_day.date()}.png", format="png")
+
+
+def _is_in_frame(xy: np.ndarray, shape: tuple[int, int], width: float) -> bool:
+    lower = np.nanmin(xy, axis=0) - width
+    upper = np.nanmax(xy, axis=0) + width
+    return bool(
+        upper[0] >= 0 and lower[0] < shape[1] and upper[1] >= 0 and lower[1] < shape[0]
+    )
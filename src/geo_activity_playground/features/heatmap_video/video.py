@@ -0,0 +1,111 @@
+"""Frames of the heatmap video.
+
+The counts decay by a factor every day. Instead of multiplying all counts every
+day, they are stored relative to a reference day and the decay since then is
+applied when a frame is colored. Days without activities therefore don't change
+the counts, and coloring only touches the pixels that have been covered.
+"""
+
+import math
+
+import matplotlib.pyplot as pl
+import numpy as np
+
+from ...core.rasterization import count_polylines
+
+# The stored counts grow with the inverse of the decay since the reference day,
+# they are rescaled before they could overflow.
+_MAX_GROWTH = 1e100
+
+
+class DecayingCounts:
+    def __init__(self, shape: tuple[int, int], decay: float) -> None:
+        self.shape = shape
+        self._keep = 1.0 - decay
+        self._values = np.zeros(shape[0] * shape[1], dtype=np.float64)
+        self._pixels = np.zeros(0, dtype=np.int64)
+        self._is_covered = np.zeros(shape[0] * shape[1], dtype=bool)
+        self._reference_day = 0
+
+    def add(self, day: int, pixels: np.ndarray, counts: np.ndarray) -> None:
+        """Add counts of a day to the sorted flat pixel indices."""
+        decay = self._decay_since_reference(day)
+        if decay == 0 or 1 / decay > _MAX_GROWTH:
+            self._values[self._pixels] *= decay
+            self._reference_day = day
+            decay = 1.0
+        self._values[pixels] += counts / decay
+        new_pixels = pixels[~self._is_covered[pixels]]
+        self._is_covered[new_pixels] = True
+        # Sorted pixels are faster to look up when coloring.
+        self._pixels = np.insert(
+            self._pixels, np.searchsorted(self._pixels, new_pixels), new_pixels
+        )
+
+    def decayed(self, day: int) -> tuple[np.ndarray, np.ndarray]:
+        """Flat indices of the covered pixels and their counts on the day."""
+        return self._pixels, self._values[self._pixels] * self._decay_since_reference(
+            day
+        )
+
+    def _decay_since_reference(self, day: int) -> float:
+        days = day - self._reference_day
+        if self._keep == 0:
+            return 1.0 if days == 0 else 0.0
+        return math.pow(self._keep, days)
+
+
+class HeatmapColorizer:
+    """Colors the counts with a colormap on top of a background image."""
+
+    def __init__(self, background: np.ndarray, cmap_name: str) -> None:
+        self.shape = background.shape[:2]
+        self._background = background.reshape(-1, 3)
+        self._background_bytes = (self._background * 255).astype(np.uint8)
+        cmap = pl.get_cmap(cmap_name)
+        self._num_colors = cmap.N
+        lut = cmap(np.arange(cmap.N))
+        # Channels that match the lowest color are transparent.
+        lut[lut == cmap(0.0)] = 0.0
+        self._lut = lut[:, :3]
+        self._pixels: np.ndarray | None = None
+        self._pixel_background = np.zeros((0, 3))
+
+    def render(self, pixels: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # The covered pixels only change on days with activities.
+        if pixels is not self._pixels:
+            self._pixels = pixels
+            self._pixel_background = np.take(self._background, pixels, axis=0)
+
+        # Same quantization as calling the colormap with floats.
+        level = np.sqrt(counts) / 5
+        np.minimum(level, 1.0, out=level)
+        level *= self._num_colors
+        level[level == self._num_colors] = self._num_colors - 1
+        index = level.astype(np.int64)
+
+        # The lowest color is transparent, these pixels show the background.
+        colored = np.flatnonzero(index > 0)
+        color = np.take(self._lut, index[colored], axis=0)
+        rendered = 1.0 - color
+        rendered *= np.take(self._pixel_background, colored, axis=0)
+        rendered += color
+        rendered *= 255
+
+        image = self._background_bytes.copy()
+        # Assigning whole pixels at once is faster than rows of three bytes.
+        _as_pixels(image)[pixels[colored]] = _as_pixels(rendered.astype(np.uint8))
+        return image.reshape(*self.shape, 3)
+
+
+def _as_pixels(image: np.ndarray) -> np.ndarray:
+    return image.view(np.dtype((np.void, 3))).reshape(-1)
+
+
+def rasterize_day(
+    groups: list[list[np.ndarray]], shape: tuple[int, int], width: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Flat indices of the pixels that the tracks of a day cover and counts."""
+    counts = count_polylines(groups, shape, width).ravel()
+    pixels = np.flatnonzero(counts)
+    return pixels, counts[pixels]
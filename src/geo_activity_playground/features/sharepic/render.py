@@ -14,6 +14,7 @@ from ...core.raster_map import (
     map_image_from_tile_bounds,
     tile_bounds_around_center,
 )
+from ...core.rasterization import count_polylines
 
 _SHAREPIC_FOOTER_HEIGHT = 115
 _SHAREPIC_HEADER_HEIGHT = 50
@@ -80,30 +81,26 @@ def make_sharepic_base(time_series_list: list[pd.DataFrame], config: MapConfig):
     tile_bounds.y2 += footer_height / OSM_TILE_SIZE
     background = map_image_from_tile_bounds(tile_bounds, config)
 
-    img = Image.fromarray((background * 255).astype("uint8"), "RGB")
-    draw = ImageDraw.Draw(img, mode="RGBA")
-
     map_center_y = header_height + target_map_height / 2
+    pixel_center = np.array([target_width / 2, map_center_y])
 
+    segments = []
     for time_series in time_series_list:
         time_series = time_series.loc[
             np.isfinite(time_series["x"]) & np.isfinite(time_series["y"])
         ]
-        if len(time_series) == 0:
-            continue
         for _index, group in time_series.groupby("segment_id"):
-            tile_xz = group["x"] * 2**zoom
-            tile_yz = group["y"] * 2**zoom
-            xy = list(
-                zip(
-                    (tile_xz - tile_xz_center[0]) * OSM_TILE_SIZE + target_width / 2,
-                    (tile_yz - tile_xz_center[1]) * OSM_TILE_SIZE + map_center_y,
-                )
-            )
-            draw.line(xy, fill=(255, 255, 255, 120), width=7)
-            draw.line(xy, fill=(220, 50, 30), width=4)
-
-    return img
+            xy = np.column_stack((group["x"], group["y"])) * 2**zoom
+            segments.append([(xy - tile_xz_center) * OSM_TILE_SIZE + pixel_center])
+
+    pixels = (background * 255).astype("uint8")
+    halo = count_polylines(segments, pixels.shape[:2], 7) > 0
+    track = count_polylines(segments, pixels.shape[:2], 4) > 0
+    halo_alpha = 120 / 255
+    pixels[halo] = pixels[halo] * (1 - halo_alpha) + 255 * halo_alpha
+    pixels[track] = (220, 50, 30)
+
+    return Image.fromarray(pixels, "RGB")
 
 
 def _draw_sharepic_stats(
@@ -21,6 +21,7 @@ class StravaCheckoutActivitySource(ActivitySource):
         repository: ActivityRepository,  # noqa: ARG002
         begin: str | None = None,  # noqa: ARG002
         end: str | None = None,  # noqa: ARG002
+        jobs: int = 1,  # noqa: ARG002
     ) -> None:
         import_from_strava_checkout(
             config_accessor.activity_import(),
@@ -42,6 +43,7 @@ class StravaApiActivitySource(ActivitySource):
         repository: ActivityRepository,
         begin: str | None = None,
         end: str | None = None,
+        jobs: int = 1,  # noqa: ARG002
     ) -> None:
         import_from_strava_api(
             config_accessor,
@@ -72,7 +74,8 @@ class StravaActivitySource(ActivitySource):
         repository: ActivityRepository,
         begin: str | None = None,
         end: str | None = None,
+        jobs: int = 1,
     ) -> None:
         for source in self._sources:
             if source.is_enabled(config_accessor):
-                source.import_activities(config_accessor, repository, begin, end)
+                source.import_activities(config_accessor, repository, begin, end, jobs)
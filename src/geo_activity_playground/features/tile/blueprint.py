@@ -1,10 +1,9 @@
-import io
-
-import matplotlib.pyplot as pl
 import numpy as np
-from flask import Blueprint, Response
+from flask import Blueprint, Response, abort
 
 from ...core.raster_map import ImageTransform, TileGetter
+from ...core.tile_encoding import encode_png, encoded_png_response
+from ...core.tile_fetcher import write_tile_file
 
 
 def make_tile_blueprint(
@@ -15,10 +14,15 @@ def make_tile_blueprint(
 
     @blueprint.route("/<scheme>/<int:z>/<int:x>/<int:y>.png")
     def tile(scheme: str, z: int, x: int, y: int) -> Response:
-        map_tile = np.array(tile_getter.get_tile(z, x, y)) / 255
-        transformed_tile = image_transforms[scheme].transform_image(map_tile)
-        f = io.BytesIO()
-        pl.imsave(f, transformed_tile, format="png")
-        return Response(bytes(f.getbuffer()), mimetype="image/png")
+        if scheme not in image_transforms:
+            abort(404)
+        path = tile_getter.transformed_tile_path(scheme, z, x, y)
+        if path.exists():
+            data = path.read_bytes()
+        else:
+            map_tile = np.array(tile_getter.get_tile(z, x, y))
+            data = encode_png(image_transforms[scheme].transform_tile(map_tile))
+            write_tile_file(path, data)
+        return encoded_png_response(data)
 
     return blueprint
@@ -15,10 +15,10 @@ from flask_babel import gettext as _
 from ...core.activities import ActivityRepository
 from ...core.config import ConfigAccessor
 from ...core.datamodel import DB, Activity
+from ...core.file_fingerprints import file_sha256
 from ...core.scan import scan_for_activities
 from ...webui.authenticator import Authenticator, needs_authentication
 from ...webui.flasher import Flasher, FlashTypes
-from ..directory_import.importer import file_sha256
 
 
 def _content_suffix(path: pathlib.Path) -> str:
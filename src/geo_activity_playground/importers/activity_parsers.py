@@ -1,14 +1,20 @@
+import array
 import datetime
+import functools
 import gzip
+import io
 import logging
 import pathlib
-import xml
+import tempfile
+import xml.etree.ElementTree
 from collections.abc import Iterator
 
 import charset_normalizer
 import dateutil.parser
 import fitdecode.exceptions
 import gpxpy.gpx
+import gpxpy.gpxfield
+import numpy as np
 import pandas as pd
 import tcxreader.tcxreader
 import xmltodict
@@ -92,84 +98,169 @@ def read_fit_activity(path: pathlib.Path, open) -> tuple[Activity, pd.DataFrame]
     'descent': 11}
     """
     activity = Activity()
-    rows = []
+    points = _TrackPoints(units_per_degree=(2**32) / 360)
     with open(path, "rb") as f:
-        with fitdecode.FitReader(f) as fit:
-            for frame in fit:
-                if frame.frame_type == fitdecode.FIT_FRAME_DATA:
-                    fields = {
-                        field.name: field for field in frame.fields if field.value
-                    }
-                    values = {
-                        field.name: field.value for field in frame.fields if field.value
-                    }
-                    if (
-                        "timestamp" in values
-                        and values.get("position_lat", None)
-                        and values.get("position_long", None)
-                    ):
-                        time = values["timestamp"]
-                        if isinstance(time, datetime.datetime):
-                            pass
-                        elif time is None or isinstance(time, int):
-                            time = None
-                        else:
-                            raise RuntimeError(f"Cannot parse time: {time} in {path}.")
-                        row = {
-                            "time": time,
-                            "latitude": values["position_lat"] / ((2**32) / 360),
-                            "longitude": values["position_long"] / ((2**32) / 360),
-                        }
-                        if "heart_rate" in fields:
-                            row["heartrate"] = values["heart_rate"]
-                        if "calories" in fields and isinstance(
-                            values["calories"], float
-                        ):
-                            row["calories"] = values["calories"]
-                        if "cadence" in fields:
-                            row["cadence"] = values["cadence"]
-                        if "power" in fields:
-                            row["power"] = values["power"]
-                        if "distance" in fields:
-                            row["distance"] = values["distance"]
-                        if "altitude" in fields:
-                            row["elevation"] = values["altitude"]
-                        if "enhanced_altitude" in fields:
-                            row["elevation"] = _first_of_tuple(
-                                values["enhanced_altitude"]
-                            )
-                        if "speed" in fields:
-                            factor = _fit_speed_unit_factor(fields["speed"].units)
-                            row["speed"] = values["speed"] * factor
-                        if "enhanced_speed" in fields:
-                            factor = _fit_speed_unit_factor(
-                                fields["enhanced_speed"].units
-                            )
-                            row["speed"] = (
-                                _first_of_tuple(values["enhanced_speed"]) * factor
-                            )
-                        if "grade" in fields:
-                            row["grade"] = values["grade"]
-                        if "temperature" in fields:
-                            row["temperature"] = values["temperature"]
-                        if "gps_accuracy" in fields:
-                            row["gps_accuracy"] = values["gps_accuracy"]
-                        rows.append(row)
-
-                    # Additional meta data fields as documented in https://developer.garmin.com/fit/file-types/workout/.
-                    if "wkt_name" in fields:
-                        activity.name = values["wkt_name"]
-                    if "sport" in fields:
-                        kind_name = str(values["sport"])
-                        if "sub_sport" in values:
-                            kind_name += " " + str(values["sub_sport"])
-                        activity.kind = get_or_make_kind(kind_name)
-                    if "total_calories" in fields:
-                        activity.calories = int(str(values["total_calories"]))
-                    if "total_strides" in fields:
-                        activity.steps = 2 * int(values["total_strides"])
-
-    return activity, pd.DataFrame.from_records(rows)
+        content = f.read()
+    # The values are converted here, which is faster than letting the default
+    # processor look at every field. A mismatching checksum would only give a
+    # warning, but computing it takes a third of the time.
+    with fitdecode.FitReader(
+        io.BytesIO(content), processor=None, check_crc=fitdecode.CrcCheck.DISABLED
+    ) as fit:
+        for frame in fit:
+            if frame.frame_type != fitdecode.FIT_FRAME_DATA:
+                continue
+            # Only the fields that are used are collected. Like in a dict of all
+            # fields, the last one with a value wins.
+            fields = {}
+            for field in frame.fields:
+                if field.value and field.name in _FIT_FIELD_NAMES:
+                    fields[field.name] = field
+
+            if (
+                "timestamp" in fields
+                and "position_lat" in fields
+                and "position_long" in fields
+            ):
+                time = fields["timestamp"].value
+                if not isinstance(time, int):
+                    raise RuntimeError(f"Cannot parse time: {time} in {path}.")
+                elif time >= fitdecode.processors.FIT_DATETIME_MIN:
+                    time = datetime.datetime.fromtimestamp(
+                        fitdecode.processors.FIT_UTC_REFERENCE + time, datetime.UTC
+                    )
+                else:
+                    # Smaller values are seconds since the device was turned on.
+                    time = None
+                points.add(
+                    time, fields["position_lat"].value, fields["position_long"].value
+                )
+                if "heart_rate" in fields:
+                    points.set("heartrate", fields["heart_rate"].value)
+                if "calories" in fields and isinstance(fields["calories"].value, float):
+                    points.set("calories", fields["calories"].value)
+                if "cadence" in fields:
+                    points.set("cadence", fields["cadence"].value)
+                if "power" in fields:
+                    points.set("power", fields["power"].value)
+                if "distance" in fields:
+                    points.set("distance", fields["distance"].value)
+                if "altitude" in fields or "enhanced_altitude" in fields:
+                    if "enhanced_altitude" in fields:
+                        elevation = _first_of_tuple(fields["enhanced_altitude"].value)
+                    else:
+                        elevation = fields["altitude"].value
+                    points.set("elevation", elevation)
+                if "speed" in fields or "enhanced_speed" in fields:
+                    if "speed" in fields:
+                        field = fields["speed"]
+                        speed = field.value * _fit_speed_unit_factor(field.units)
+                    if "enhanced_speed" in fields:
+                        field = fields["enhanced_speed"]
+                        speed = _first_of_tuple(field.value) * _fit_speed_unit_factor(
+                            field.units
+                        )
+                    points.set("speed", speed)
+                if "grade" in fields:
+                    points.set("grade", fields["grade"].value)
+                if "temperature" in fields:
+                    points.set("temperature", fields["temperature"].value)
+                if "gps_accuracy" in fields:
+                    points.set("gps_accuracy", fields["gps_accuracy"].value)
+
+            # Additional meta data fields as documented in https://developer.garmin.com/fit/file-types/workout/.
+            if "wkt_name" in fields:
+                activity.name = fields["wkt_name"].value
+            if "sport" in fields:
+                kind_name = str(fields["sport"].value)
+                if "sub_sport" in fields:
+                    kind_name += " " + str(fields["sub_sport"].value)
+                activity.kind = get_or_make_kind(kind_name)
+            if "total_calories" in fields:
+                activity.calories = int(str(fields["total_calories"].value))
+            if "total_strides" in fields:
+                activity.steps = 2 * int(fields["total_strides"].value)
+
+    return activity, points.to_data_frame()
+
+
+_FIT_FIELD_NAMES = frozenset(
+    [
+        "timestamp",
+        "position_lat",
+        "position_long",
+        "heart_rate",
+        "calories",
+        "cadence",
+        "power",
+        "distance",
+        "altitude",
+        "enhanced_altitude",
+        "speed",
+        "enhanced_speed",
+        "grade",
+        "temperature",
+        "gps_accuracy",
+        "wkt_name",
+        "sport",
+        "sub_sport",
+        "total_calories",
+        "total_strides",
+    ]
+)
+
+
+class _TrackPoints:
+    """Columns of the track points, filled without a dict per point.
+
+    The positions are kept in typed arrays and converted to degrees at once.
+    The other columns are only stored for the points that have them.
+    """
+
+    def __init__(self, units_per_degree: float = 1.0) -> None:
+        self._units_per_degree = units_per_degree
+        self._time: list[datetime.datetime | None] = []
+        self._latitude = array.array("d")
+        self._longitude = array.array("d")
+        self._columns: dict[str, tuple[list[int], list]] = {}
+
+    def add(
+        self, time: datetime.datetime | None, latitude: float, longitude: float
+    ) -> None:
+        self._time.append(time)
+        self._latitude.append(latitude)
+        self._longitude.append(longitude)
+
+    def set(self, column: str, value) -> None:
+        """Value of the column at the last point, replacing an earlier one."""
+        row = len(self._time) - 1
+        column_data = self._columns.get(column)
+        if column_data is None:
+            column_data = self._columns[column] = ([], [])
+        rows, values = column_data
+        if rows and rows[-1] == row:
+            values[-1] = value
+        else:
+            rows.append(row)
+            values.append(value)
+
+    def to_data_frame(self) -> pd.DataFrame:
+        if not self._time:
+            return pd.DataFrame()
+        data = {
+            "time": self._time,
+            "latitude": np.frombuffer(self._latitude) / self._units_per_degree,
+            "longitude": np.frombuffer(self._longitude) / self._units_per_degree,
+        }
+        for column, (rows, values) in self._columns.items():
+            if len(rows) == len(self._time):
+                data[column] = values
+            else:
+                # Points without a value get NaN, as when the rows are dicts.
+                data[column] = pd.Series(values, index=rows).reindex(
+                    range(len(self._time))
+                )
+        return pd.DataFrame(data)
 
 
 def _fit_speed_unit_factor(unit: str) -> float:
@@ -188,7 +279,156 @@ def _first_of_tuple(value: float | tuple[float, float]) -> float:
         return float(value)
 
 
+_GARMIN_TPX_V1 = "{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}"
+_GARMIN_TPX_V2 = "{http://www.garmin.com/xmlschemas/TrackPointExtension/v2}"
+
+
 def read_gpx_activity(path: pathlib.Path, open) -> tuple[Activity, pd.DataFrame]:
+    try:
+        return _iterparse_gpx_activity(path, open)
+    except (
+        xml.etree.ElementTree.ParseError,
+        ValueError,
+        gpxpy.gpx.GPXException,
+    ) as e:
+        # Broken XML or values are left to gpxpy, which also tries to guess the
+        # encoding and has the error messages that are expected.
+        logger.debug(f"Reading {path} with gpxpy: {e}")
+        return _read_gpx_activity_with_gpxpy(path, open)
+
+
+def _iterparse_gpx_activity(path: pathlib.Path, open) -> tuple[Activity, pd.DataFrame]:
+    """Stream through the file and only keep the current point in memory.
+
+    Gives the same as gpxpy: The first `name`, `desc` and `type` of a track
+    count, and extensions are only read in GPX 1.1.
+    """
+    activity = Activity()
+    kind_name = None
+    track_fields: dict[str, str | None] = {}
+    points = _TrackPoints()
+    with open(path, "rb") as f:
+        parents: list[xml.etree.ElementTree.Element] = []
+        for event, element in xml.etree.ElementTree.iterparse(
+            f, events=("start", "end")
+        ):
+            if event == "start":
+                if not parents:
+                    # gpxpy drops the default namespace, the extensions that
+                    # are in it have tags without namespace.
+                    ns = element.tag[: element.tag.find("}") + 1]
+                    is_gpx_11 = element.get("version") == "1.1"
+                    trk, trkseg, trkpt = ns + "trk", ns + "trkseg", ns + "trkpt"
+                parents.append(element)
+                continue
+
+            parents.pop()
+            depth = len(parents)
+            if depth == 3 and element.tag == trkpt:
+                if parents[1].tag == trk and parents[2].tag == trkseg:
+                    _add_gpx_point(points, element, ns, is_gpx_11)
+            elif depth == 2 and parents[1].tag == trk:
+                track_fields.setdefault(element.tag, element.text)
+            elif depth == 1 and element.tag == trk:
+                name = track_fields.get(ns + "name")
+                if activity.name is None and name:
+                    activity.name = name
+                description = track_fields.get(ns + "desc")
+                if activity.description is None and description:
+                    activity.description = description
+                kind = track_fields.get(ns + "type") if is_gpx_11 else None
+                if kind_name is None and kind:
+                    kind_name = kind
+                track_fields = {}
+            # Elements are dropped once they are read.
+            if 1 <= depth <= 3:
+                del parents[-1][-1]
+
+    if kind_name is not None:
+        activity.kind = get_or_make_kind(kind_name)
+    df = points.to_data_frame()
+    # Some files don't have elevation information. In these cases we remove the column.
+    if "elevation" in df.columns and not df["elevation"].any():
+        del df["elevation"]
+    return activity, df
+
+
+def _add_gpx_point(
+    points: _TrackPoints,
+    element: xml.etree.ElementTree.Element,
+    ns: str,
+    with_extensions: bool,
+) -> None:
+    latitude = element.get("lat")
+    longitude = element.get("lon")
+    if latitude is None or longitude is None:
+        raise ValueError("Track point without position")
+    points.add(
+        _parse_gpx_time(_child_text(element, ns + "time")),
+        float(latitude),
+        float(longitude),
+    )
+    elevation = _child_text(element, ns + "ele")
+    points.set("elevation", None if elevation is None else float(elevation))
+
+    extensions = element.find(ns + "extensions")
+    if not with_extensions or extensions is None:
+        return
+    for ext in extensions:
+        if ext.tag == ns + "power" and ext.text:
+            points.set("power", float(ext.text))
+        if ext.tag == _GARMIN_TPX_V1 + "TrackPointExtension":
+            for datum in ext:
+                if datum.tag == _GARMIN_TPX_V1 + "hr" and datum.text:
+                    points.set("heartrate", int(float(datum.text)))
+                if datum.tag == _GARMIN_TPX_V1 + "cad" and datum.text:
+                    points.set("cadence", int(float(datum.text)))
+        if ext.tag == _GARMIN_TPX_V2 + "TrackPointExtension":
+            for datum in ext:
+                if datum.tag == _GARMIN_TPX_V2 + "PowerInWatts" and datum.text:
+                    points.set("power", float(datum.text))
+
+
+def _parse_gpx_time(text: str | None) -> datetime.datetime | None:
+    """Same as `gpxpy.gpxfield.parse_time`, the usual format is parsed in C."""
+    if not text:
+        return None
+    if (
+        len(text) >= 19
+        and text[4] == text[7] == "-"
+        and text[10] in "T "
+        and text[13] == text[16] == ":"
+    ):
+        try:
+            time = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            pass
+        else:
+            offset = time.utcoffset()
+            if offset is None:
+                return time
+            return time.replace(
+                tzinfo=_simple_tz(offset // datetime.timedelta(minutes=1))
+            )
+    return gpxpy.gpxfield.parse_time(text)
+
+
+@functools.cache
+def _simple_tz(minutes: int) -> gpxpy.gpxfield.SimpleTZ:
+    tz = gpxpy.gpxfield.SimpleTZ()
+    tz.offset = minutes
+    return tz
+
+
+def _child_text(element: xml.etree.ElementTree.Element, tag: str) -> str | None:
+    """Text of the first child with the tag."""
+    child = element.find(tag)
+    return None if child is None else child.text
+
+
+def _read_gpx_activity_with_gpxpy(
+    path: pathlib.Path, open
+) -> tuple[Activity, pd.DataFrame]:
     activity = Activity()
     points = []
     with open(path, "rb") as f:
@@ -261,7 +501,143 @@ def read_gpx_activity(path: pathlib.Path, open) -> tuple[Activity, pd.DataFrame]
     return activity, df
 
 
+_TCX = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+_TCX_EXTENSIONS = "{http://www.garmin.com/xmlschemas/ActivityExtension/v2}"
+_TCX_TRACK_PATH = [
+    _TCX + "Activities",
+    _TCX + "Activity",
+    _TCX + "Lap",
+    _TCX + "Track",
+]
+_TCX_TIME_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S%z",
+]
+
+
 def read_tcx_activity(path: pathlib.Path, opener) -> pd.DataFrame:
+    try:
+        return _iterparse_tcx_activity(path, opener)
+    except (xml.etree.ElementTree.ParseError, ValueError) as e:
+        logger.debug(f"Reading {path} with tcxreader: {e}")
+        return _read_tcx_activity_with_tcxreader(path, opener)
+
+
+def _iterparse_tcx_activity(path: pathlib.Path, opener) -> pd.DataFrame:
+    """Stream through the file and only keep the current point in memory.
+
+    Reads the values like tcxreader, points without a position are skipped.
+    """
+    points = _TrackPoints()
+    with opener(path, "rb") as f:
+        parents: list[xml.etree.ElementTree.Element] = []
+        for event, element in xml.etree.ElementTree.iterparse(
+            f, events=("start", "end")
+        ):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            depth = len(parents)
+            if (
+                depth == 5
+                and element.tag == _TCX + "Trackpoint"
+                and [parent.tag for parent in parents[1:]] == _TCX_TRACK_PATH
+            ):
+                _add_tcx_point(points, element)
+            # Elements are dropped once they are read.
+            if 1 <= depth <= 5:
+                del parents[-1][-1]
+    return points.to_data_frame()
+
+
+def _add_tcx_point(
+    points: _TrackPoints, element: xml.etree.ElementTree.Element
+) -> None:
+    time = latitude = longitude = elevation = distance = None
+    heartrate = cadence = watts = None
+    for child in element:
+        if child.tag == _TCX + "Time" and child.text is not None:
+            time = _parse_tcx_time(child.text)
+        elif child.tag == _TCX + "Position":
+            for position in child:
+                if position.tag == _TCX + "LatitudeDegrees":
+                    latitude = _float_or_none(position.text)
+                elif position.tag == _TCX + "LongitudeDegrees":
+                    longitude = _float_or_none(position.text)
+        elif child.tag == _TCX + "AltitudeMeters":
+            elevation = _float_or_none(child.text)
+        elif child.tag == _TCX + "DistanceMeters":
+            distance = _float_or_none(child.text)
+        elif child.tag == _TCX + "HeartRateBpm":
+            for value in child:
+                heartrate = _int_or_none(value.text)
+        elif child.tag == _TCX + "Cadence":
+            cadence = _int_or_none(child.text)
+        elif child.tag == _TCX + "Extensions":
+            for extension in child:
+                if extension.tag == _TCX_EXTENSIONS + "TPX":
+                    for value in extension:
+                        if value.tag == _TCX_EXTENSIONS + "Watts":
+                            watts = _watts_or_none(value.text)
+
+    if not latitude or not longitude:
+        return
+    if time is None:
+        raise ValueError("Track point without time")
+    points.add(time, latitude, longitude)
+    if elevation:
+        points.set("elevation", elevation)
+    if heartrate:
+        points.set("heartrate", heartrate)
+    if cadence:
+        points.set("cadence", cadence)
+    if watts:
+        points.set("power", float(watts))
+    if distance:
+        points.set("distance", distance)
+
+
+def _parse_tcx_time(text: str) -> datetime.datetime:
+    for time_format in _TCX_TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot parse time {text!r}")
+
+
+def _float_or_none(text: str | None) -> float | None:
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _int_or_none(text: str | None) -> int | None:
+    if text is None:
+        return None
+    try:
+        return int(float(text))
+    except ValueError:
+        return None
+
+
+def _watts_or_none(text: str | None) -> float | int | None:
+    """Power like tcxreader reads it, an integer unless it has a decimal point."""
+    if text is None:
+        return None
+    try:
+        return float(text) if "." in text else int(text)
+    except ValueError:
+        return None
+
+
+def _read_tcx_activity_with_tcxreader(path: pathlib.Path, opener) -> pd.DataFrame:
     """
     cadence = {NoneType} None
      distance = {float} 7.329999923706055
@@ -278,12 +654,16 @@ def read_tcx_activity(path: pathlib.Path, opener) -> pd.DataFrame:
     with opener(path, "rb") as f:
         content = f.read().strip()
 
-    stripped_file = pathlib.Path("Cache/temp.tcx")
-    stripped_file.parent.mkdir(exist_ok=True)
-    with open(stripped_file, "wb") as f:
-        f.write(content)
-    data = tcx_reader.read(str(stripped_file))
-    stripped_file.unlink()
+    # Every file gets its own copy, several are read at once during an import.
+    pathlib.Path("Cache").mkdir(exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir="Cache", suffix=".tcx", delete=False
+    ) as stripped_file:
+        stripped_file.write(content)
+    try:
+        data = tcx_reader.read(stripped_file.name)
+    finally:
+        pathlib.Path(stripped_file.name).unlink()
 
     for trackpoint in data.trackpoints:
         if trackpoint.latitude and trackpoint.longitude:
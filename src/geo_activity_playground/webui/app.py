@@ -30,7 +30,7 @@ from flask_babel import Babel
 from markupsafe import Markup
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from ..core.activities import ActivityRepository
+from ..core.activities import ActivityRepository, prune_activity_changes
 from ..core.config import ConfigAccessor, import_config_json
 from ..core.currency import format_money
 from ..core.datamodel import (
@@ -205,6 +205,43 @@ def get_secret_key():
     return secret
 
 
+def _init_database(app: Flask, database_uri: str) -> None:
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    is_sqlite_file = (
+        database_uri.startswith("sqlite:///") and database_uri != "sqlite:///:memory:"
+    )
+    if is_sqlite_file:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {"timeout": 30},
+        }
+
+    DB.init_app(app)
+
+    if is_sqlite_file:
+        with app.app_context():
+
+            @sqlalchemy.event.listens_for(DB.engine, "connect")
+            def _set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute("PRAGMA busy_timeout=30000")
+                cursor.close()
+
+
+def create_worker_app(database_uri: str) -> Flask:
+    """
+    Create a Flask application with only the database, for worker processes.
+
+    The main process has already migrated the database and done the startup
+    work of `create_app`. Workers of a process pool only need the models, so
+    they don't repeat any of it.
+    """
+    app = Flask(__name__)
+    _init_database(app, database_uri)
+    return app
+
+
 def create_app(
     database_uri: str = "sqlite:///database.sqlite",
     secret_key: str | None = None,
@@ -232,11 +269,6 @@ def create_app(
     # redirects use the original scheme (e.g. HTTPS) and host.
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
-    if database_uri.startswith("sqlite:///") and database_uri != "sqlite:///:memory:":
-        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-            "connect_args": {"timeout": 30},
-        }
     app.config["UPLOAD_FOLDER"] = "Activities"
     app.secret_key = secret_key or get_secret_key()
 
@@ -265,18 +297,7 @@ def create_app(
 
     Babel(app, locale_selector=get_locale)
 
-    DB.init_app(app)
-
-    if database_uri.startswith("sqlite:///") and database_uri != "sqlite:///:memory:":
-        with app.app_context():
-
-            @sqlalchemy.event.listens_for(DB.engine, "connect")
-            def _set_sqlite_pragmas(dbapi_connection, connection_record):
-                cursor = dbapi_connection.cursor()
-                cursor.execute("PRAGMA journal_mode=WAL")
-                cursor.execute("PRAGMA synchronous=NORMAL")
-                cursor.execute("PRAGMA busy_timeout=30000")
-                cursor.close()
+    _init_database(app, database_uri)
 
     if run_migrations:
         app.config["ALEMBIC"] = {"script_location": "../alembic/versions"}
@@ -302,7 +323,9 @@ def create_app(
         delete_small_heatmap_cache_entries(
             config_accessor.ui().heatmap_cache_min_activities
         )
-        run_database_maintenance_if_due([compress_uncompressed_heatmap_cache_blobs])
+        run_database_maintenance_if_due(
+            [compress_uncompressed_heatmap_cache_blobs, prune_activity_changes]
+        )
         map_tile_url = config_accessor.map().map_tile_url
 
     authenticator = Authenticator(config_accessor)
@@ -499,6 +522,8 @@ def web_ui_main(
     http_server: Literal["waitress", "werkzeug", "gunicorn"] = "gunicorn",
     threads: int = 8,
     workers: int = 4,
+    prewarm_heatmap: bool = False,
+    jobs: int = 1,
 ) -> None:
     os.chdir(basedir)
 
@@ -551,6 +576,8 @@ def web_ui_main(
                 strava_end=strava_end,
                 hammerhead_begin=hammerhead_begin,
                 hammerhead_end=hammerhead_end,
+                prewarm_heatmap=prewarm_heatmap,
+                jobs=jobs,
             )
 
     # Migrate Photos/original/ → Photos/ (flatten inbox structure)
@@ -46,16 +46,19 @@ from ...core.tile_visits import (
 )
 from ...features.activity_photos.model import Photo
 from ...features.directory_import.blueprint import register_directory_import_settings
-from ...features.explorer.clustering import compute_tile_evolution
+from ...features.explorer.clustering import cluster_state_cache, compute_tile_evolution
 from ...features.explorer.model import (
     ClusterHistoryCheckpoint,
     ClusterHistoryEvent,
+    ClusterHistoryVersion,
     ClusterMembership,
+    ExplorerStateVersion,
     ExplorerTileBookmark,
+    ExplorerTileCache,
 )
 from ...features.hammerhead.blueprint import register_hammerhead_settings
 from ...features.heatmap.blueprint import register_heatmap_settings
-from ...features.heatmap.model import HeatmapTileCache
+from ...features.heatmap.model import ActivityTrackChunk, HeatmapTileCache
 from ...features.plot_builder.model import PlotSpec
 from ...features.segments.model import Segment, SegmentCheck, SegmentMatch
 from ...features.square_planner.model import SquarePlannerBookmark
@@ -206,10 +209,22 @@ def _truncate_user_content_tables() -> None:
     DB.session.execute(sqlalchemy.delete(SegmentMatch))
     DB.session.execute(sqlalchemy.delete(SegmentCheck))
     DB.session.execute(sqlalchemy.delete(ActivityTile))
+    DB.session.execute(sqlalchemy.delete(ActivityTrackChunk))
     DB.session.execute(sqlalchemy.delete(TileVisit))
     DB.session.execute(sqlalchemy.delete(ClusterHistoryEvent))
     DB.session.execute(sqlalchemy.delete(ClusterHistoryCheckpoint))
+    DB.session.execute(
+        sqlalchemy.update(ClusterHistoryVersion).values(
+            version=ClusterHistoryVersion.version + 1
+        )
+    )
     DB.session.execute(sqlalchemy.delete(ClusterMembership))
+    DB.session.execute(sqlalchemy.delete(ExplorerTileCache))
+    DB.session.execute(
+        sqlalchemy.update(ExplorerStateVersion).values(
+            version=ExplorerStateVersion.version + 1
+        )
+    )
     DB.session.execute(sqlalchemy.delete(Photo))
     DB.session.execute(sqlalchemy.delete(Activity))
     DB.session.execute(sqlalchemy.delete(Segment))
@@ -396,7 +411,10 @@ def make_settings_blueprint(
                     FlashTypes.SUCCESS,
                 )
             return redirect(url_for(".maintenance"))
-        return render_template("settings/maintenance.html.j2")
+        return render_template(
+            "settings/maintenance.html.j2",
+            cluster_state_cache_stats=cluster_state_cache.stats(),
+        )
 
     @blueprint.route("/language", methods=["GET", "POST"])
     @needs_authentication(authenticator)
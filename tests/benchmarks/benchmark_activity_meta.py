@@ -0,0 +1,115 @@
+"""Measure how the activity metadata build scales with the number of activities.
+
+Run it with `uv run python tests/benchmarks/benchmark_activity_meta.py`.
+"""
+
+import datetime
+import os
+import tempfile
+import time
+import zoneinfo
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from geo_activity_playground.core.datamodel import (
+    DB,
+    Activity,
+    Equipment,
+    Kind,
+    _utc_to_local,
+    query_activity_meta,
+)
+from geo_activity_playground.webui.app import create_app
+
+TIMEZONES = [
+    "Europe/Berlin",
+    "Europe/London",
+    "America/New_York",
+    "Asia/Tokyo",
+    "Australia/Sydney",
+    None,
+]
+
+
+def add_activities(num_activities: int, first_id: int) -> None:
+    rng = np.random.default_rng(first_id)
+    begin = datetime.datetime(2015, 1, 1)
+    DB.session.execute(
+        sqlalchemy.insert(Activity),
+        [
+            {
+                "id": first_id + i,
+                "name": f"Activity {first_id + i}",
+                "distance_km": float(rng.uniform(1, 100)),
+                "start": begin
+                + datetime.timedelta(seconds=int(rng.integers(0, 10 * 365 * 86400))),
+                "iana_timezone": TIMEZONES[int(rng.integers(0, len(TIMEZONES)))],
+                "elapsed_time": datetime.timedelta(seconds=int(rng.integers(600, 3e4))),
+                "moving_time": datetime.timedelta(seconds=int(rng.integers(600, 3e4))),
+                "calories": int(rng.integers(100, 3000)),
+                "equipment_id": 1,
+                "kind_id": 1,
+            }
+            for i in range(num_activities)
+        ],
+    )
+    DB.session.commit()
+
+
+def start_local_per_row(df: pd.DataFrame) -> list:
+    """The conversion that `query_activity_meta` did before, for comparison."""
+    start_local = []
+    for start, iana_timezone in zip(df["start"], df["iana_timezone"]):
+        tz = "UTC" if pd.isna(iana_timezone) else iana_timezone
+        if pd.isna(start):
+            start_local.append(start)
+        else:
+            start_local.append(
+                start.tz_localize(zoneinfo.ZoneInfo("UTC"))
+                .tz_convert(zoneinfo.ZoneInfo(tz))
+                .tz_localize(None)
+            )
+    return start_local
+
+
+def best_of(function, *args, repetitions: int = 3) -> float:
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        app = create_app(database_uri="sqlite:///:memory:", run_migrations=False)
+        with app.app_context():
+            DB.session.add(Equipment(id=1, name="Bike"))
+            DB.session.add(Kind(id=1, name="Ride", consider_for_achievements=True))
+            DB.session.commit()
+
+            print(
+                f"{'Activities':>10} {'Metadata':>10} {'Per row':>10}"
+                f" {'Grouped':>10} {'Speedup':>8}"
+            )
+            num_activities = 0
+            for target in [1_000, 5_000, 20_000, 50_000]:
+                add_activities(target - num_activities, num_activities + 1)
+                num_activities = target
+                meta_time = best_of(query_activity_meta)
+                df = query_activity_meta()
+                per_row_time = best_of(start_local_per_row, df)
+                grouped_time = best_of(_utc_to_local, df["start"], df["iana_timezone"])
+                print(
+                    f"{num_activities:10d} {meta_time * 1000:8.1f}ms"
+                    f" {per_row_time * 1000:8.1f}ms {grouped_time * 1000:8.1f}ms"
+                    f" {per_row_time / grouped_time:7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
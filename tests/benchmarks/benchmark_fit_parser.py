@@ -0,0 +1,120 @@
+"""Compare the FIT reader with building a dict per data message and per point.
+
+Run it with `uv run python tests/benchmarks/benchmark_fit_parser.py`. The
+decoding by fitdecode with its default settings alone is listed as well.
+"""
+
+import datetime
+import gzip
+import pathlib
+import time
+
+import fitdecode
+import pandas as pd
+
+# Registers all models, an activity refers to photos.
+import geo_activity_playground.webui.app  # noqa: F401
+from geo_activity_playground.core.datamodel import Kind
+from geo_activity_playground.importers import activity_parsers
+
+TESTDATA_DIR = pathlib.Path(__file__).parent.parent.parent / "testdata"
+
+
+def read_with_rows(path: pathlib.Path, open) -> pd.DataFrame:
+    """The points of the FIT file, read like the importer did at first."""
+    rows = []
+    with open(path, "rb") as f:
+        with fitdecode.FitReader(f) as fit:
+            for frame in fit:
+                if frame.frame_type != fitdecode.FIT_FRAME_DATA:
+                    continue
+                fields = {field.name: field for field in frame.fields if field.value}
+                values = {
+                    field.name: field.value for field in frame.fields if field.value
+                }
+                if (
+                    "timestamp" in values
+                    and values.get("position_lat", None)
+                    and values.get("position_long", None)
+                ):
+                    time = values["timestamp"]
+                    if not isinstance(time, datetime.datetime):
+                        time = None
+                    row = {
+                        "time": time,
+                        "latitude": values["position_lat"] / ((2**32) / 360),
+                        "longitude": values["position_long"] / ((2**32) / 360),
+                    }
+                    for field, column in [
+                        ("heart_rate", "heartrate"),
+                        ("cadence", "cadence"),
+                        ("power", "power"),
+                        ("distance", "distance"),
+                        ("altitude", "elevation"),
+                    ]:
+                        if field in fields:
+                            row[column] = values[field]
+                    if "enhanced_altitude" in fields:
+                        row["elevation"] = activity_parsers._first_of_tuple(
+                            values["enhanced_altitude"]
+                        )
+                    if "speed" in fields:
+                        row["speed"] = values["speed"] * 3.6
+                    if "enhanced_speed" in fields:
+                        row["speed"] = (
+                            activity_parsers._first_of_tuple(values["enhanced_speed"])
+                            * 3.6
+                        )
+                    rows.append(row)
+    return pd.DataFrame.from_records(rows)
+
+
+def decode_only(path: pathlib.Path, open) -> None:
+    with open(path, "rb") as f:
+        with fitdecode.FitReader(f) as fit:
+            for _ in fit:
+                pass
+
+
+def best_of(function, *args, repetitions: int = 5):
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main() -> None:
+    activity_parsers.get_or_make_kind = lambda name: Kind(name=name)
+    print(
+        f"{'File':45} {'Points':>7} {'Decode':>9} {'Rows':>9} {'Columns':>9}"
+        f" {'Speedup':>8}"
+    )
+    totals = [0.0, 0.0, 0.0]
+    for path in sorted(TESTDATA_DIR.rglob("*.fit*")):
+        opener = gzip.open if path.suffix == ".gz" else open
+        decode_time, _ = best_of(decode_only, path, opener)
+        rows_time, expected = best_of(read_with_rows, path, opener)
+        columns_time, (_, actual) = best_of(
+            activity_parsers.read_fit_activity, path, opener
+        )
+        pd.testing.assert_frame_equal(
+            actual[expected.columns], expected, check_dtype=False
+        )
+        for i, timing in enumerate([decode_time, rows_time, columns_time]):
+            totals[i] += timing
+        print(
+            f"{path.name[:45]:45} {len(actual):7} {decode_time * 1000:7.1f}ms"
+            f" {rows_time * 1000:7.1f}ms {columns_time * 1000:7.1f}ms"
+            f" {rows_time / columns_time:7.2f}x"
+        )
+    decode_time, rows_time, columns_time = totals
+    print(
+        f"{'Total':45} {'':7} {decode_time * 1000:7.1f}ms {rows_time * 1000:7.1f}ms"
+        f" {columns_time * 1000:7.1f}ms {rows_time / columns_time:7.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the streaming GPX reader with building the gpxpy object tree.
+
+Run it with `uv run python tests/benchmarks/benchmark_gpx_parser.py`.
+"""
+
+import gzip
+import pathlib
+import time
+
+import pandas as pd
+
+# Registers all models, an activity refers to photos.
+import geo_activity_playground.webui.app  # noqa: F401
+from geo_activity_playground.core.datamodel import Kind
+from geo_activity_playground.importers import activity_parsers
+
+TESTDATA_DIR = pathlib.Path(__file__).parent.parent.parent / "testdata"
+
+
+def best_of(function, *args, repetitions: int = 5):
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main() -> None:
+    activity_parsers.get_or_make_kind = lambda name: Kind(name=name)
+    print(f"{'File':45} {'Points':>7} {'gpxpy':>9} {'Stream':>9} {'Speedup':>8}")
+    totals = [0.0, 0.0]
+    for path in sorted(TESTDATA_DIR.rglob("*.gpx*")):
+        opener = gzip.open if path.suffix == ".gz" else open
+        gpxpy_time, (_, expected) = best_of(
+            activity_parsers._read_gpx_activity_with_gpxpy, path, opener
+        )
+        stream_time, (_, actual) = best_of(
+            activity_parsers._iterparse_gpx_activity, path, opener
+        )
+        pd.testing.assert_frame_equal(actual, expected)
+        totals[0] += gpxpy_time
+        totals[1] += stream_time
+        print(
+            f"{path.name[:45]:45} {len(actual):7} {gpxpy_time * 1000:7.1f}ms"
+            f" {stream_time * 1000:7.1f}ms {gpxpy_time / stream_time:7.2f}x"
+        )
+    gpxpy_time, stream_time = totals
+    print(
+        f"{'Total':45} {'':7} {gpxpy_time * 1000:7.1f}ms {stream_time * 1000:7.1f}ms"
+        f" {gpxpy_time / stream_time:7.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
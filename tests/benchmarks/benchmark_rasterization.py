@@ -0,0 +1,73 @@
+"""Compare the NumPy line rasterizer with drawing every track with PIL.
+
+Run it with `uv run python tests/benchmarks/benchmark_rasterization.py`.
+"""
+
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from geo_activity_playground.core.rasterization import count_polylines
+
+
+def pil_counts(groups: list[list[np.ndarray]], shape, width: int) -> np.ndarray:
+    counts = np.zeros(shape, dtype=np.int32)
+    for polylines in groups:
+        im = Image.new("L", (shape[1], shape[0]))
+        draw = ImageDraw.Draw(im)
+        for xy in polylines:
+            draw.line(list(map(int, xy.flatten())), fill=1, width=width)
+        counts += np.array(im)
+    return counts
+
+
+def random_tracks(
+    num_tracks: int, num_points: int, step: float, shape
+) -> list[list[np.ndarray]]:
+    """Smoothly bending tracks with ``step`` pixels between the points."""
+    rng = np.random.default_rng(0)
+    tracks = []
+    for _ in range(num_tracks):
+        heading = np.cumsum(rng.normal(0, 0.05, size=num_points)) + rng.uniform(
+            0, 2 * np.pi
+        )
+        steps = step * np.column_stack((np.cos(heading), np.sin(heading)))
+        start = rng.uniform(0, 1, size=2) * [shape[1], shape[0]]
+        tracks.append([np.cumsum(steps, axis=0) + start])
+    return tracks
+
+
+def best_of(function, *args, repetitions: int = 3) -> tuple[float, np.ndarray]:
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main() -> None:
+    scenarios = [
+        # Points are recorded every second at about 5 m/s.
+        ("heatmap tile, zoom 10", (256, 256), 3, 1000, 5000, 0.05),
+        ("heatmap tile, zoom 14", (256, 256), 3, 200, 1000, 0.8),
+        ("heatmap tile, zoom 17", (256, 256), 3, 50, 200, 6.5),
+        ("heatmap tile, zoom 19", (256, 256), 12, 20, 50, 26.0),
+        ("video frame, zoom 14", (1080, 1920), 3, 50, 5000, 0.8),
+    ]
+    print(f"{'Scenario':25} {'PIL':>10} {'NumPy':>10} {'Speedup':>8} {'IoU':>6}")
+    for name, shape, width, num_tracks, num_points, step in scenarios:
+        groups = random_tracks(num_tracks, num_points, step, shape)
+        pil_time, pil_result = best_of(pil_counts, groups, shape, width)
+        numpy_time, numpy_result = best_of(count_polylines, groups, shape, width)
+        union = np.sum((pil_result > 0) | (numpy_result > 0))
+        overlap = np.sum((pil_result > 0) & (numpy_result > 0))
+        print(
+            f"{name:25} {pil_time * 1000:8.1f}ms {numpy_time * 1000:8.1f}ms"
+            f" {pil_time / numpy_time:7.1f}x {overlap / union:6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
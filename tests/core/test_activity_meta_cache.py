@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from flask import Flask
+
+from geo_activity_playground.core.activities import (
+    ActivityMetaCache,
+    prune_activity_changes,
+)
+from geo_activity_playground.core.datamodel import (
+    DB,
+    Activity,
+    ActivityChange,
+    Kind,
+    query_activity_meta,
+)
+
+
+def _assert_up_to_date(cache: ActivityMetaCache) -> None:
+    pd.testing.assert_frame_equal(cache.get(), query_activity_meta())
+
+
+def test_cache_follows_changes(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        cache = ActivityMetaCache()
+        _assert_up_to_date(cache)
+
+        activities = DB.session.scalars(
+            sqlalchemy.select(Activity).order_by(Activity.id)
+        ).all()
+        activities[0].distance_km = 123.0
+        activities[1].name = "Renamed"
+        DB.session.commit()
+        _assert_up_to_date(cache)
+        assert cache.get().loc[activities[0].id, "distance_km"] == 123.0
+
+        DB.session.delete(activities[2])
+        DB.session.commit()
+        _assert_up_to_date(cache)
+
+        kind = DB.session.scalars(sqlalchemy.select(Kind)).first()
+        kind.name = "Other"
+        DB.session.commit()
+        _assert_up_to_date(cache)
+
+        DB.session.execute(sqlalchemy.delete(Activity))
+        DB.session.commit()
+        assert len(cache.get()) == 0
+
+
+def test_unchanged_activities_are_not_logged(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        version = DB.session.scalar(sqlalchemy.func.max(ActivityChange.id))
+        activity = DB.session.scalars(sqlalchemy.select(Activity)).first()
+        activity.name = activity.name
+        DB.session.commit()
+
+        assert DB.session.scalar(sqlalchemy.func.max(ActivityChange.id)) == version
+
+
+def test_cache_reloads_after_pruning(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        cache = ActivityMetaCache()
+        cache.get()
+        activity = DB.session.scalars(sqlalchemy.select(Activity)).first()
+        activity.name = "First"
+        DB.session.commit()
+        activity.name = "Second"
+        DB.session.commit()
+
+        assert prune_activity_changes(keep=1) > 0
+
+        _assert_up_to_date(cache)
+        assert cache.get().loc[activity.id, "name"] == "Second"
+
+
+def test_callers_get_a_copy(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        cache = ActivityMetaCache()
+        meta = cache.get()
+        meta["distance_km"] = 0.0
+
+        assert cache.get()["distance_km"].sum() > 0
+
+
+def test_callers_share_the_columns(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        cache = ActivityMetaCache()
+        assert np.shares_memory(
+            cache.get()["distance_km"].to_numpy(),
+            cache.get()["distance_km"].to_numpy(),
+        )
+
+
+def test_change_counter_is_queried_once_per_request(seeded_app: Flask) -> None:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM activity_changes" in statement:
+            statements.append(statement)
+
+    with seeded_app.test_request_context():
+        cache = ActivityMetaCache()
+        sqlalchemy.event.listen(DB.engine, "before_cursor_execute", count)
+        try:
+            cache.get()
+            cache.get()
+            assert len(statements) == 1
+
+            activity = DB.session.scalars(sqlalchemy.select(Activity)).first()
+            activity.name = "Renamed"
+            DB.session.commit()
+            assert cache.get().loc[activity.id, "name"] == "Renamed"
+        finally:
+            sqlalchemy.event.remove(DB.engine, "before_cursor_execute", count)
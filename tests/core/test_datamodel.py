@@ -1,6 +1,9 @@
 import datetime
+import zoneinfo
 
-from geo_activity_playground.core.datamodel import Activity
+import pandas as pd
+
+from geo_activity_playground.core.datamodel import Activity, _utc_to_local
 
 
 def test_no_duration() -> None:
@@ -18,3 +21,31 @@ def test_zero_duration() -> None:
     )
     assert activity.average_speed_elapsed_kmh is None
     assert activity.average_speed_moving_kmh is None
+
+
+def test_utc_to_local() -> None:
+    start = pd.to_datetime(
+        pd.Series(
+            [
+                datetime.datetime(2024, 7, 1, 12, 0),
+                None,
+                datetime.datetime(2024, 1, 1, 12, 0),
+                datetime.datetime(2024, 7, 1, 23, 30),
+            ]
+        )
+    )
+    iana_timezone = pd.Series(
+        ["Europe/Berlin", "Europe/Berlin", None, "America/New_York"]
+    )
+
+    start_local = _utc_to_local(start, iana_timezone)
+
+    assert start_local.dtype == start.dtype
+    assert start_local[0] == pd.Timestamp(2024, 7, 1, 14, 0)
+    assert pd.isna(start_local[1])
+    assert start_local[2] == pd.Timestamp(2024, 1, 1, 12, 0)
+    assert start_local[3] == pd.Timestamp(
+        datetime.datetime(2024, 7, 1, 23, 30, tzinfo=zoneinfo.ZoneInfo("UTC"))
+        .astimezone(zoneinfo.ZoneInfo("America/New_York"))
+        .replace(tzinfo=None)
+    )
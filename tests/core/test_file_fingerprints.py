@@ -0,0 +1,62 @@
+import hashlib
+import os
+import pathlib
+
+import pytest
+import sqlalchemy
+
+from geo_activity_playground.core import file_fingerprints
+from geo_activity_playground.core.datamodel import DB
+from geo_activity_playground.core.file_fingerprints import (
+    FileFingerprint,
+    file_hashes,
+    forget_other_files,
+)
+
+
+@pytest.fixture
+def hashed_paths(monkeypatch: pytest.MonkeyPatch) -> list[pathlib.Path]:
+    hashed = []
+
+    def file_sha256(path: pathlib.Path) -> str:
+        hashed.append(path)
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+
+    monkeypatch.setattr(file_fingerprints, "file_sha256", file_sha256)
+    return hashed
+
+
+def test_unchanged_files_are_not_hashed_again(app_context, hashed_paths) -> None:
+    a = pathlib.Path("Activities/a.gpx")
+    b = pathlib.Path("Activities/b.gpx")
+    a.write_text("first")
+    b.write_text("second")
+
+    hashes = file_hashes([a, b, pathlib.Path("Activities/missing.gpx")])
+    assert hashes == {
+        a: hashlib.sha256(b"first").hexdigest(),
+        b: hashlib.sha256(b"second").hexdigest(),
+    }
+    assert sorted(hashed_paths) == [a, b]
+
+    hashed_paths.clear()
+    assert file_hashes([a, b]) == hashes
+    assert hashed_paths == []
+
+    # Same size, but a different modification time.
+    a.write_text("FIRST")
+    os.utime(a, ns=(0, a.stat().st_mtime_ns + 1))
+    assert file_hashes([a, b])[a] == hashlib.sha256(b"FIRST").hexdigest()
+    assert hashed_paths == [a]
+
+
+def test_fingerprints_of_other_files_are_forgotten(app_context, hashed_paths) -> None:
+    paths = [pathlib.Path(f"Activities/{i}.gpx") for i in range(3)]
+    for path in paths:
+        path.write_text(path.name)
+    file_hashes(paths)
+
+    forget_other_files(paths[1:])
+    assert DB.session.scalars(sqlalchemy.select(FileFingerprint.path)).all() == [
+        str(path) for path in paths[1:]
+    ]
@@ -0,0 +1,43 @@
+import numpy as np
+
+from geo_activity_playground.core.raster_map import (
+    BlankImageTransform,
+    GrayscaleImageTransform,
+    IdentityImageTransform,
+    InverseGrayscaleImageTransform,
+    PastelImageTransform,
+)
+from geo_activity_playground.core.tile_encoding import quantize_image
+
+
+def test_byte_transforms_match_float_transforms() -> None:
+    rng = np.random.default_rng(0)
+    tile = rng.integers(0, 256, size=(256, 256, 3), dtype=np.uint8)
+    for transform in [
+        IdentityImageTransform(),
+        GrayscaleImageTransform(),
+        PastelImageTransform(),
+        PastelImageTransform(0.25),
+        InverseGrayscaleImageTransform(),
+        BlankImageTransform(),
+    ]:
+        expected = quantize_image(transform.transform_image(tile / 255))
+        actual = transform.transform_tile(tile)
+        assert actual.dtype == np.uint8
+        assert actual.shape == tile.shape
+        # The float transforms are off by one where rounding errors add up.
+        difference = np.abs(actual.astype(np.int16) - expected)
+        assert difference.max() <= 1
+        assert np.mean(difference > 0) < 0.001
+
+
+def test_gray_tiles_stay_in_range() -> None:
+    tile = np.array([[[0, 0, 0], [255, 255, 255]]], dtype=np.uint8)
+    assert GrayscaleImageTransform().transform_tile(tile)[0, :, 0].tolist() == [
+        0,
+        255,
+    ]
+    assert InverseGrayscaleImageTransform().transform_tile(tile)[0, :, 0].tolist() == [
+        255,
+        0,
+    ]
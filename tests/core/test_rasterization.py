@@ -0,0 +1,63 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from geo_activity_playground.core.rasterization import count_polylines
+
+
+def _pil_counts(groups, shape, width) -> np.ndarray:
+    counts = np.zeros(shape, dtype=np.int32)
+    for polylines in groups:
+        im = Image.new("L", (shape[1], shape[0]))
+        draw = ImageDraw.Draw(im)
+        for xy in polylines:
+            draw.line(list(map(int, xy.flatten())), fill=1, width=width)
+        counts += np.array(im)
+    return counts
+
+
+def test_horizontal_line_has_line_width() -> None:
+    counts = count_polylines([[np.array([[10.0, 20.0], [50.0, 20.0]])]], (64, 64), 3)
+    assert counts[:, 30].nonzero()[0].tolist() == [19, 20, 21]
+    assert counts[20, :].nonzero()[0].tolist() == list(range(10, 51))
+
+
+def test_group_counts_once_per_pixel() -> None:
+    back_and_forth = np.array([[5.0, 5.0], [40.0, 40.0], [5.0, 5.0]])
+    counts = count_polylines(
+        [[back_and_forth, back_and_forth], [back_and_forth]], (64, 64), 3
+    )
+    assert counts.max() == 2
+    assert counts[20, 20] == 2
+
+
+def test_points_outside_and_non_finite_are_skipped() -> None:
+    xy = np.array([[-100.0, 10.0], [np.nan, np.nan], [100.0, 10.0], [1e6, 1e6]])
+    counts = count_polylines([[xy]], (32, 32), 3)
+    assert counts[9:12, :].tolist() == [[1] * 32] * 3
+    assert counts.sum() == 3 * 32
+
+
+def test_nothing_visible() -> None:
+    counts = count_polylines([[np.array([[100.0, 100.0]])], []], (16, 16), 3)
+    assert counts.sum() == 0
+
+
+def test_adds_to_existing_counts() -> None:
+    counts = np.ones((16, 16), dtype=np.int32)
+    result = count_polylines([[np.array([[8.0, 8.0]])]], (16, 16), 3, counts=counts)
+    assert result is counts
+    assert counts[8, 8] == 2
+
+
+def test_matches_pil_drawing() -> None:
+    rng = np.random.default_rng(42)
+    groups = [
+        [np.cumsum(rng.normal(0, 4, size=(200, 2)), axis=0) + 128] for _ in range(20)
+    ]
+    for width in [3, 6, 12]:
+        ours = count_polylines(groups, (256, 256), width)
+        reference = _pil_counts(groups, (256, 256), width)
+        overlap = np.sum((ours > 0) & (reference > 0))
+        union = np.sum((ours > 0) | (reference > 0))
+        assert overlap / union > 0.9
+        assert abs(int(ours.sum()) - int(reference.sum())) / reference.sum() < 0.1
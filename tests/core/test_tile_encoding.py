@@ -0,0 +1,56 @@
+import io
+
+import matplotlib.pyplot as pl
+import numpy as np
+from flask import Flask
+from PIL import Image
+
+from geo_activity_playground.core.tile_encoding import (
+    EMPTY_TILE_PNG,
+    encode_png,
+    png_response,
+)
+
+
+def _decode(data: bytes) -> np.ndarray:
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+def _imsave(image: np.ndarray) -> bytes:
+    f = io.BytesIO()
+    pl.imsave(f, image, format="png")
+    return f.getvalue()
+
+
+def test_encoded_pixels_match_matplotlib() -> None:
+    rng = np.random.default_rng(0)
+    for channels, dtype in [(4, np.float32), (4, np.float64), (3, np.float64)]:
+        image = rng.uniform(0, 1, size=(256, 256, channels)).astype(dtype)
+        expected = _decode(_imsave(image))
+        actual = _decode(encode_png(image.copy()))
+        if channels == 3:
+            expected = expected[:, :, :3]
+        assert np.array_equal(actual, expected)
+
+
+def test_transparent_tile_is_shared() -> None:
+    image = np.zeros((256, 256, 4), dtype=np.float32)
+    image[:, :, 0] = 0.5
+    assert encode_png(image) is EMPTY_TILE_PNG
+    assert not _decode(EMPTY_TILE_PNG)[:, :, 3].any()
+
+
+def test_unchanged_tile_is_not_sent_again() -> None:
+    image = np.zeros((256, 256, 4), dtype=np.float32)
+    image[10:20, 10:20] = [1.0, 0.0, 0.0, 0.8]
+    app = Flask(__name__)
+
+    with app.test_request_context():
+        response = png_response(image.copy())
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+
+    with app.test_request_context(headers={"If-None-Match": etag}):
+        response = png_response(image.copy())
+    assert response.status_code == 304
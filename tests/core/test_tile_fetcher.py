@@ -0,0 +1,137 @@
+import collections
+import http.server
+import io
+import threading
+import time
+
+import pytest
+import requests
+from PIL import Image
+
+from geo_activity_playground.core.tile_fetcher import TileFetcher
+
+
+class _StubTileServer(http.server.ThreadingHTTPServer):
+    """Serves a plain tile for every path and counts the requests.
+
+    It also records the most requests that were handled at the same time.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _StubTileHandler)
+        self.delay = delay
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak_active = 0
+
+    @property
+    def url_template(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{{zoom}}/{{x}}/{{y}}.png"
+
+
+class _StubTileHandler(http.server.BaseHTTPRequestHandler):
+    server: _StubTileServer
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            self.server.requests[self.path] += 1
+        if self.path.startswith("/missing"):
+            self.send_error(404)
+            return
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak_active = max(self.server.peak_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+        f = io.BytesIO()
+        Image.new("RGB", (256, 256), (10, 20, 30)).save(f, format="png")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(f.getvalue())))
+        self.end_headers()
+        self.wfile.write(f.getvalue())
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = _StubTileServer(delay=0.05)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_tiles_are_downloaded_once_in_parallel(stub_server, tmp_path) -> None:
+    fetcher = TileFetcher(workers=8, requests_per_second=0, tile_dir=tmp_path)
+    tiles = [(x, y) for x in range(4) for y in range(4)]
+
+    images = fetcher.get_tiles(14, tiles + tiles, stub_server.url_template)
+
+    assert set(images) == set(tiles)
+    assert images[(1, 2)].getpixel((0, 0)) == (10, 20, 30)
+    assert set(stub_server.requests.values()) == {1}
+    assert len(stub_server.requests) == len(tiles)
+    assert stub_server.peak_active > 1
+    assert fetcher.tile_path(14, 1, 2, stub_server.url_template).exists()
+
+
+def test_concurrent_requests_share_a_download(stub_server, tmp_path) -> None:
+    fetcher = TileFetcher(requests_per_second=0, tile_dir=tmp_path)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                fetcher.get_tile(14, 5, 5, stub_server.url_template)
+            )
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stub_server.requests["/14/5/5.png"] == 1
+    assert all(image is results[0] for image in results)
+    assert fetcher.misses == 1
+
+
+def test_requests_per_host_are_spaced_out(stub_server, tmp_path) -> None:
+    stub_server.delay = 0.0
+    fetcher = TileFetcher(workers=4, requests_per_second=20, tile_dir=tmp_path)
+
+    start = time.perf_counter()
+    fetcher.get_tiles(14, [(x, 0) for x in range(5)], stub_server.url_template)
+
+    assert time.perf_counter() - start >= 4 / 20
+
+
+def test_decoded_tiles_stay_within_budget(stub_server, tmp_path) -> None:
+    tile_bytes = 256 * 256 * 3
+    fetcher = TileFetcher(
+        requests_per_second=0, max_cache_bytes=2 * tile_bytes, tile_dir=tmp_path
+    )
+    for x in range(3):
+        fetcher.get_tile(14, x, 0, stub_server.url_template)
+    fetcher.get_tile(14, 2, 0, stub_server.url_template)
+    assert (fetcher.hits, fetcher.misses) == (1, 3)
+
+    # The first tile was evicted and is read from disk again.
+    fetcher.get_tile(14, 0, 0, stub_server.url_template)
+    assert fetcher.misses == 4
+    assert stub_server.requests["/14/0/0.png"] == 1
+
+
+def test_failed_download_is_not_remembered(stub_server, tmp_path) -> None:
+    fetcher = TileFetcher(requests_per_second=0, tile_dir=tmp_path)
+    url_template = stub_server.url_template.replace("/{zoom}", "/missing/{zoom}")
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            fetcher.get_tile(14, 0, 0, url_template)
+    assert stub_server.requests["/missing/14/0/0.png"] == 2
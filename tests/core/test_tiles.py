@@ -1,7 +1,10 @@
+import numpy as np
+
 from geo_activity_playground.core.tiles import (
     compute_tile,
     get_tile_upper_left_lat_lon,
     interpolate_missing_tile,
+    interpolate_missing_tiles,
 )
 
 
@@ -23,3 +26,19 @@ def test_interpolate() -> None:
     assert interpolate_missing_tile(2.5, 1.5, 1.25, 2.25) == (1, 1)
     assert interpolate_missing_tile(2.25, 2.5, 1.75, 1.25) == (2, 1)
     assert interpolate_missing_tile(1.25, 2.25, 2.25, 2.5) is None
+
+
+def test_interpolate_arrays_match_single_pairs() -> None:
+    rng = np.random.default_rng(0)
+    x1, y1 = rng.uniform(10, 13, 2000), rng.uniform(10, 13, 2000)
+    x2, y2 = x1 + rng.normal(0, 0.7, 2000), y1 + rng.normal(0, 0.7, 2000)
+
+    index, tile_x, tile_y = interpolate_missing_tiles(x1, y1, x2, y2)
+
+    expected = {
+        i: interpolate_missing_tile(x1[i], y1[i], x2[i], y2[i]) for i in range(len(x1))
+    }
+    assert {i: (int(x), int(y)) for i, x, y in zip(index, tile_x, tile_y)} == {
+        i: tile for i, tile in expected.items() if tile is not None
+    }
+    assert len(index) > 100
@@ -1,3 +1,5 @@
+import datetime as dt
+import os
 import pathlib
 import shutil
 
@@ -10,10 +12,12 @@ from geo_activity_playground.core.import_exclusion import (
     ImportExclusion,
     record_exclusion,
 )
+from geo_activity_playground.features.directory_import import importer
 from geo_activity_playground.features.directory_import.importer import (
     get_metadata_from_path,
     import_from_directory,
 )
+from geo_activity_playground.webui.app import create_app
 
 
 def _scan() -> None:
@@ -114,3 +118,124 @@ def test_get_metadata_from_path() -> None:
         ],
     )
     assert actual == expected
+
+
+def _import_with_jobs(directory: pathlib.Path, source: pathlib.Path, jobs: int):
+    shutil.copytree(source, directory / "Activities")
+    (directory / "Time Series").mkdir()
+    os.chdir(directory)
+    app = create_app(
+        database_uri=f"sqlite:///{directory / 'database.sqlite'}",
+        run_migrations=False,
+    )
+    with app.app_context():
+        accessor = ConfigAccessor()
+        accessor.activity_import().metadata_extraction_regexes = [
+            r"(?P<kind>[^/]+)/[-\d_ .]+(?P<name>[^/\.]+)(?:\.\w+)+$",
+        ]
+        accessor.save()
+        import_from_directory(
+            ActivityRepository(),
+            accessor.activity_import(),
+            accessor.ui(),
+            source="directory",
+            jobs=jobs,
+        )
+        return [
+            (
+                activity.id,
+                activity.path,
+                activity.name,
+                activity.kind.name,
+                activity.start,
+                round(activity.distance_km, 6),
+                len(activity.raw_time_series),
+            )
+            for activity in DB.session.scalars(
+                sqlalchemy.select(Activity).order_by(Activity.id)
+            )
+        ]
+
+
+def test_import_with_several_jobs_matches_a_single_job(
+    playground, monkeypatch, testdata_dir: pathlib.Path
+) -> None:
+    monkeypatch.chdir(playground)
+    source = testdata_dir / "Zeeland" / "Activities"
+    serial = _import_with_jobs(playground / "serial", source, jobs=1)
+    parallel = _import_with_jobs(playground / "parallel", source, jobs=2)
+    assert len(serial) > 1
+    assert parallel == serial
+
+
+def _write_tcx(path: pathlib.Path, start: dt.datetime, longitude: float) -> None:
+    trackpoints = "".join(
+        f"<Trackpoint><Time>{(start + dt.timedelta(seconds=i)).isoformat()}Z</Time>"
+        f"<Position><LatitudeDegrees>{49 + i * 1e-4}</LatitudeDegrees>"
+        f"<LongitudeDegrees>{longitude}</LongitudeDegrees></Position>"
+        "</Trackpoint>"
+        for i in range(2000)
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The whitespace before the declaration leaves these files to tcxreader.
+    path.write_text(
+        "\n<?xml version='1.0' encoding='UTF-8'?>"
+        '<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">'
+        '<Activities><Activity Sport="Biking">'
+        f"<Id>{start.isoformat()}Z</Id><Lap StartTime='{start.isoformat()}Z'>"
+        f"<Track>{trackpoints}</Track></Lap></Activity></Activities>"
+        "</TrainingCenterDatabase>"
+    )
+
+
+def test_tcx_files_are_read_with_several_jobs(playground, monkeypatch) -> None:
+    monkeypatch.chdir(playground)
+    source = playground / "source"
+    for i in range(6):
+        _write_tcx(
+            source / "Ride" / f"2026-01-0{i + 1} Tour {i}.tcx",
+            dt.datetime(2026, 1, i + 1, 8),
+            8 + i,
+        )
+    serial = _import_with_jobs(playground / "serial", source, jobs=1)
+    parallel = _import_with_jobs(playground / "parallel", source, jobs=2)
+    assert len(serial) == 6
+    assert [activity[6] for activity in serial] == [2000] * 6
+    assert parallel == serial
+
+
+def test_scan_finds_the_same_files_as_a_glob(playground) -> None:
+    for name in [
+        "a.gpx",
+        "b.fit.gz",
+        "Ride/Bike/c.fit",
+        "Ride/.hidden.gpx",
+        "Ride/notes.txt",
+        "no_suffix",
+        ".hidden/d.gpx",
+    ]:
+        path = pathlib.Path("Activities") / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    pathlib.Path("Activities/Ride/folder.gpx").mkdir()
+
+    assert importer._scan_activity_files([".txt"]) == sorted(
+        path
+        for path in pathlib.Path("Activities").rglob("*.*")
+        if path.is_file()
+        and path.suffixes
+        and not path.stem.startswith(".")
+        and path.suffix != ".txt"
+    )
+
+
+def test_scan_does_not_follow_symlinked_directories(playground) -> None:
+    pathlib.Path("Activities/Ride").mkdir(parents=True)
+    pathlib.Path("Activities/Ride/a.gpx").write_text("")
+    os.symlink("..", "Activities/Ride/loop")
+    os.symlink("a.gpx", "Activities/Ride/link.gpx")
+
+    assert importer._scan_activity_files([]) == [
+        pathlib.Path("Activities/Ride/a.gpx"),
+        pathlib.Path("Activities/Ride/link.gpx"),
+    ]
@@ -0,0 +1,72 @@
+import datetime as dt
+
+import sqlalchemy as sa
+
+from geo_activity_playground.core.datamodel import DB, Activity, TileVisit
+from geo_activity_playground.features.explorer import blueprint, tile_cache
+from geo_activity_playground.features.explorer.model import ExplorerTileCache
+from geo_activity_playground.features.explorer.tile_cache import (
+    bump_explorer_state_version,
+)
+
+
+def test_explorer_tiles_are_cached_until_the_state_changes(
+    client, app, monkeypatch
+) -> None:
+    with app.app_context():
+        DB.session.add(Activity(id=1, name="Ride"))
+        DB.session.add(
+            TileVisit(
+                zoom=14,
+                tile_x=100,
+                tile_y=200,
+                first_activity_id=1,
+                first_time=dt.datetime(2025, 1, 1),
+                last_activity_id=1,
+                last_time=dt.datetime(2025, 1, 1),
+                visit_count=1,
+            )
+        )
+        DB.session.commit()
+
+    rendered = []
+    render = blueprint._render_explorer_tile
+
+    def counting_render(*args):
+        rendered.append(args[:4])
+        return render(*args)
+
+    monkeypatch.setattr(blueprint, "_render_explorer_tile", counting_render)
+    url = "/explorer/14/tile/14/100/200.png?color_strategy=visited"
+
+    first = client.get(url)
+    second = client.get(url)
+    assert first.status_code == second.status_code == 200
+    assert second.data == first.data
+    assert len(rendered) == 1
+
+    unchanged = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert unchanged.status_code == 304
+
+    client.get("/explorer/14/tile/14/100/200.png?color_strategy=visits")
+    assert len(rendered) == 2
+
+    with app.app_context():
+        bump_explorer_state_version([14])
+        assert DB.session.scalar(sa.select(sa.func.count(ExplorerTileCache.id))) == 0
+
+    assert client.get(url).data == first.data
+    assert len(rendered) == 3
+
+
+def test_locked_database_does_not_fail_the_tile(client, app, monkeypatch) -> None:
+    def locked(*args, **kwargs):
+        raise sa.exc.OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(tile_cache.DB.session, "commit", locked)
+    response = client.get("/explorer/14/tile/14/100/200.png?color_strategy=visited")
+    monkeypatch.undo()
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert DB.session.scalar(sa.select(sa.func.count(ExplorerTileCache.id))) == 0
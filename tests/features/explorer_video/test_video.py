@@ -0,0 +1,106 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from geo_activity_playground.core.tile_fetcher import tile_fetcher, write_tile_file
+from geo_activity_playground.features.explorer_video import video
+from geo_activity_playground.features.explorer_video.video import (
+    batch_sizes,
+    iter_chunk_frames,
+    render_frames,
+    visible_tiles_for_frame,
+)
+
+MAP_TILE_URL = "http://tiles.invalid/explorer-video/{zoom}/{x}/{y}.png"
+
+
+def _reference_frame(
+    zoom: int,
+    center_x: float,
+    center_y: float,
+    explored: set[tuple[int, int]],
+    brightness: float,
+    width: int,
+    height: int,
+) -> np.ndarray:
+    """Renders a frame by pasting every tile, like the video did it at first."""
+    image = Image.new("RGB", (width, height))
+    x0 = center_x + 0.5 - width / 512
+    y0 = center_y + 0.5 - height / 512
+    min_tile_x = math.floor(x0)
+    min_tile_y = math.floor(y0)
+    offset_x = int((min_tile_x - x0) * 256)
+    offset_y = int((min_tile_y - y0) * 256)
+    for i in range(math.ceil(width / 256) + 2):
+        for j in range(math.ceil(height / 256) + 2):
+            tile = (min_tile_x + i, min_tile_y + j)
+            sprite = tile_fetcher.get_tile(zoom, tile[0], tile[1], MAP_TILE_URL)
+            if tile not in explored:
+                sprite = ImageEnhance.Brightness(sprite).enhance(0.3)
+            image.paste(sprite, (offset_x + i * 256, offset_y + j * 256))
+    if brightness != 1.0:
+        image = ImageEnhance.Brightness(image).enhance(brightness)
+    return np.asarray(image)
+
+
+def test_rendered_frames_match_pasted_tiles(playground) -> None:
+    width, height = 700, 300
+    chunk = [(100, 200), (101, 200), (101, 201), (103, 201)]
+    frames = iter_chunk_frames(chunk, steps_per_tile=5, fade_frames=3, pause_frames=2)
+
+    rng = np.random.default_rng(0)
+    for tile in {
+        tile
+        for frame in frames
+        for tile in visible_tiles_for_frame(
+            frame.center_x, frame.center_y, width, height
+        )
+    }:
+        f = io.BytesIO()
+        pixels = rng.integers(0, 256, size=(256, 256, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(f, format="png")
+        write_tile_file(tile_fetcher.tile_path(14, *tile, MAP_TILE_URL), f.getvalue())
+
+    explored = {(99, 200)}
+    rendered = []
+    for start in range(0, len(frames), 4):
+        rendered += render_frames(
+            zoom=14,
+            width=width,
+            height=height,
+            map_tile_url=MAP_TILE_URL,
+            explored=set(explored),
+            frames=frames[start : start + 4],
+        )
+        for frame in frames[start : start + 4]:
+            explored.update(frame.new_tiles)
+
+    explored = {(99, 200)}
+    assert len(rendered) == len(frames)
+    for frame, image in zip(frames, rendered, strict=True):
+        explored.update(frame.new_tiles)
+        expected = _reference_frame(
+            14,
+            frame.center_x,
+            frame.center_y,
+            explored,
+            frame.brightness,
+            width,
+            height,
+        )
+        np.testing.assert_array_equal(image, expected)
+
+
+def test_pending_frames_stay_within_budget() -> None:
+    assert batch_sizes(1920, 1080, 1) == (16, 2)
+    for width, height in [(1920, 1080), (3840, 2160)]:
+        for workers in [1, 4, 32, 128]:
+            frames_per_batch, max_pending = batch_sizes(width, height, workers)
+            assert frames_per_batch >= 1
+            assert 1 <= max_pending <= 2 * workers
+            assert (
+                frames_per_batch * max_pending * width * height * 3
+                <= video._MAX_PENDING_FRAME_BYTES
+            )
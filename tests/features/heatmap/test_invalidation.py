@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from flask import Flask
+
+from geo_activity_playground.core.activities import ActivityRepository
+from geo_activity_playground.core.datamodel import DB, Activity, ActivityTile
+from geo_activity_playground.features.heatmap.blueprint import (
+    _get_counts,
+    _paint_activities,
+)
+from geo_activity_playground.features.heatmap.cache import (
+    blob_to_counts,
+    get_tile_cache,
+)
+from geo_activity_playground.features.heatmap.invalidation import (
+    add_activity_to_heatmap_cache,
+    remove_activity_from_heatmap_cache,
+)
+from geo_activity_playground.features.heatmap.model import ActivityTrackChunk
+from geo_activity_playground.features.heatmap.track_index import (
+    split_track_into_chunks,
+)
+
+_CONFIG = SimpleNamespace(heatmap_cache_min_activities=0)
+
+
+def _busiest_tile(zoom: int) -> tuple[int, int]:
+    return tuple(
+        DB.session.execute(
+            sqlalchemy.select(ActivityTile.tile_x, ActivityTile.tile_y)
+            .where(ActivityTile.zoom == zoom)
+            .group_by(ActivityTile.tile_x, ActivityTile.tile_y)
+            .order_by(sqlalchemy.func.count().desc())
+            .limit(1)
+        ).one()
+    )
+
+
+def _painted(
+    activity_ids: set[int], repository: ActivityRepository, x: int, y: int, z: int
+) -> np.ndarray:
+    counts = np.zeros((256, 256), dtype=np.int32)
+    _paint_activities(counts, activity_ids, repository, x=x, y=y, z=z)
+    return counts
+
+
+def test_remove_and_add_activity_updates_cached_tile(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        repository = ActivityRepository()
+        tile_x, tile_y = _busiest_tile(14)
+        _get_counts(tile_x, tile_y, 14, {}, _CONFIG, repository)
+        activity_ids = set(
+            get_tile_cache(14, tile_x, tile_y, None).included_activity_ids
+        )
+        activity_id = min(activity_ids)
+
+        assert remove_activity_from_heatmap_cache(activity_id) >= 1
+
+        cache_entry = get_tile_cache(14, tile_x, tile_y, None)
+        assert cache_entry.painted_from == "track_index"
+        assert not cache_entry.is_dirty
+        assert set(cache_entry.included_activity_ids) == activity_ids - {activity_id}
+        np.testing.assert_array_equal(
+            blob_to_counts(cache_entry.counts),
+            _painted(activity_ids - {activity_id}, repository, tile_x, tile_y, 14),
+        )
+
+        assert add_activity_to_heatmap_cache(activity_id) >= 1
+
+        cache_entry = get_tile_cache(14, tile_x, tile_y, None)
+        assert not cache_entry.is_dirty
+        assert set(cache_entry.included_activity_ids) == activity_ids
+        np.testing.assert_array_equal(
+            blob_to_counts(cache_entry.counts),
+            _painted(activity_ids, repository, tile_x, tile_y, 14),
+        )
+
+
+def _add_activity(activity_id: int, x: np.ndarray, y: np.ndarray) -> None:
+    """Activity with a track in zoom-15 tile coordinates of tile 16000/10000."""
+    time_series = pd.DataFrame(
+        {"x": x / 2**15, "y": y / 2**15, "segment_id": [0] * len(x)}
+    )
+    DB.session.add(Activity(id=activity_id, name=str(activity_id)))
+    DB.session.add_all(
+        ActivityTrackChunk(
+            activity_id=activity_id,
+            segment_id=segment_id,
+            tile_x=tile_x,
+            tile_y=tile_y,
+            xy=xy.tobytes(),
+        )
+        for segment_id, tile_x, tile_y, xy in split_track_into_chunks(time_series)
+    )
+    DB.session.add(
+        ActivityTile(zoom=14, tile_x=8000, tile_y=5000, activity_id=activity_id)
+    )
+    DB.session.add(
+        ActivityTile(zoom=15, tile_x=16000, tile_y=10000, activity_id=activity_id)
+    )
+
+
+def test_assembled_tile_is_not_patched(app_context) -> None:
+    # Three activities on the same track, and one that covers the whole child
+    # tile with a line in every row of pixels.
+    for activity_id in [1, 2, 3]:
+        _add_activity(
+            activity_id,
+            np.linspace(16000.1, 16000.9, 5),
+            np.linspace(10000.2, 10000.7, 5),
+        )
+    rows = 10000 + (np.arange(256) + 0.5) / 256
+    _add_activity(
+        4,
+        np.tile([16000.001, 16000.999, 16000.999, 16000.001], 128),
+        np.repeat(rows, 2),
+    )
+    DB.session.commit()
+    repository = ActivityRepository()
+    _get_counts(16000, 10000, 15, {}, _CONFIG, repository)
+    _get_counts(8000, 5000, 14, {}, _CONFIG, repository)
+    assert get_tile_cache(14, 8000, 5000, None).painted_from == "pyramid"
+
+    # Without the child, the tile cannot be assembled again. Subtracting the
+    # painted activity from the rounded assembly would leave wrong counts that
+    # are not negative.
+    DB.session.delete(get_tile_cache(15, 16000, 10000, None))
+    DB.session.commit()
+    remove_activity_from_heatmap_cache(1)
+    DB.session.execute(
+        sqlalchemy.delete(ActivityTile).where(ActivityTile.activity_id == 1)
+    )
+    DB.session.commit()
+
+    assert get_tile_cache(14, 8000, 5000, None).is_dirty
+    np.testing.assert_array_equal(
+        _get_counts(8000, 5000, 14, {}, _CONFIG, repository),
+        _painted({2, 3, 4}, repository, 8000, 5000, 14),
+    )
+
+
+def test_dirty_tile_is_computed_again(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        repository = ActivityRepository()
+        tile_x, tile_y = _busiest_tile(14)
+        expected = _get_counts(tile_x, tile_y, 14, {}, _CONFIG, repository)
+        cache_entry = get_tile_cache(14, tile_x, tile_y, None)
+        cache_entry.counts = b""
+        cache_entry.is_dirty = True
+        DB.session.commit()
+
+        counts = _get_counts(tile_x, tile_y, 14, {}, _CONFIG, repository)
+
+        np.testing.assert_array_equal(counts, expected)
+        assert not get_tile_cache(14, tile_x, tile_y, None).is_dirty
@@ -0,0 +1,124 @@
+import datetime
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+import sqlalchemy
+from flask import Flask
+
+from geo_activity_playground.core.activities import ActivityRepository
+from geo_activity_playground.core.config import ConfigAccessor
+from geo_activity_playground.core.datamodel import DB, ActivityTile
+from geo_activity_playground.core.scan import scan_for_activities
+from geo_activity_playground.features.heatmap.blueprint import _get_counts
+from geo_activity_playground.features.heatmap.cache import (
+    blob_to_counts,
+    get_tile_cache,
+)
+from geo_activity_playground.features.heatmap.prewarm import (
+    browsed_zoom_levels,
+    prewarm_heatmap_cache,
+    tiles_to_prewarm,
+)
+from geo_activity_playground.webui.app import create_app
+
+_CONFIG = SimpleNamespace(heatmap_cache_min_activities=0)
+
+
+def _tiles_of_activity(activity_id: int, zoom: int) -> set[tuple[int, int, int]]:
+    return set(
+        DB.session.execute(
+            sqlalchemy.select(
+                ActivityTile.zoom, ActivityTile.tile_x, ActivityTile.tile_y
+            ).where(ActivityTile.activity_id == activity_id, ActivityTile.zoom == zoom)
+        ).tuples()
+    )
+
+
+def test_browsed_zoom_levels(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+        assert browsed_zoom_levels(hour_ago) == []
+
+        tile_x, tile_y = DB.session.execute(
+            sqlalchemy.select(ActivityTile.tile_x, ActivityTile.tile_y).where(
+                ActivityTile.zoom == 12
+            )
+        ).first()
+        _get_counts(tile_x, tile_y, 12, {}, _CONFIG, ActivityRepository())
+
+        assert browsed_zoom_levels(hour_ago) == [12]
+
+
+def test_tiles_to_prewarm_skips_cached_tiles(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        activity_id = ActivityRepository().get_activity_ids()[0]
+        tiles = _tiles_of_activity(activity_id, 13)
+        assert set(tiles_to_prewarm([13], 0, {activity_id})) == tiles
+
+        zoom, tile_x, tile_y = min(tiles)
+        _get_counts(tile_x, tile_y, zoom, {}, _CONFIG, ActivityRepository())
+
+        assert set(tiles_to_prewarm([13], 0, {activity_id})) == tiles - {
+            (zoom, tile_x, tile_y)
+        }
+
+
+def test_tiles_to_prewarm_with_more_activities_than_sql_variables(
+    seeded_app: Flask,
+) -> None:
+    with seeded_app.app_context():
+        activity_id = ActivityRepository().get_activity_ids()[0]
+        tiles = _tiles_of_activity(activity_id, 13)
+        activity_ids = {activity_id, *range(10**6, 10**6 + 300_000)}
+        assert set(tiles_to_prewarm([13], 0, activity_ids)) == tiles
+
+
+def test_prewarm_fills_cache_deepest_first(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        activity_id = ActivityRepository().get_activity_ids()[0]
+        tiles = tiles_to_prewarm([11, 12], 0, {activity_id})
+        assert [zoom for zoom, _, _ in tiles] == sorted(
+            (zoom for zoom, _, _ in tiles), reverse=True
+        )
+
+        assert prewarm_heatmap_cache(tiles, "sqlite:///:memory:", workers=4) == len(
+            tiles
+        )
+
+        assert tiles_to_prewarm([11, 12], 0, {activity_id}) == []
+        for zoom, tile_x, tile_y in tiles:
+            cache_entry = get_tile_cache(zoom, tile_x, tile_y, None)
+            assert activity_id in cache_entry.included_activity_ids
+
+
+def test_prewarm_in_worker_processes(playground, testdata_dir) -> None:
+    shutil.copytree(
+        testdata_dir / "Zeeland" / "Activities",
+        playground / "Activities",
+        dirs_exist_ok=True,
+    )
+    database_uri = f"sqlite:///{playground / 'database.sqlite'}"
+    app = create_app(
+        database_uri=database_uri, secret_key="test-secret-key", run_migrations=False
+    )
+    with app.app_context():
+        repository = ActivityRepository()
+        scan_for_activities(
+            repository, ConfigAccessor(), skip_strava=True, skip_hammerhead=True
+        )
+        activity_id = repository.get_activity_ids()[0]
+        tiles = tiles_to_prewarm([11, 12], 0, {activity_id})
+        assert len(tiles) > 1
+
+        assert prewarm_heatmap_cache(tiles, database_uri, workers=2) == len(tiles)
+
+        assert tiles_to_prewarm([11, 12], 0, {activity_id}) == []
+        for zoom, tile_x, tile_y in tiles:
+            cache_entry = get_tile_cache(zoom, tile_x, tile_y, None)
+            assert activity_id in cache_entry.included_activity_ids
+            rendered = blob_to_counts(cache_entry.counts)
+            DB.session.delete(cache_entry)
+            DB.session.commit()
+            expected = _get_counts(tile_x, tile_y, zoom, {}, _CONFIG, repository)
+            np.testing.assert_array_equal(rendered, expected)
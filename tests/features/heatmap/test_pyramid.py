@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import numpy as np
+import sqlalchemy
+from flask import Flask
+
+from geo_activity_playground.core.activities import ActivityRepository
+from geo_activity_playground.core.datamodel import DB, ActivityTile
+from geo_activity_playground.features.heatmap.blueprint import (
+    _get_counts,
+    _paint_activities,
+)
+from geo_activity_playground.features.heatmap.cache import get_tile_cache
+from geo_activity_playground.features.heatmap.model import HeatmapTileCache
+from geo_activity_playground.features.heatmap.pyramid import downsample_counts
+
+_CONFIG = SimpleNamespace(heatmap_cache_min_activities=0)
+
+
+class _RepositoryWithoutTimeSeries(ActivityRepository):
+    def get_time_series(self, id: int):
+        raise AssertionError(f"Time series of activity {id} should not be needed.")
+
+
+def test_downsample_counts_keeps_single_tracks() -> None:
+    counts = np.array(
+        [
+            [1, 0, 4, 4],
+            [0, 0, 4, 4],
+            [2, 2, 0, 0],
+            [2, 1, 0, 0],
+        ]
+    )
+    assert downsample_counts(counts).tolist() == [[1, 4], [2, 0]]
+
+
+def _busiest_tile(zoom: int) -> tuple[int, int]:
+    return tuple(
+        DB.session.execute(
+            sqlalchemy.select(ActivityTile.tile_x, ActivityTile.tile_y)
+            .where(ActivityTile.zoom == zoom)
+            .group_by(ActivityTile.tile_x, ActivityTile.tile_y)
+            .order_by(sqlalchemy.func.count().desc())
+            .limit(1)
+        ).one()
+    )
+
+
+def _children(tile_x: int, tile_y: int) -> list[tuple[int, int]]:
+    return [(2 * tile_x + j, 2 * tile_y + i) for i in range(2) for j in range(2)]
+
+
+def test_tile_is_assembled_from_cached_children(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        repository = ActivityRepository()
+        tile_x, tile_y = _busiest_tile(14)
+        expected = np.zeros((256, 256), dtype=np.int32)
+        for child_x, child_y in _children(tile_x, tile_y):
+            child_counts = _get_counts(child_x, child_y, 15, {}, _CONFIG, repository)
+            i, j = child_y - 2 * tile_y, child_x - 2 * tile_x
+            expected[i * 128 : (i + 1) * 128, j * 128 : (j + 1) * 128] = (
+                downsample_counts(child_counts)
+            )
+
+        counts = _get_counts(
+            tile_x, tile_y, 14, {}, _CONFIG, _RepositoryWithoutTimeSeries()
+        )
+
+        assert counts.sum() > 0
+        np.testing.assert_array_equal(counts, expected)
+        cache_entry = get_tile_cache(14, tile_x, tile_y, None)
+        assert cache_entry is not None
+        assert set(cache_entry.included_activity_ids) == {
+            row[0]
+            for row in DB.session.execute(
+                sqlalchemy.select(ActivityTile.activity_id).where(
+                    ActivityTile.zoom == 14,
+                    ActivityTile.tile_x == tile_x,
+                    ActivityTile.tile_y == tile_y,
+                )
+            )
+        }
+
+
+def test_tile_is_rasterized_when_a_child_is_missing(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        repository = ActivityRepository()
+        tile_x, tile_y = _busiest_tile(14)
+        for child_x, child_y in _children(tile_x, tile_y):
+            _get_counts(child_x, child_y, 15, {}, _CONFIG, repository)
+        DB.session.delete(
+            DB.session.scalars(
+                sqlalchemy.select(HeatmapTileCache).where(
+                    HeatmapTileCache.zoom == 15, HeatmapTileCache.num_activities > 0
+                )
+            ).first()
+        )
+        DB.session.commit()
+
+        counts = _get_counts(tile_x, tile_y, 14, {}, _CONFIG, repository)
+
+        expected = np.zeros((256, 256), dtype=np.int32)
+        activity_ids = set(
+            get_tile_cache(14, tile_x, tile_y, None).included_activity_ids
+        )
+        _paint_activities(expected, activity_ids, repository, x=tile_x, y=tile_y, z=14)
+        np.testing.assert_array_equal(counts, expected)
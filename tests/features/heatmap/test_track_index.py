@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from flask import Flask
+
+from geo_activity_playground.core.activities import ActivityRepository
+from geo_activity_playground.core.datamodel import DB, Activity, ActivityTile
+from geo_activity_playground.features.heatmap.blueprint import (
+    _paint_activities,
+    _paint_activity,
+)
+from geo_activity_playground.features.heatmap.model import ActivityTrackChunk
+from geo_activity_playground.features.heatmap.track_index import (
+    TRACK_INDEX_ZOOM,
+    split_track_into_chunks,
+)
+
+
+def _tile_coordinate(tile: float) -> float:
+    return tile / 2**TRACK_INDEX_ZOOM
+
+
+def test_chunks_are_extended_into_neighboring_tiles() -> None:
+    time_series = pd.DataFrame(
+        {
+            "x": [_tile_coordinate(v) for v in [10.2, 10.5, 11.5, 11.7, 12.5]],
+            "y": [_tile_coordinate(20.5)] * 5,
+            "segment_id": [0, 0, 0, 0, 1],
+        }
+    )
+
+    chunks = split_track_into_chunks(time_series)
+
+    assert [(s, x, y, len(xy)) for s, x, y, xy in chunks] == [
+        (0, 10, 20, 3),
+        (0, 11, 20, 3),
+        (1, 12, 20, 1),
+    ]
+    np.testing.assert_array_equal(chunks[1][3][:, 0], time_series["x"].iloc[1:4])
+
+
+def test_lines_are_indexed_in_the_tiles_they_cross() -> None:
+    time_series = pd.DataFrame(
+        {
+            "x": [_tile_coordinate(v) for v in [10.5, 15.5]],
+            "y": [_tile_coordinate(v) for v in [20.5, 20.9]],
+            "segment_id": [0, 0],
+        }
+    )
+
+    chunks = split_track_into_chunks(time_series)
+
+    # The tiles next to the ends find the line in the runs of the ends.
+    assert [(s, x, y, len(xy)) for s, x, y, xy in chunks] == [
+        (0, 10, 20, 2),
+        (0, 15, 20, 2),
+        (0, 12, 20, 2),
+        (0, 13, 20, 2),
+    ]
+
+
+def test_line_across_tiles_is_painted(app_context) -> None:
+    time_series = pd.DataFrame(
+        {
+            "x": [_tile_coordinate(v) for v in [10.5, 15.5, 13.2, 13.8]],
+            "y": [_tile_coordinate(v) for v in [20.5, 20.9, 21.5, 21.5]],
+            "segment_id": [0, 0, 1, 1],
+        }
+    )
+    DB.session.add(Activity(id=1, name="Jump"))
+    DB.session.add_all(
+        ActivityTrackChunk(
+            activity_id=1,
+            segment_id=segment_id,
+            tile_x=tile_x,
+            tile_y=tile_y,
+            xy=xy.tobytes(),
+        )
+        for segment_id, tile_x, tile_y, xy in split_track_into_chunks(time_series)
+    )
+    DB.session.commit()
+
+    # The other segment is found near these tiles, the line of the first one
+    # needs to be found as well.
+    for zoom, tile_x, tile_y in [(17, 12, 20), (17, 13, 20), (18, 26, 41)]:
+        from_index = np.zeros((256, 256), dtype=np.int32)
+        painted, used_time_series = _paint_activities(
+            from_index, {1}, ActivityRepository(), x=tile_x, y=tile_y, z=zoom
+        )
+        from_time_series = np.zeros((256, 256), dtype=np.int32)
+        _paint_activity(from_time_series, time_series, x=tile_x, y=tile_y, z=zoom)
+
+        assert painted == {1}
+        assert not used_time_series
+        assert from_time_series.sum() > 0
+        np.testing.assert_array_equal(from_index, from_time_series)
+
+
+def test_chunks_skip_points_without_coordinates() -> None:
+    time_series = pd.DataFrame(
+        {
+            "x": [_tile_coordinate(10.5), np.nan, _tile_coordinate(10.6)],
+            "y": [_tile_coordinate(20.5)] * 3,
+            "segment_id": [0, 0, 0],
+        }
+    )
+
+    chunks = split_track_into_chunks(time_series)
+
+    assert len(chunks) == 1
+    assert len(chunks[0][3]) == 2
+
+
+def test_indexed_tracks_paint_like_time_series(seeded_app: Flask) -> None:
+    with seeded_app.app_context():
+        repository = ActivityRepository()
+        assert DB.session.scalar(
+            sqlalchemy.select(sqlalchemy.func.count()).select_from(ActivityTrackChunk)
+        )
+
+        for zoom in [12, 15, 17, 18]:
+            tile = DB.session.execute(
+                sqlalchemy.select(ActivityTile.tile_x, ActivityTile.tile_y)
+                .where(ActivityTile.zoom == zoom)
+                .group_by(ActivityTile.tile_x, ActivityTile.tile_y)
+                .order_by(sqlalchemy.func.count().desc())
+                .limit(1)
+            ).one()
+            activity_ids = {
+                row[0]
+                for row in DB.session.execute(
+                    sqlalchemy.select(ActivityTile.activity_id).where(
+                        ActivityTile.zoom == zoom,
+                        ActivityTile.tile_x == tile.tile_x,
+                        ActivityTile.tile_y == tile.tile_y,
+                    )
+                )
+            }
+
+            from_index = np.zeros((256, 256), dtype=np.int32)
+            painted, used_time_series = _paint_activities(
+                from_index,
+                activity_ids,
+                repository,
+                x=tile.tile_x,
+                y=tile.tile_y,
+                z=zoom,
+            )
+            from_time_series = np.zeros((256, 256), dtype=np.int32)
+            for activity_id in activity_ids:
+                _paint_activity(
+                    from_time_series,
+                    repository.get_time_series(activity_id),
+                    x=tile.tile_x,
+                    y=tile.tile_y,
+                    z=zoom,
+                )
+
+            assert painted == activity_ids
+            assert not used_time_series
+            assert from_index.sum() > 0
+            np.testing.assert_array_equal(from_index, from_time_series)
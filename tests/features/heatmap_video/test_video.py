@@ -0,0 +1,67 @@
+import matplotlib.pyplot as pl
+import numpy as np
+
+from geo_activity_playground.core.rasterization import count_polylines
+from geo_activity_playground.features.heatmap_video.video import (
+    DecayingCounts,
+    HeatmapColorizer,
+    rasterize_day,
+)
+
+
+def _reference_frames(background, tracks_per_day, decay, cmap_name):
+    """Frames like the heatmap video rendered them with full arrays per day."""
+    running_counts = np.zeros(background.shape[:2], np.float64)
+    cmap = pl.get_cmap(cmap_name)
+    for tracks in tracks_per_day:
+        running_counts += count_polylines(tracks, running_counts.shape, 3)
+        tile_counts = np.sqrt(running_counts) / 5
+        tile_counts[tile_counts > 1.0] = 1.0
+        data_color = cmap(tile_counts)
+        data_color[data_color == cmap(0.0)] = 0.0
+        rendered = np.zeros_like(background)
+        for c in range(3):
+            rendered[:, :, c] = (1.0 - data_color[:, :, c]) * background[
+                :, :, c
+            ] + data_color[:, :, c]
+        yield (rendered * 255).astype("uint8")
+        running_counts *= 1 - decay
+
+
+def test_frames_match_full_frame_rendering() -> None:
+    rng = np.random.default_rng(0)
+    shape = (90, 160)
+    gray = rng.random(shape)
+    background = np.dstack((gray, gray, gray))
+    tracks_per_day = [
+        [
+            [np.cumsum(rng.normal(0, 4, size=(50, 2)), axis=0) + (80, 45)]
+            for _ in range(rng.integers(0, 2) * rng.integers(1, 6))
+        ]
+        for _ in range(60)
+    ]
+    tracks_per_day[0] = [[np.array([[0.0, 0.0], [159.0, 89.0]])]] * 30
+
+    for decay in [0.0, 0.2, 1.0]:
+        counts = DecayingCounts(shape, decay)
+        colorizer = HeatmapColorizer(background, "hot")
+        expected = _reference_frames(background, tracks_per_day, decay, "hot")
+        for day, tracks in enumerate(tracks_per_day):
+            if tracks:
+                counts.add(day, *rasterize_day(tracks, shape, 3))
+            frame = colorizer.render(*counts.decayed(day))
+            reference = next(expected)
+            # The decay is applied in a different order, which can change the
+            # last digit of the counts.
+            assert np.mean(frame != reference) < 1e-3
+            np.testing.assert_allclose(frame, reference, atol=1)
+
+
+def test_counts_are_rescaled_before_they_overflow() -> None:
+    counts = DecayingCounts((1, 2), 0.5)
+    counts.add(0, np.array([0]), np.array([4]))
+    counts.add(400, np.array([1]), np.array([4]))
+    pixels, values = counts.decayed(401)
+    assert pixels.tolist() == [0, 1]
+    np.testing.assert_allclose(values, [4 * 0.5**401, 2.0])
+    assert counts._values.max() == 4
@@ -0,0 +1,44 @@
+import numpy as np
+from flask import Flask
+from PIL import Image
+
+from geo_activity_playground.core.raster_map import (
+    GrayscaleImageTransform,
+    TileGetter,
+)
+from geo_activity_playground.features.tile.blueprint import make_tile_blueprint
+
+
+class _CountingTileGetter(TileGetter):
+    def __init__(self) -> None:
+        super().__init__("https://tiles.example.org/{zoom}/{x}/{y}.png")
+        self.calls: list[tuple[int, int, int]] = []
+
+    def get_tile(self, z: int, x: int, y: int) -> Image.Image:
+        self.calls.append((z, x, y))
+        return Image.fromarray(np.full((256, 256, 3), 200, dtype=np.uint8))
+
+
+def test_transformed_tiles_are_read_from_disk(playground) -> None:
+    tile_getter = _CountingTileGetter()
+    app = Flask(__name__)
+    app.register_blueprint(
+        make_tile_blueprint({"grayscale": GrayscaleImageTransform()}, tile_getter),
+        url_prefix="/tile",
+    )
+    client = app.test_client()
+
+    first = client.get("/tile/grayscale/14/1/2.png")
+    second = client.get("/tile/grayscale/14/1/2.png")
+    assert first.status_code == second.status_code == 200
+    assert second.data == first.data
+    assert tile_getter.calls == [(14, 1, 2)]
+    assert tile_getter.transformed_tile_path("grayscale", 14, 1, 2).exists()
+
+    unchanged = client.get(
+        "/tile/grayscale/14/1/2.png",
+        headers={"If-None-Match": first.headers["ETag"]},
+    )
+    assert unchanged.status_code == 304
+
+    assert client.get("/tile/sepia/14/1/2.png").status_code == 404
@@ -1,3 +1,12 @@
+import gzip
+import pathlib
+
+import gpxpy.gpx
+import gpxpy.gpxfield
+import numpy as np
+import pandas as pd
+import pytest
+
 from geo_activity_playground.core.datamodel import Kind
 from geo_activity_playground.importers import activity_parsers
 
@@ -56,3 +65,273 @@ def test_read_activity_gpx_without_track_metadata(tmp_path) -> None:
     assert activity.name is None
     assert activity.kind is None
     assert len(timeseries) == 1
+
+
+def test_read_activity_fit_fills_missing_values_with_nan(
+    testdata_dir, monkeypatch
+) -> None:
+    monkeypatch.setattr(
+        activity_parsers, "get_or_make_kind", lambda name: Kind(name=name)
+    )
+
+    activity, timeseries = activity_parsers.read_activity(
+        testdata_dir / "Local Files" / "Activities" / "2024-05-10-19-32-04.fit"
+    )
+
+    assert activity.kind is not None
+    assert activity.kind.name == "walking generic"
+    assert activity.calories == 506
+    assert activity.steps == 8662
+    assert len(timeseries) == 1082
+    assert list(timeseries.columns) == [
+        "time",
+        "latitude",
+        "longitude",
+        "heartrate",
+        "elevation",
+        "cadence",
+        "distance",
+        "speed",
+    ]
+    assert str(timeseries["time"].dtype) == "datetime64[us, UTC]"
+    assert timeseries["heartrate"].dtype == "int64"
+    assert timeseries["cadence"].isna().sum() == 87
+    first = timeseries.iloc[0]
+    assert first["time"] == pd.Timestamp("2024-05-10 17:32:17+00:00")
+    assert first["latitude"] == pytest.approx(51.564533813)
+    assert first["longitude"] == pytest.approx(5.959724430)
+    assert first["heartrate"] == 86
+    assert first["elevation"] == 17.0
+
+
+def test_read_activity_fit_without_absolute_time(testdata_dir) -> None:
+    activity, timeseries = activity_parsers.read_activity(
+        testdata_dir / "Local Files" / "Activities" / "Berlin (0,9 km).fit"
+    )
+
+    assert activity.kind is None
+    assert len(timeseries) == 49
+    assert timeseries["time"].isna().all()
+    assert timeseries["distance"].isna().sum() == 1
+
+
+GPX_WITH_EXTENSIONS = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="pytest" xmlns="http://www.topografix.com/GPX/1/1"
+  xmlns:tpx1="http://www.garmin.com/xmlschemas/TrackPointExtension/v1"
+  xmlns:tpx2="http://www.garmin.com/xmlschemas/TrackPointExtension/v2">
+  <rte><rtept lat="1.0" lon="1.0"/></rte>
+  <trk>
+    <name></name>
+    <type>cycling</type>
+    <trkseg>
+      <trkpt lat="49.0" lon="8.0">
+        <time>2026-01-01T18:00:00Z</time>
+        <extensions>
+          <power>210</power>
+          <tpx1:TrackPointExtension>
+            <tpx1:hr>120</tpx1:hr>
+            <tpx1:cad>80.0</tpx1:cad>
+          </tpx1:TrackPointExtension>
+        </extensions>
+      </trkpt>
+      <trkpt lat="49.0001" lon="8.0001">
+        <ele>120.5</ele>
+        <time>2026-01-01T18:00:01.5Z</time>
+        <extensions>
+          <tpx2:TrackPointExtension>
+            <tpx2:PowerInWatts>250</tpx2:PowerInWatts>
+          </tpx2:TrackPointExtension>
+        </extensions>
+      </trkpt>
+    </trkseg>
+  </trk>
+  <trk>
+    <name>Second</name>
+    <desc>Along the river</desc>
+    <type>running</type>
+    <trkseg><trkpt lat=" 49.0002" lon="8.0002"><ele></ele></trkpt></trkseg>
+  </trk>
+</gpx>
+"""
+
+TCX = """<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase
+  xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"
+  xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">
+  <Activities>
+    <Activity Sport="Biking">
+      <Id>2026-01-01T18:00:00Z</Id>
+      <Lap StartTime="2026-01-01T18:00:00Z">
+        <TotalTimeSeconds>2</TotalTimeSeconds>
+        <DistanceMeters>12.5</DistanceMeters>
+        <Calories>1</Calories>
+        <Track>
+          <Trackpoint>
+            <Time>2026-01-01T18:00:00Z</Time>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2026-01-01T18:00:01.000Z</Time>
+            <Position>
+              <LatitudeDegrees>49.0</LatitudeDegrees>
+              <LongitudeDegrees>8.0</LongitudeDegrees>
+            </Position>
+            <AltitudeMeters>120.5</AltitudeMeters>
+            <DistanceMeters>0</DistanceMeters>
+            <HeartRateBpm><Value>120</Value></HeartRateBpm>
+            <Cadence>80</Cadence>
+            <Extensions>
+              <ns3:TPX><ns3:Speed>4.5</ns3:Speed><ns3:Watts>210</ns3:Watts></ns3:TPX>
+            </Extensions>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2026-01-01T18:00:02Z</Time>
+            <Position>
+              <LatitudeDegrees>49.0001</LatitudeDegrees>
+              <LongitudeDegrees>8.0001</LongitudeDegrees>
+            </Position>
+            <DistanceMeters>12.5</DistanceMeters>
+          </Trackpoint>
+        </Track>
+      </Lap>
+      <Lap StartTime="2026-01-01T18:00:03Z">
+        <Track>
+          <Trackpoint>
+            <Time>2026-01-01T18:00:03Z</Time>
+            <Position>
+              <LatitudeDegrees>49.0002</LatitudeDegrees>
+              <LongitudeDegrees>8.0002</LongitudeDegrees>
+            </Position>
+            <HeartRateBpm><Value>bad</Value></HeartRateBpm>
+            <Extensions><ns3:TPX><ns3:Watts>250.5</ns3:Watts></ns3:TPX></Extensions>
+          </Trackpoint>
+        </Track>
+      </Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+def _gpx_files(
+    testdata_dir: pathlib.Path, tmp_path: pathlib.Path
+) -> list[tuple[pathlib.Path, object]]:
+    with_extensions = tmp_path / "extensions.gpx"
+    with_extensions.write_text(GPX_WITH_EXTENSIONS)
+    # GPX 1.0 has neither extensions nor track types.
+    version_10 = tmp_path / "version_10.gpx"
+    version_10.write_text(
+        GPX_WITH_EXTENSIONS.replace('version="1.1"', 'version="1.0"').replace(
+            "GPX/1/1", "GPX/1/0"
+        )
+    )
+    compressed = tmp_path / "compressed.gpx.gz"
+    compressed.write_bytes(gzip.compress(GPX_WITH_EXTENSIONS.encode()))
+    return [
+        *[(path, open) for path in sorted(testdata_dir.rglob("*.gpx"))],
+        (with_extensions, open),
+        (version_10, open),
+        (compressed, gzip.open),
+    ]
+
+
+def test_streaming_gpx_parser_matches_gpxpy(
+    testdata_dir, tmp_path, monkeypatch
+) -> None:
+    monkeypatch.setattr(
+        activity_parsers, "get_or_make_kind", lambda name: Kind(name=name)
+    )
+    for path, opener in _gpx_files(testdata_dir, tmp_path):
+        activity, timeseries = activity_parsers._iterparse_gpx_activity(path, opener)
+        expected_activity, expected = activity_parsers._read_gpx_activity_with_gpxpy(
+            path, opener
+        )
+        assert activity.name == expected_activity.name
+        assert activity.description == expected_activity.description
+        assert (activity.kind and activity.kind.name) == (
+            expected_activity.kind and expected_activity.kind.name
+        )
+        pd.testing.assert_frame_equal(timeseries, expected)
+
+
+def test_streaming_gpx_parser_reads_extensions(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(
+        activity_parsers, "get_or_make_kind", lambda name: Kind(name=name)
+    )
+    path = tmp_path / "activity.gpx"
+    path.write_text(GPX_WITH_EXTENSIONS)
+
+    activity, timeseries = activity_parsers._iterparse_gpx_activity(path, open)
+
+    # The first track without a name falls back to the second one.
+    assert activity.name == "Second"
+    assert activity.description == "Along the river"
+    assert activity.kind.name == "cycling"
+    assert timeseries["power"].iloc[:2].tolist() == [210.0, 250.0]
+    assert np.isnan(timeseries["power"].iloc[2])
+    assert timeseries["heartrate"].iloc[0] == 120
+    assert timeseries["cadence"].iloc[0] == 80
+
+
+def test_broken_gpx_falls_back_to_gpxpy(tmp_path) -> None:
+    path = tmp_path / "activity.gpx"
+    path.write_text(GPX_WITH_EXTENSIONS.replace('lat="49.0" lon="8.0"', 'lon="8.0"'))
+    with pytest.raises(activity_parsers.NoGeoDataError):
+        activity_parsers.read_activity(path)
+
+
+def test_streaming_tcx_parser_matches_tcxreader(playground) -> None:
+    path = playground / "activity.tcx"
+    path.write_text(TCX)
+
+    timeseries = activity_parsers._iterparse_tcx_activity(path, open)
+
+    assert len(timeseries) == 3
+    assert timeseries["power"].iloc[0] == 210.0
+    assert timeseries["power"].iloc[2] == 250.5
+    pd.testing.assert_frame_equal(
+        timeseries, activity_parsers._read_tcx_activity_with_tcxreader(path, open)
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        None,
+        "",
+        "2025-08-31T09:57:07Z",
+        "2025-08-31T09:57:07.1234567891+02:00",
+        "2025-08-31 09:57:07",
+        "2025-08-31T09:57:07-0530",
+        "2025-08-31T09:57:07+02",
+        "2025-8-31T9:57:07Z",
+        "2025-08-31T09:57:07−02:00",
+    ],
+)
+def test_parse_gpx_time_matches_gpxpy(text) -> None:
+    time = activity_parsers._parse_gpx_time(text)
+    expected = gpxpy.gpxfield.parse_time(text)
+    assert time == expected
+    assert repr(time) == repr(expected)
+
+
+@pytest.mark.parametrize("text", ["2025-08-31", "2025-08-31T09:57Z"])
+def test_parse_gpx_time_rejects_what_gpxpy_rejects(text) -> None:
+    with pytest.raises(gpxpy.gpx.GPXException):
+        activity_parsers._parse_gpx_time(text)
+
+
+def test_streaming_tcx_parser_skips_empty_values(playground) -> None:
+    path = playground / "activity.tcx"
+    path.write_text(
+        TCX.replace("<ns3:Watts>210</ns3:Watts>", "<ns3:Watts/>")
+        .replace("<Value>120</Value>", "<Value/>")
+        .replace("<Cadence>80</Cadence>", "<Cadence/>")
+    )
+
+    timeseries = activity_parsers._iterparse_tcx_activity(path, open)
+
+    assert len(timeseries) == 3
+    assert np.isnan(timeseries["power"].iloc[0])
+    assert timeseries["power"].iloc[2] == 250.5
+    assert "heartrate" not in timeseries.columns
+    assert "cadence" not in timeseries.columns
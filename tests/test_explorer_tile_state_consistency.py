@@ -1,7 +1,11 @@
+import concurrent.futures
 import datetime as dt
+import itertools
+import threading
 import time
 from types import SimpleNamespace
 
+import numpy as np
 import pandas as pd
 import sqlalchemy as sa
 
@@ -14,6 +18,7 @@ from geo_activity_playground.core.datamodel import (
 )
 from geo_activity_playground.core.raster_map import OSM_TILE_SIZE
 from geo_activity_playground.core.tile_visits import (
+    _process_activities,
     _process_activity,
     _tiles_from_points,
     get_activity_ids_in_tile,
@@ -21,10 +26,17 @@ from geo_activity_playground.core.tile_visits import (
     get_tile_visits_in_bounds,
     remove_activity_from_tile_state,
 )
+from geo_activity_playground.features.explorer import clustering
 from geo_activity_playground.features.explorer.clustering import (
     CLUSTER_CHECKPOINT_INTERVAL,
+    ClusterReplayState,
+    ClusterStateCache,
     TileEvolutionState,
+    _append_cluster_history_for_zoom,
     _compute_cluster_evolution,
+    _compute_square_history,
+    compute_tile_evolution,
+    get_cluster_state_at_cutoff,
     get_cluster_tile_activations_df,
     get_cluster_tile_diff_for_activity,
     get_cluster_tiles_at_cutoff,
@@ -33,6 +45,10 @@ from geo_activity_playground.features.explorer.clustering import (
 from geo_activity_playground.features.explorer.model import (
     ClusterHistoryCheckpoint,
     ClusterHistoryEvent,
+    ClusterMembership,
+    ClusterSizeHistory,
+    ExplorerSquare,
+    SquareHistory,
 )
 from geo_activity_playground.features.heatmap.blueprint import _get_counts
 
@@ -186,6 +202,83 @@ def test_process_activity_updates_first_and_last_fields_in_db(app) -> None:
         assert visit.last_activity_id == 2
 
 
+def test_processing_a_batch_matches_processing_one_by_one(app) -> None:
+    def track(times: list, xs: list[float]) -> pd.DataFrame:
+        return pd.DataFrame(
+            {"time": times, "x": xs, "y": [0.25] * len(xs), "segment_id": [0] * len(xs)}
+        )
+
+    ride = SimpleNamespace(consider_for_achievements=True)
+    walk = SimpleNamespace(consider_for_achievements=False)
+    activities = {
+        1: SimpleNamespace(id=1, kind=ride, start=None, start_utc=None),
+        2: SimpleNamespace(id=2, kind=ride, start=None, start_utc=None),
+        3: SimpleNamespace(
+            id=3, kind=ride, start=dt.datetime(2024, 1, 3, 9), start_utc=None
+        ),
+        4: SimpleNamespace(id=4, kind=walk, start=None, start_utc=None),
+        5: SimpleNamespace(id=5, kind=ride, start=None, start_utc=None),
+    }
+    series = {
+        1: track([pd.Timestamp("2024-01-02T10:00:00Z")] * 2, [0.25, 0.2501]),
+        2: track([pd.Timestamp("2024-01-01T10:00:00Z")] * 2, [0.25, 0.26]),
+        3: track([pd.NaT, pd.NaT], [0.2501, 0.3]),
+        4: track([pd.Timestamp("2023-01-01T10:00:00Z")], [0.25]),
+        5: track([pd.Timestamp("2024-01-01T10:00:00")], [0.26]),
+    }
+    repository = SimpleNamespace(
+        get_activity_by_id=activities.__getitem__,
+        get_time_series=series.__getitem__,
+    )
+
+    def tile_state() -> tuple[list, list]:
+        visits = DB.session.execute(
+            sa.select(
+                TileVisit.zoom,
+                TileVisit.tile_x,
+                TileVisit.tile_y,
+                TileVisit.first_activity_id,
+                TileVisit.first_time,
+                TileVisit.last_activity_id,
+                TileVisit.last_time,
+                TileVisit.visit_count,
+            ).order_by(TileVisit.zoom, TileVisit.tile_x, TileVisit.tile_y)
+        ).all()
+        tiles = DB.session.execute(
+            sa.select(
+                ActivityTile.zoom,
+                ActivityTile.tile_x,
+                ActivityTile.tile_y,
+                ActivityTile.activity_id,
+            ).order_by(
+                ActivityTile.zoom,
+                ActivityTile.tile_x,
+                ActivityTile.tile_y,
+                ActivityTile.activity_id,
+            )
+        ).all()
+        return visits, tiles
+
+    with app.app_context():
+        DB.session.add_all(
+            [Activity(id=activity_id, name="Ride") for activity_id in activities]
+        )
+        DB.session.commit()
+
+        for activity_id in activities:
+            _process_activity(repository, activity_id)
+        one_by_one = tile_state()
+
+        DB.session.execute(sa.delete(TileVisit))
+        DB.session.execute(sa.delete(ActivityTile))
+        DB.session.commit()
+        _process_activities(repository, [1, 2])
+        _process_activities(repository, [3, 4, 5])
+
+        assert tile_state() == one_by_one
+        assert one_by_one[0]
+
+
 def test_tiles_from_points_localizes_naive_time_series() -> None:
     df = pd.DataFrame(
         {
@@ -195,9 +288,29 @@ def test_tiles_from_points_localizes_naive_time_series() -> None:
             "segment_id": [0],
         }
     )
-    rows = list(_tiles_from_points(df, 14))
-    assert rows
-    assert rows[0][0].tzinfo is not None
+    tiles = _tiles_from_points(df, 14)
+    assert len(tiles) == 1
+    assert tiles["time"].dt.tz is not None
+    assert tiles["time"].iloc[0] == pd.Timestamp("2026-01-01T12:00:00Z")
+
+
+def test_tiles_from_points_fills_diagonal_steps_within_segments() -> None:
+    times = pd.date_range("2026-01-01T12:00:00Z", periods=3, freq="min")
+    df = pd.DataFrame(
+        {
+            "time": times,
+            "x": [2.5 / 16, 1.25 / 16, 2.5 / 16],
+            "y": [1.5 / 16, 2.25 / 16, 3.5 / 16],
+            "segment_id": [0, 0, 1],
+        }
+    )
+    tiles = _tiles_from_points(df, 4).set_index(["tile_x", "tile_y"])["time"]
+    assert tiles.to_dict() == {
+        (1, 1): times[1],
+        (1, 2): times[1],
+        (2, 1): times[0],
+        (2, 3): times[2],
+    }
 
 
 def test_process_activity_prefers_non_missing_time_for_same_tile(app) -> None:
@@ -339,10 +452,123 @@ def test_cluster_evolution_only_records_new_max_values() -> None:
         }
     )
     state = TileEvolutionState()
-    _compute_cluster_evolution(tiles, state, 14)
+    _compute_cluster_evolution(tiles, state)
     assert list(state.cluster_evolution["max_cluster_size"]) == [2]
 
 
+def _clusters_by_flood_fill(tiles: list[tuple[int, int]]) -> set[frozenset]:
+    visited = set(tiles)
+    cluster_tiles = {
+        (x, y)
+        for x, y in visited
+        if {(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)} <= visited
+    }
+    clusters = set()
+    while cluster_tiles:
+        todo = [cluster_tiles.pop()]
+        members = set(todo)
+        while todo:
+            x, y = todo.pop()
+            for other in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+                if other in cluster_tiles:
+                    cluster_tiles.remove(other)
+                    members.add(other)
+                    todo.append(other)
+        clusters.add(frozenset(members))
+    return clusters
+
+
+def test_cluster_replay_state_matches_flood_fill(monkeypatch) -> None:
+    # Rebuild the sorted keys often, such that lookups go through both.
+    monkeypatch.setattr(clustering, "_MIN_RECENT_TILES", 16)
+
+    def clusters_of(state: ClusterReplayState) -> set[frozenset]:
+        clusters: dict[tuple[int, int], set] = {}
+        for tile in state.cluster_tiles():
+            clusters.setdefault(state.cluster_root(tile), set()).add(tile)
+        return {frozenset(members) for members in clusters.values()}
+
+    rng = np.random.default_rng(0)
+    tiles = [tuple(tile) for tile in rng.integers(-12, 12, size=(600, 2)).tolist()]
+    state = ClusterReplayState()
+    maxima = []
+    start = 0
+    for batch_size in itertools.cycle([1, 7, 50, 42]):
+        batch = np.array(tiles[start : start + batch_size])
+        maxima.extend(state.visit_many(batch[:, 0], batch[:, 1]).tolist())
+        start += batch_size
+        if start == 300:
+            halfway = state.copy()
+        if start >= len(tiles):
+            break
+
+    expected = [
+        max(map(len, _clusters_by_flood_fill(tiles[: i + 1])), default=0)
+        for i in range(len(tiles))
+    ]
+    assert maxima == expected
+    assert expected[-1] >= 10
+    assert clusters_of(state) == _clusters_by_flood_fill(tiles)
+    assert len(state) == len(set(tiles))
+    assert clusters_of(halfway) == _clusters_by_flood_fill(tiles[:300])
+    assert halfway.tiles() == set(tiles[:300])
+    assert (-13, 0) not in state
+
+
+def _square_history_by_offsets(tiles: list[tuple[int, int]]) -> list[tuple]:
+    """The square search as it used to be, trying every offset of every size."""
+    visited = set()
+    max_size = 0
+    history = []
+    for index, (x, y) in enumerate(tiles):
+        if (x, y) in visited:
+            continue
+        visited.add((x, y))
+        while True:
+            size = max_size + 1
+            corner = next(
+                (
+                    (x - x_offset, y - y_offset)
+                    for x_offset in range(size)
+                    for y_offset in range(size)
+                    if all(
+                        (x - x_offset + xx, y - y_offset + yy) in visited
+                        for xx in range(size)
+                        for yy in range(size)
+                    )
+                ),
+                None,
+            )
+            if corner is None:
+                break
+            max_size = size
+            history.append((index, size, *corner))
+    return history
+
+
+def test_square_history_matches_search_by_offsets() -> None:
+    rng = np.random.default_rng(0)
+    # Around a chunk border of the bitmap and across negative coordinates.
+    for center in [(250, 250), (0, 0)]:
+        points = rng.integers(-12, 12, size=(1_500, 2)) + center
+        tiles = pd.DataFrame(
+            {
+                "time": pd.date_range("2026-01-01", periods=len(points), freq="min"),
+                "tile_x": points[:, 0],
+                "tile_y": points[:, 1],
+            }
+        )
+        state = TileEvolutionState()
+        _compute_square_history(tiles, state, 14)
+
+        expected = _square_history_by_offsets([tuple(p) for p in points.tolist()])
+        assert expected
+        assert [
+            (int(tiles["time"].searchsorted(row.time)), *row[1:])
+            for row in state.square_evolution.itertuples(index=False)
+        ] == expected
+
+
 def test_deterministic_ordering_for_activity_and_tile_history(app) -> None:
     with app.app_context():
         DB.session.add_all(
@@ -603,3 +829,254 @@ def test_cluster_history_replay_latency_bound(app) -> None:
         _ = get_cluster_tiles_at_cutoff(14, 2_000)
         elapsed = time.perf_counter() - start
         assert elapsed < 1.0
+
+
+def _add_first_visits(tiles: list[tuple[int, int]], activity_id: int, hour: int):
+    for i, (tile_x, tile_y) in enumerate(tiles):
+        time = dt.datetime(2026, 1, 1, hour, 0, 0) + dt.timedelta(seconds=i)
+        DB.session.add(
+            TileVisit(
+                zoom=14,
+                tile_x=tile_x,
+                tile_y=tile_y,
+                first_activity_id=activity_id,
+                first_time=time,
+                last_activity_id=activity_id,
+                last_time=time,
+                visit_count=1,
+            )
+        )
+    DB.session.commit()
+
+
+def _evolution_snapshot() -> dict[str, object]:
+    def rows(*columns) -> list:
+        return DB.session.execute(sa.select(*columns).order_by(*columns)).all()
+
+    return {
+        "events": rows(
+            ClusterHistoryEvent.event_index,
+            ClusterHistoryEvent.activity_id,
+            ClusterHistoryEvent.time,
+            ClusterHistoryEvent.tile_x,
+            ClusterHistoryEvent.tile_y,
+        ),
+        "checkpoints": rows(
+            ClusterHistoryCheckpoint.event_index,
+            ClusterHistoryCheckpoint.max_cluster_size,
+        ),
+        "membership": rows(
+            ClusterMembership.tile_x,
+            ClusterMembership.tile_y,
+            ClusterMembership.cluster_x,
+            ClusterMembership.cluster_y,
+        ),
+        "square": rows(
+            ExplorerSquare.square_x,
+            ExplorerSquare.square_y,
+            ExplorerSquare.max_square_size,
+            ExplorerSquare.event_index,
+        ),
+        "square_history": rows(
+            SquareHistory.time,
+            SquareHistory.max_square_size,
+            SquareHistory.square_x,
+            SquareHistory.square_y,
+        ),
+        "cluster_history": rows(
+            ClusterSizeHistory.time, ClusterSizeHistory.max_cluster_size
+        ),
+    }
+
+
+def _recomputed_snapshot(config) -> dict[str, object]:
+    DB.session.query(ExplorerSquare).update({ExplorerSquare.event_index: None})
+    DB.session.commit()
+    compute_tile_evolution(config)
+    return _evolution_snapshot()
+
+
+def test_tile_evolution_continues_from_checkpoint(app, monkeypatch) -> None:
+    monkeypatch.setattr(clustering, "CLUSTER_CHECKPOINT_INTERVAL", 7)
+    config = SimpleNamespace(explorer_zoom_levels=[14])
+    block = [(x, y) for y in range(6) for x in range(6)]
+    with app.app_context():
+        DB.session.add_all([Activity(id=1, name="A1"), Activity(id=2, name="A2")])
+        _add_first_visits(block[:17], 1, 10)
+        compute_tile_evolution(config)
+        first_event_ids = DB.session.scalars(
+            sa.select(ClusterHistoryEvent.id).order_by(ClusterHistoryEvent.id)
+        ).all()
+
+        _add_first_visits(block[17:] + [(10, 10), (11, 10)], 2, 11)
+        compute_tile_evolution(config)
+        continued = _evolution_snapshot()
+
+        assert (
+            DB.session.scalars(
+                sa.select(ClusterHistoryEvent.id).order_by(ClusterHistoryEvent.id)
+            ).all()[: len(first_event_ids)]
+            == first_event_ids
+        )
+        assert continued["square"][0][2] == 6
+        assert continued["square"][0][3] == len(block) + 2
+        assert continued == _recomputed_snapshot(config)
+
+
+def test_tile_evolution_is_recomputed_after_late_import(app, monkeypatch) -> None:
+    monkeypatch.setattr(clustering, "CLUSTER_CHECKPOINT_INTERVAL", 7)
+    config = SimpleNamespace(explorer_zoom_levels=[14])
+    block = [(x, y) for y in range(5) for x in range(5)]
+    with app.app_context():
+        DB.session.add_all([Activity(id=1, name="A1"), Activity(id=2, name="A2")])
+        _add_first_visits(block[5:], 1, 10)
+        compute_tile_evolution(config)
+
+        _add_first_visits(block[:5], 2, 9)
+        compute_tile_evolution(config)
+        continued = _evolution_snapshot()
+
+        assert continued["events"][0][1] == 2
+        assert continued["square"][0][2] == 5
+        assert continued == _recomputed_snapshot(config)
+
+
+def test_cluster_states_from_checkpoints_match_replay(app, monkeypatch) -> None:
+    monkeypatch.setattr(clustering, "CLUSTER_CHECKPOINT_INTERVAL", 20)
+    monkeypatch.setattr(clustering, "CLUSTER_KEYFRAME_INTERVAL", 3)
+    rng = np.random.default_rng(0)
+    tiles = list(
+        dict.fromkeys(map(tuple, rng.integers(-8, 15, size=(900, 2)).tolist()))
+    )
+    history = pd.DataFrame(
+        {
+            "activity_id": 1,
+            "time": pd.date_range("2026-01-01", periods=len(tiles), freq="min"),
+            "tile_x": [x for x, _ in tiles],
+            "tile_y": [y for _, y in tiles],
+        }
+    )
+
+    def replayed(event_index: int) -> ClusterReplayState:
+        state = ClusterReplayState()
+        state.visit_many(
+            history["tile_x"].to_numpy()[:event_index],
+            history["tile_y"].to_numpy()[:event_index],
+        )
+        return state
+
+    def summary(state: ClusterReplayState) -> tuple:
+        columns = state.to_arrays()
+        return (*(column.tolist() for column in columns), state.max_cluster_size)
+
+    with app.app_context():
+        DB.session.add(Activity(id=1, name="Ride"))
+        DB.session.commit()
+        rebuild_cluster_history_for_zoom(14, history.iloc[:150])
+        _append_cluster_history_for_zoom(
+            14, history.iloc[150:], get_cluster_state_at_cutoff(14, 150), 150
+        )
+
+        checkpoints = DB.session.scalars(
+            sa.select(ClusterHistoryCheckpoint.event_index)
+            .where(ClusterHistoryCheckpoint.zoom == 14)
+            .order_by(ClusterHistoryCheckpoint.event_index)
+        ).all()
+        assert checkpoints[-1] == len(tiles)
+        assert 150 not in checkpoints
+        for event_index in [*checkpoints, 1, 59, 61, 151, len(tiles) - 1]:
+            assert summary(get_cluster_state_at_cutoff(14, event_index)) == summary(
+                replayed(event_index)
+            )
+
+
+def test_cluster_state_cache_derives_states_forward(app, monkeypatch) -> None:
+    monkeypatch.setattr(clustering, "CLUSTER_CHECKPOINT_INTERVAL", 50)
+    tiles = [(x, y) for x in range(10) for y in range(10)]
+    history = pd.DataFrame(
+        {
+            "activity_id": 1,
+            "time": pd.date_range("2026-01-01", periods=len(tiles), freq="min"),
+            "tile_x": [x for x, _ in tiles],
+            "tile_y": [y for _, y in tiles],
+        }
+    )
+
+    def summary(state: ClusterReplayState) -> tuple:
+        columns = state.to_arrays()
+        return (*(column.tolist() for column in columns), state.max_cluster_size)
+
+    def replayed(tiles: list[tuple[int, int]]) -> ClusterReplayState:
+        state = ClusterReplayState()
+        state.visit_many(
+            np.array([x for x, _ in tiles]), np.array([y for _, y in tiles])
+        )
+        return state
+
+    with app.app_context():
+        DB.session.add(Activity(id=1, name="Ride"))
+        DB.session.commit()
+        rebuild_cluster_history_for_zoom(14, history)
+
+        cache = ClusterStateCache()
+        state = cache.get(14, 60)
+        assert summary(state) == summary(replayed(tiles[:60]))
+        assert cache.get(14, 60) is state
+
+        # The state after 70 events comes from the cached one, not from the
+        # checkpoint after 50 events.
+        state_from_checkpoint = clustering._state_from_checkpoint
+        monkeypatch.setattr(clustering, "_state_from_checkpoint", None)
+        assert summary(cache.get(14, 70)) == summary(replayed(tiles[:70]))
+        assert summary(state) == summary(replayed(tiles[:60]))
+        monkeypatch.setattr(clustering, "_state_from_checkpoint", state_from_checkpoint)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        rebuild_cluster_history_for_zoom(14, history.iloc[::-1])
+        assert summary(cache.get(14, 60)) == summary(replayed(tiles[::-1][:60]))
+        assert cache.stats()["states"] == 1
+
+        small_cache = ClusterStateCache(
+            max_bytes=clustering._estimate_replay_state_bytes(state)
+        )
+        small_cache.get(14, 60)
+        small_cache.get(14, 30)
+        assert small_cache.stats()["states"] == 1
+        assert small_cache.stats()["bytes"] <= small_cache.max_bytes
+
+
+def test_cluster_state_cache_replays_a_state_once_without_holding_the_lock(
+    app, monkeypatch
+) -> None:
+    monkeypatch.setattr(clustering, "get_cluster_history_version", lambda _: 1)
+    cache = ClusterStateCache()
+    replay_started = threading.Event()
+    finish_replay = threading.Event()
+    replays = []
+
+    def replay(zoom, event_index, base_event_index, base):
+        replays.append(event_index)
+        replay_started.set()
+        assert finish_replay.wait(timeout=10)
+        return ClusterReplayState()
+
+    monkeypatch.setattr(cache, "_replay", replay)
+
+    def get(event_index: int) -> ClusterReplayState:
+        with app.app_context():
+            return cache.get(14, event_index)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(get, 60)
+        assert replay_started.wait(timeout=10)
+        assert cache._lock.acquire(timeout=1)
+        cache._lock.release()
+        second = executor.submit(get, 60)
+        while cache.stats()["hits"] == 0:
+            time.sleep(0.01)
+        assert not second.done()
+        finish_replay.set()
+        assert first.result() is second.result()
+
+    assert replays == [60]
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -8,6 +8,7 @@ import pandas as pd
 import sqlalchemy
 
 import geo_activity_playground.features.strava.api_importer as strava_api
+import geo_activity_playground.webui.blueprints.settings_blueprint as settings_blueprint
 from geo_activity_playground.core.config import ConfigAccessor
 from geo_activity_playground.core.datamodel import (
     DB,
@@ -20,6 +21,7 @@ from geo_activity_playground.core.datamodel import (
     activity_tag_association_table,
 )
 from geo_activity_playground.features.activity_photos.model import Photo
+from geo_activity_playground.features.explorer.clustering import ClusterStateCache
 from geo_activity_playground.features.explorer.model import (
     ClusterHistoryCheckpoint,
     ClusterHistoryEvent,
@@ -205,6 +207,18 @@ def test_wipe_local_state_truncates_user_tables_and_files(client, app, tmp_path)
     assert (tmp_path / "Strava API" / "strava_tokens.json").exists()
 
 
+def test_maintenance_page_shows_cluster_state_cache_stats(client, monkeypatch):
+    cache = ClusterStateCache()
+    cache.hits = 12
+    cache.misses = 3
+    monkeypatch.setattr(settings_blueprint, "cluster_state_cache", cache)
+
+    response = client.get("/settings/maintenance")
+
+    assert response.status_code == 200
+    assert "0 states with 0.0 MB, 12 hits and 3 misses" in response.text
+
+
 def test_reset_heatmap_cache_clears_db_table(client, app):
     with app.app_context():
         cache = HeatmapTileCache(